@@ -0,0 +1,61 @@
+import os
+import json
+import hashlib
+import threading
+import pandas as pd
+
+from snapshot_catalog import CACHE_DIR
+
+
+AGGREGATE_CACHE_DIR = os.path.join(CACHE_DIR, 'aggregates')
+
+
+def cache_key(name, bucket, key, etag, params=None):
+    """
+    Hash de (nombre del agregado, bucket/key/ETag del snapshot, parametros).
+    Los snapshots historicos no cambian, asi que el agregado vale mientras
+    el ETag sea el mismo; si el archivo se vuelve a subir cambia la llave.
+    """
+    payload = json.dumps({
+        'name': name,
+        'bucket': bucket,
+        'key': key,
+        'etag': etag,
+        'params': params or {}
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _path(key):
+    return os.path.join(AGGREGATE_CACHE_DIR, f"{key}.parquet")
+
+
+def load(key):
+    """Regresa el agregado cacheado o None"""
+    path = _path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        return pd.read_parquet(path)
+    except Exception as e:
+        print(f"⚠️  Cache de agregados ilegible, se ignora: {str(e)}")
+        return None
+
+
+def save(key, df):
+    """Guarda el agregado como Parquet local"""
+    os.makedirs(AGGREGATE_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{_path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, _path(key))
+
+
+def clear():
+    """Elimina todos los agregados cacheados"""
+    if not os.path.isdir(AGGREGATE_CACHE_DIR):
+        return 0
+    removed = 0
+    for name in os.listdir(AGGREGATE_CACHE_DIR):
+        os.remove(os.path.join(AGGREGATE_CACHE_DIR, name))
+        removed += 1
+    return removed
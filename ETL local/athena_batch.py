@@ -0,0 +1,48 @@
+"""
+Consulta batch a Athena para varios clientes.
+
+Hace una sola consulta con la union de canales y store ids de los clientes
+seleccionados y la deja materializada en el cache local del dia. Despues,
+cada script de cliente (isdin_etl.py, naos_etl.py, ...) toma su parte en
+load_raw_data_from_athena sin volver a escanear la tabla, siempre que corra
+con el cache activado (ATHENA_CACHE_TTL > 0). La consulta batch siempre va
+a Athena. etl_runner.py --batch hace las dos cosas en una sola corrida.
+
+Uso:
+    python athena_batch.py
+    python athena_batch.py --clients isdin naos yza --date 2025-01-07
+    ATHENA_CACHE_TTL=43200 python isdin_etl.py
+"""
+import argparse
+from datetime import datetime
+
+import aws_session
+import clients_config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Consulta batch a Athena para varios clientes")
+    parser.add_argument(
+        '--clients',
+        nargs='+',
+        choices=sorted(clients_config.CLIENTS),
+        default=sorted(clients_config.CLIENTS),
+        help="Clientes a incluir (default: todos)"
+    )
+    parser.add_argument('--date', help="Fecha objetivo AAAA-MM-DD (default: hoy)")
+    args = parser.parse_args()
+
+    aws_session.load_env()
+    import functions_db
+
+    target_date = datetime.strptime(args.date, '%Y-%m-%d') if args.date else datetime.now()
+
+    clients = {name: clients_config.CLIENTS[name] for name in args.clients}
+    results = functions_db.load_raw_data_for_clients(clients, target_date, aws_session.get_session(), cache_ttl=0)
+
+    for name, df in results.items():
+        print(f"  - {name}: {len(df):,} filas")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+import os
+import re
+import json
+import time
+import hashlib
+import pandas as pd
+
+import aws_session
+from snapshot_catalog import CACHE_DIR
+
+
+def cache_ttl():
+    """
+    Vigencia de los resultados cacheados en segundos (ATHENA_CACHE_TTL del
+    .env o del entorno, leida en cada llamada). Default 0 (sin cache): una
+    segunda corrida del dia casi siempre es para tomar datos que llegaron
+    tarde a Athena, asi que reutilizar resultados se activa explicitamente.
+    """
+    aws_session.load_env()
+    return int(os.getenv('ATHENA_CACHE_TTL', 0))
+
+# Vigencia que usa etl_runner.py --batch para que los clientes tomen su parte
+# de la consulta batch recien hecha en la misma corrida
+BATCH_RUN_TTL = 12 * 3600
+
+ATHENA_CACHE_DIR = os.path.join(CACHE_DIR, 'athena')
+
+
+def normalize_sql(sql):
+    """Colapsa espacios para que el mismo query con otro formato tenga la misma llave"""
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+def cache_key(sql, channels, store_ids, str_date):
+    """Hash de (SQL normalizado, canales, store ids, fecha)"""
+    payload = json.dumps({
+        'sql': normalize_sql(sql),
+        'channels': sorted(channels),
+        'store_ids': sorted(store_ids),
+        'date': str_date
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _path(key):
+    return os.path.join(ATHENA_CACHE_DIR, f"{key}.parquet")
+
+
+def load(key, ttl=None):
+    """
+    Regresa el resultado cacheado si existe y no ha vencido, si no None
+    (ttl None: cache_ttl())
+    """
+    if ttl is None:
+        ttl = cache_ttl()
+    path = _path(key)
+    if ttl <= 0 or not os.path.exists(path):
+        return None
+    if time.time() - os.path.getmtime(path) > ttl:
+        return None
+    try:
+        return pd.read_parquet(path)
+    except Exception as e:
+        print(f"⚠️  Cache de Athena ilegible, se ignora: {str(e)}")
+        return None
+
+
+def save(key, df):
+    """Guarda el resultado del query como Parquet local"""
+    os.makedirs(ATHENA_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{_path(key)}.tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, _path(key))
+
+
+def clear(older_than=None):
+    """Elimina resultados cacheados (todos, o solo los mas viejos que older_than segundos)"""
+    if not os.path.isdir(ATHENA_CACHE_DIR):
+        return 0
+    removed = 0
+    for name in os.listdir(ATHENA_CACHE_DIR):
+        path = os.path.join(ATHENA_CACHE_DIR, name)
+        if older_than is None or time.time() - os.path.getmtime(path) > older_than:
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+def _batch_manifest_path(str_date):
+    return os.path.join(ATHENA_CACHE_DIR, f"batch_{str_date}.json")
+
+
+def save_batch(str_date, channels, store_ids, df):
+    """
+    Materializa el resultado de una consulta batch (union de varios
+    clientes) para que cada cliente tome su parte sin volver a Athena.
+    """
+    key = cache_key('batch', channels, store_ids, str_date)
+    save(key, df)
+    manifest_path = _batch_manifest_path(str_date)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'channels': list(channels), 'store_ids': list(store_ids), 'key': key}, f)
+    os.replace(tmp_path, manifest_path)
+    return key
+
+
+def find_batch(str_date, channels, store_ids, ttl=None):
+    """
+    Busca una consulta batch vigente del dia que cubra todos los canales y
+    store ids pedidos. Regresa el DataFrame completo del batch (con la
+    columna 'channel') o None.
+    """
+    manifest_path = _batch_manifest_path(str_date)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if not set(channels) <= set(manifest['channels']) or not set(store_ids) <= set(manifest['store_ids']):
+        return None
+    return load(manifest['key'], ttl=ttl)
@@ -0,0 +1,65 @@
+"""
+Sesiones de AWS compartidas por los ETL.
+
+Las credenciales se leen del .env / entorno y cada proceso crea una sola
+vez su boto3 Session (Athena) y su cliente de S3, hasta que se usan por
+primera vez: importar un ETL (o correrlo con --help) no carga boto3 ni
+crea clientes. Los objetos de boto3 no se comparten entre procesos: si el
+proceso cambia (runner con varios procesos) se crean de nuevo.
+"""
+import os
+import threading
+
+_CLIENTS = {}
+_LOCK = threading.Lock()
+_ENV_LOADED = False
+
+
+def load_env():
+    """
+    Carga el .env una sola vez por proceso. Los modulos que leen variables
+    de entorno al importarse (tolerancias, carpeta y tamaño del cache, etc.)
+    lo llaman al inicio, asi valen aunque se importen desde un notebook o
+    un benchmark.
+    """
+    global _ENV_LOADED
+    if _ENV_LOADED:
+        return
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    _ENV_LOADED = True
+
+
+def credentials():
+    """Region y llaves de AWS del entorno (mismas variables de siempre)"""
+    load_env()
+    return {
+        'region_name': os.getenv('AWS_DEFAULT_REGION'),
+        'aws_access_key_id': os.getenv('AWS_ACCESS_KEY_ID'),
+        'aws_secret_access_key': os.getenv('AWS_SECRET_ACCESS_KEY')
+    }
+
+
+def _get(kind, factory):
+    key = (kind, os.getpid())
+    with _LOCK:
+        if key not in _CLIENTS:
+            _CLIENTS[key] = factory()
+        return _CLIENTS[key]
+
+
+def get_session():
+    """boto3 Session del proceso (la que usa awswrangler para Athena)"""
+    def factory():
+        import boto3
+        return boto3.Session(**credentials())
+    return _get('session', factory)
+
+
+def get_s3_client():
+    """Cliente de S3 del proceso"""
+    def factory():
+        import boto3
+        return boto3.client('s3', **credentials())
+    return _get('s3', factory)
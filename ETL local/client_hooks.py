@@ -0,0 +1,44 @@
+"""
+Post-procesos propios de cada cliente. Se registran por nombre en HOOKS y
+se activan desde clients_config (llave 'hooks'); cada hook recibe el
+DataFrame ya limpio y la configuracion del cliente y regresa el DataFrame.
+"""
+
+# Bodesa: financiamiento en sales flag
+STR_LIVERPOOL_REGEX = r',(\d+)%\s+[a-zA-Z ]+(\d+)\s+MESES'
+STR_ELKETRA_REGEX = r'\$(\d+)\sweekly[_a-zA-Z, ]+(\d+)\s+semanas[a-z-A-Z ]+(\d+)% de enganche'
+STR_COPPEL_REGEX = r'\$(\d,*\d+)\s*en\s(\d+)\s*quincenas'
+
+
+def bodesa_financiamiento(df, config):
+    """Columnas de meses sin intereses (Liverpool), pagos semanales (Elektra) y quincenas (Coppel)"""
+    df[['percent', 'month']] = df['sales flag'].str.extract(STR_LIVERPOOL_REGEX)
+    df[['price', 'final price', 'percent', 'month']] = df[['price', 'final price', 'percent', 'month']].astype(float)
+    df['precio descuento'] = df['final price'] * (1 - df['percent'] / 100)
+    df['pago mensualidad'] = df['precio descuento'] / df['month']
+    df = df.drop(columns=['percent', 'month'])
+    df[['pago semanal', 'semanas', 'enganche']] = df['sales flag'].str.extract(STR_ELKETRA_REGEX)
+    df[['precio liquidar', 'quincenas']] = df['sales flag'].str.extract(STR_COPPEL_REGEX)
+    df['precio liquidar'] = df['precio liquidar'].str.replace(',', '')
+
+    df = df.fillna('')
+    return df.astype(str)
+
+
+def client_layout(df, config):
+    """
+    Convierte los datos de competidores al layout del archivo client
+    (column_mapping y order_columns del cliente); las columnas que no
+    vienen de Athena quedan vacias.
+    """
+    df_client = df.copy()
+    df_client.columns = df_client.columns.str.lower()
+    df_client = df_client.rename(columns=config['column_mapping'])
+    df_client = df_client.reindex(columns=config['order_columns'])
+    return df_client.fillna("")
+
+
+HOOKS = {
+    'bodesa_financiamiento': bodesa_financiamiento,
+    'client_layout': client_layout,
+}
@@ -0,0 +1,187 @@
+"""
+Registro de los clientes del ETL: canales y store ids que se consultan en
+Athena y como se procesa y guarda cada cliente. etl_runner.py corre
+cualquier cliente (o varios en paralelo) a partir de esta configuracion;
+el modo batch (una sola consulta para todos los clientes) tambien lee de
+aqui.
+
+Llaves de cada cliente:
+    channels, store_ids: Lo que se consulta en Athena
+    prefix: Prefijo en S3 donde se guarda (y se lee el historico)
+    file_name: Nombre del archivo, con {date} = AAAA-MM-DD
+    order_columns: Columnas (y orden) del archivo guardado
+    bucket: Bucket (default: variable de entorno BUCKET_NAME)
+    log_prefix: Prefijo del log de validacion (sin el no se valida)
+    store_canal_mapping: store id -> canal
+    canal_mapping: canal -> canal (los que no estan se quedan igual)
+    set_date: Poner la fecha de la corrida en la columna date
+    hooks: Post-procesos de client_hooks.HOOKS, en orden
+    last_price: Agregar last_price del archivo anterior
+    save: Guardar en S3 (default True)
+    notify: Nombre del ETL para la notificacion por correo
+    module: Modulo con main() propio (los clientes que no siguen el flujo
+        generico, como yza)
+"""
+
+# Columnas de los archivos de competidores
+COMPETITOR_COLUMNS = ['date', 'canal', 'category', 'subcategory', 'subcategory2', 'subcategory3', 'marca', 'modelo', 'sku', 'upc', 'item', 'item characteristics', 'url sku', 'image', 'price', 'sale price', 'shipment cost', 'sales flag', 'store id', 'store name', 'store address', 'stock', 'upc wm2', 'final price', 'upc wm', 'comp']
+
+CLIENTS = {
+    'isdin': {
+        'channels': ['amazon', 'farmaciasdelahorro', 'mercadolibre', 'farmaciasSanPablo', 'laComer', 'heb', 'costco', 'walmart', 'farmaciasYZA', 'farmaciasBenavides'],
+        'store_ids': ['9999_amazon_dermo_tiendas_oficiales', '9999_farmaciasdelahorro_derma', '9999_farmaciassanpablo_dermocosmeticos', '287_lacomer_dermatologicosespecializados', '2959_heb_centrodermo', '9999_costco_dermocosmeticos', '2345_walmart_dermocosmeticos', '9999_mercadolibre_dermo_tiendas_oficiales', '9999_farmaciasyza_dermocosmeticos', '9999_benavides_dermocosmeticos', '9999_farmaciasdelahorro_bexident', '9999_farmaciassanpablo_cuidadobucal', '287_lacomer_farmacuidadopersonal', '9999_costco_cuidadobucal', '9999_farmaciasyza_higienebucal', '9999_benavides_odontologiahigienebucal'],
+        'prefix': 'derivables/isdin/competitors',
+        'file_name': 'isdin_local_{date}.csv',
+        'order_columns': COMPETITOR_COLUMNS + ['last_price'],
+        'log_prefix': 'derivables/isdin/logs',
+        'canal_mapping': {
+            "Benavides - Online": "Benavides",
+            "Chedraui - Online": "Chedraui",
+            "Costco - Online": "Costco",
+            "Dermaexpress": "Dermaexpress",
+            "Farmacias del Ahorro": "Farmacias del Ahorro",
+            "Farmacias del Ahorro - Online": "Farmacias del Ahorro",
+            "Farmacias GDL - Online": "Farmacias GDL",
+            "Farmacias San Pablo": "Farmacias San Pablo",
+            "Farmacias San Pablo - Online": "Farmacias San Pablo",
+            "Farmacias Yza - Online": "Farmacias Yza",
+            "HEB": "HEB",
+            "HEB - GONZALITOS": "HEB",
+            "La Comer": "La Comer",
+            'La Comer  - Coyoacán': "La Comer",
+            "Liverpool": "Liverpool",
+            "Mercadolibre": "Mercadolibre",
+            "Prixz": "Prixz",
+            "Sanborns": "Sanborns",
+            "Sanborns - Online": "Sanborns",
+            "Soriana": "Soriana",
+            "Soriana - MIYANA": "Soriana",
+            "Walmart": "Walmart"
+        },
+        'last_price': True,
+    },
+    'naos': {
+        'channels': ['Dermaexpress', 'sanborns', 'heb', 'soriana', 'walmart', 'amazon', 'mercadolibre', 'farmaciasBenavides', 'farmaciasdelahorro', 'farmaciasSanPablo', 'prixz', 'laComer', 'liverpool'],
+        'store_ids': ['9999_dermaexpress', '9999_sanborns_dermatologicos', '2959_heb_centrodermo', '252_soriana_dermatologicos', '2345_walmart_dermocosmeticos', '9999_amazon_dermo_tiendas_oficiales_allsellers', '9999_mercadolibre_dermo_tiendas_oficiales_allsellers', '9999_benavides_dermocosmeticos', '9999_farmaciasdelahorro_derma', '9999_farmaciassanpablo_dermocosmeticos', '9999_prixz_derma', '287_lacomer_dermatologicosespecializados', '9999_liverpool_cuidadofacial'],
+        'prefix': 'derivables/naos/competitors',
+        'file_name': 'naos_test_{date}.csv',
+        'order_columns': COMPETITOR_COLUMNS + ['last_price'],
+        'log_prefix': 'derivables/naos/logs',
+        'store_canal_mapping': {
+            '9999_farmaciassanpablo_dermocosmeticos': 'Farmacias San Pablo',
+            '2959_heb_centrodermo': 'HEB',
+            '287_lacomer_dermatologicosespecializados': 'La Comer',
+            '9999_sanborns_dermatologicos': 'Sanborns',
+            '9999_liverpool_cuidadofacial': 'Liverpool',
+            '9999_farmaciasdelahorro_derma': 'Farmacias del Ahorro',
+            '9999_prixz_derma': 'Prixz',
+            '9999_benavides_dermocosmeticos': 'Benavides',
+            '252_soriana_dermatologicos': 'Soriana',
+            '9999_dermaexpress': 'Dermaexpress',
+            '9999_amazon_dermo_tiendas_oficiales_allsellers': 'Amazon',
+            '9999_mercadolibre_urls_dermocosmeticos': 'Mercadolibre',
+            '2345_walmart_dermocosmeticos': 'Walmart',
+        },
+        'last_price': True,
+    },
+    'bodesa': {
+        'channels': ['elektra', 'liverpool', 'coppel'],
+        'store_ids': ['9999_elektra_url_bodesa', '9999_liverpool_url_bodesa', '9999_coppel_url_bodesa'],
+        'prefix': 'derivables/bodesa/competitors',
+        'file_name': 'bodesa_local_{date}.csv',
+        'order_columns': COMPETITOR_COLUMNS + ['precio descuento', 'pago mensualidad', 'pago semanal', 'semanas', 'enganche', 'precio liquidar', 'quincenas'],
+        'log_prefix': 'derivables/bodesa/logs',
+        'hooks': ['bodesa_financiamiento'],
+        'notify': 'Bodesa Competitors',
+    },
+    'soriana': {
+        'channels': [
+            'farmaciasGDL',
+            'farmaciasBenavides',
+            'farmaciasYZA',
+            'farmaciasroma',
+            'farmaciasdelahorro',
+            'farmaciasSanPablo',
+            'farmaciasISEG',
+            'walmart',
+            'vinoteca',
+            'laeuropea',
+            'palacioDeHierro',
+            'liverpool',
+        ],
+        # Martes y jueves
+        'store_ids': [
+            '2034_walmart_frutasyverduras',
+            '2345_walmart_frutasyverduras',
+            '3878_walmart_frutasyverduras'
+        ],
+        # Jueves:
+        #   '44100_farmaciasgdl', '9999_benavides', '9999_benavides_promos', '9999_farmaciasyza',
+        #   '9999_farmaciasroma', '9999_farmaciasdelahorro', '9999_farmaciasdelahorro_promos',
+        #   '9999_farmaciasanpablo', '9999_farmaciasiseg'
+        # Jueves (primero del mes): los de jueves mas
+        #   '9999_vinoteca', '9999_laeuropea', '9999_palaciodehierro_vinosylicores', '9999_liverpoollicores',
+        #   '2034_walmart_frutasyverduras', '2345_walmart_frutasyverduras', '3878_walmart_frutasyverduras'
+        'prefix': 'derivables/soriana/competitors_online',
+        'file_name': 'soriana_local_{date}.csv',
+        'order_columns': COMPETITOR_COLUMNS + ['last_price'],
+        'last_price': True,
+        'set_date': True,
+    },
+    'soriana_client': {
+        'channels': ['soriana'],
+        'store_ids': ['252_soriana_farmacia', '252_soriana_vinosylicores'],
+        'prefix': 'derivables/soriana/client',
+        'file_name': 'client_{date}.csv',
+        'order_columns': ['departamento', '# departamento', 'categoria', '# categoria', 'subcategoria', '# subcategoría', 'sku', 'descripción sku', 'ean', 'marca', 'precio sin promocion sin iva', 'precio sin promocion con iva', 'precio sin iva', 'precio con iva', 'iva', 'operable', 'activo', 'status', 'direccion comercial', 'proveedor', 'comprador', 'inventario', 'margen', 'margen min', 'grupo', 'pmp con iva', '$ ventas ytd', 'ventas pzas ytd', '$ ventas mtd', 'ventas pzas mtd', 'mercado mtd pzas', 'mercado ytd pzas', 'mercado mtd $', 'mercado ytd $', 'ean wm'],
+        # Columna de competidores -> columna del archivo client
+        'column_mapping': {'category': 'departamento', 'subcategory': 'categoria', 'subcategory2': 'subcategoria', 'sku': 'sku', 'item': 'descripción sku', 'upc': 'ean', 'upc wm': 'ean wm', 'marca': 'marca', 'price': 'precio sin promocion con iva', 'final price': 'precio con iva', 'sales flag': 'status', 'date': 'proveedor'},
+        'set_date': True,
+        'hooks': ['client_layout'],
+    },
+    'farma_comercio': {
+        'channels': ['farmaciasGDL', 'farmaciasbazar', 'farmaValue', 'emeritafarmacias'],
+        'store_ids': ['0001_farmavalue', '9999_emeritafarmacias', '97000_farmaciasgdl', '9999_farmaciasbazar'],
+        'prefix': 'derivables/farma_comercio/competitors',
+        'file_name': 'farma_comercio_test_{date}.csv',
+        'order_columns': COMPETITOR_COLUMNS,
+        'log_prefix': 'derivables/farma_comercio/logs',
+        # Todavia en prueba: solo se valida
+        'save': False,
+    },
+    'yza': {
+        'channels': ['farmaciasBenavides', 'farmaciasSanPablo', 'farmaciasdelahorro', 'farmaciasGDL', 'walmart', 'soriana', 'farmaciasDesimilares'],
+        'store_ids': ["9999_benavides_promos", '9999_benavides', '9999_farmaciassanpablo', '9999_farmaciasdelahorro', '44100_farmaciasgdl', '9999_farmaciasdelahorro_promos', '2345_walmart_retail', '9999_farmaciassimilares'],
+        'bucket': 'data-bunker-prod-env',
+        'prefix': 'derivables/yza/competitors_hist/',
+        'file_name': 'yza_competitors_local_{date}.csv',
+        'order_columns': [
+            "Key", "date", "canal", "sku", "upc", "item", "image",
+            "price", "sale price", "sales flag", "upc llave", "final price",
+            "upc marca prop", "código interno 1", "category", "subcategory", "url sku", "upc_anterior", "store id", "last_price"
+        ],
+        'module': 'yza_etl',
+    },
+}
+
+
+def logs_prefix(name):
+    """Prefijo de los logs del cliente, donde va tambien la traza de la corrida"""
+    config = CLIENTS[name]
+    if config.get('log_prefix'):
+        return config['log_prefix']
+    return config['prefix'].rstrip('/').rsplit('/', 1)[0] + '/logs'
+
+
+def union_channels_and_store_ids(client_names):
+    """Canales y store ids de varios clientes, sin duplicados y en orden"""
+    channels = []
+    store_ids = []
+    for name in client_names:
+        for channel in CLIENTS[name]['channels']:
+            if channel not in channels:
+                channels.append(channel)
+        for store_id in CLIENTS[name]['store_ids']:
+            if store_id not in store_ids:
+                store_ids.append(store_id)
+    return channels, store_ids
@@ -0,0 +1,309 @@
+"""
+Runner de los ETL de clientes.
+
+Cada cliente se corre a partir de su configuracion en clients_config
+(run_client). Desde la linea de comandos se pueden correr varios clientes
+en paralelo, cada uno en su propio proceso, y al final se imprime una
+tabla con el tiempo de cada cliente: la corrida tarda lo que el cliente
+mas lento y no la suma de todos.
+
+Uso:
+    python etl_runner.py
+    python etl_runner.py --clients isdin naos soriana --workers 3
+    python etl_runner.py --clients isdin naos --batch --date 2025-01-07
+    python etl_runner.py --log-dir logs
+    python etl_runner.py --clients isdin --profile clean_competitor_data --profile-mode sample
+"""
+import argparse
+import importlib
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import aws_session
+import clients_config
+import client_hooks
+import profiling
+import tracing
+
+
+def apply_canal_mappings(df, config):
+    """store_canal_mapping (por store id) y canal_mapping (por canal) del cliente"""
+    for store_id, canal in config.get('store_canal_mapping', {}).items():
+        df.loc[df['store id'] == store_id, 'canal'] = canal
+    if config.get('canal_mapping'):
+        df['canal'] = df['canal'].map(config['canal_mapping']).fillna(df['canal'])
+    return df
+
+
+def _validation_status(validation_summary):
+    if validation_summary.get('total_records', 0) == 0:
+        return 'ERROR'
+    if validation_summary.get('missing_stores', 0) > 0:
+        return 'WARNING'
+    return 'SUCCESS'
+
+
+def _notify(config, validation_summary, log_s3_path, status, s3_client, bucket):
+    """Notificacion por correo (solo clientes con 'notify')"""
+    try:
+        from email_notifications import send_simple_notification
+
+        print("\nEnviando notificación por correo...")
+        email_sent = send_simple_notification(
+            etl_name=config['notify'],
+            validation_summary=validation_summary,
+            log_s3_path=log_s3_path,
+            status=status,
+            s3_client=s3_client,
+            bucket_name=bucket,
+            gmail_user=os.getenv('GMAIL_USER'),
+            gmail_password=os.getenv('GMAIL_PASSWORD'),
+            recipient_emails=os.getenv('ETL_RECIPIENT_EMAILS', '').split(',')
+        )
+
+        if email_sent:
+            print("✓ Notificación enviada exitosamente")
+        else:
+            print("⚠ No se pudo enviar la notificación")
+
+    except Exception as email_error:
+        print(f"⚠ Error al enviar notificación: {str(email_error)}")
+
+
+def run_client(name, target_date=None):
+    """
+    Corre el ETL de un cliente: Athena -> limpieza -> canales -> hooks ->
+    last_price -> validacion -> S3. La traza de la corrida (tracing) se
+    guarda junto a los logs del cliente.
+
+    Args:
+        name: Cliente de clients_config.CLIENTS
+        target_date: Fecha limite (datetime, None para hoy). Los clientes
+            con 'module' usan su propia fecha
+
+    Returns:
+        dict con status, filas y archivo guardado
+    """
+    config = clients_config.CLIENTS[name]
+
+    # El .env va antes que los modulos del ETL (leen variables al importarse);
+    # asi --help o un error de argumentos no cargan pandas/awswrangler
+    aws_session.load_env()
+
+    if config.get('module'):
+        # El modulo guarda su propia traza
+        module = importlib.import_module(config['module'])
+        df = module.main()
+        file_name = config['file_name'].format(date=datetime.now().strftime('%Y-%m-%d'))
+        return {'status': 'SUCCESS', 'rows': len(df) if df is not None else None, 'file': file_name}
+
+    if target_date is None:
+        target_date = datetime.now()
+    str_date = target_date.strftime('%Y-%m-%d')
+    bucket = config.get('bucket') or os.getenv('BUCKET_NAME')
+
+    # Traza de la corrida junto al reporte de validacion
+    tracing.start_trace(name, date=str_date, pid=os.getpid())
+    try:
+        with tracing.span(name):
+            return _run_steps(config, target_date, bucket)
+    finally:
+        tracing.print_summary()
+        tracing.save_trace(
+            aws_session.get_s3_client(), bucket,
+            tracing.trace_key(clients_config.logs_prefix(name), name, str_date)
+        )
+
+
+def _run_steps(config, target_date, bucket):
+    """Pasos del flujo generico de run_client"""
+    import functions_db
+
+    str_date = target_date.strftime('%Y-%m-%d')
+    session_athena = aws_session.get_session()
+    s3_client = aws_session.get_s3_client()
+    prefix = config['prefix']
+    file_name = config['file_name'].format(date=str_date)
+
+    status = 'SUCCESS'
+    validation_summary = None
+    log_s3_path = None
+    df = None
+
+    try:
+        df = functions_db.load_raw_data_from_athena(config['channels'], config['store_ids'], target_date, session_athena)
+        print(df.shape)
+
+        df = functions_db.clean_competitor_data(df)
+        print(df.shape)
+
+        with tracing.span('canales', rows_in=len(df)):
+            df = apply_canal_mappings(df, config)
+
+        if config.get('set_date'):
+            df['date'] = str_date
+
+        for hook in config.get('hooks', []):
+            with tracing.span(hook, rows_in=len(df)) as span:
+                df = client_hooks.HOOKS[hook](df, config)
+                span.set(rows_out=len(df))
+
+        if config.get('last_price'):
+            df = functions_db.get_last_price_from_s3(df, s3_client, bucket, prefix)
+            print(df.shape)
+
+        if config.get('log_prefix'):
+            df, validation_summary = functions_db.validate_and_log_data(
+                df=df,
+                store_ids_expected=config['store_ids'],
+                target_date=target_date,
+                s3_client=s3_client,
+                bucket_name=bucket,
+                log_prefix=config['log_prefix'],
+                data_prefix=prefix
+            )
+            log_s3_path = f"{config['log_prefix']}/validation_{str_date}.txt"
+            if config.get('notify'):
+                status = _validation_status(validation_summary)
+
+        if config.get('save', True):
+            functions_db.save_to_s3(df, bucket, prefix, file_name, s3_client, config['order_columns'])
+
+    except Exception as e:
+        if not config.get('notify'):
+            raise
+        # Con notificacion el error se reporta por correo en lugar de propagarse
+        status = 'ERROR'
+        print(f"Error en el proceso ETL: {str(e)}")
+        if validation_summary is None:
+            validation_summary = {
+                'error': str(e),
+                'status': 'FAILED',
+                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }
+
+    finally:
+        if config.get('notify'):
+            _notify(config, validation_summary, log_s3_path, status, s3_client, bucket)
+
+    print("Proceso terminado\n")
+    return {
+        'status': status,
+        'rows': len(df) if df is not None else None,
+        'file': file_name if config.get('save', True) else None
+    }
+
+
+def _run_worker(name, str_date, log_dir):
+    """Corre un cliente en el proceso del pool; nunca lanza excepciones"""
+    stdout, stderr = sys.stdout, sys.stderr
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+        log_path = os.path.join(log_dir, f"{name}_{str_date or datetime.now().strftime('%Y-%m-%d')}.log")
+        sys.stdout = sys.stderr = open(log_path, 'a', encoding='utf-8')
+
+    start = time.perf_counter()
+    try:
+        target_date = datetime.strptime(str_date, '%Y-%m-%d') if str_date else None
+        result = run_client(name, target_date)
+    except Exception as e:
+        traceback.print_exc()
+        result = {'status': 'ERROR', 'rows': None, 'file': None, 'error': str(e)}
+    finally:
+        if log_dir:
+            sys.stdout.close()
+            sys.stdout, sys.stderr = stdout, stderr
+
+    result.update({'client': name, 'seconds': time.perf_counter() - start})
+    return result
+
+
+def print_timing_table(results, wall_seconds):
+    """Tabla de tiempos por cliente"""
+    print("\nTiempos por cliente:")
+    print(f"  {'Cliente':<16} {'Estado':<8} {'Filas':>10} {'Segundos':>10}")
+    for result in sorted(results, key=lambda r: r['seconds'], reverse=True):
+        rows = f"{result['rows']:,}" if result.get('rows') is not None else '-'
+        print(f"  {result['client']:<16} {result['status']:<8} {rows:>10} {result['seconds']:>10.1f}")
+        if result.get('error'):
+            print(f"      {result['error'].strip().splitlines()[-1]}")
+    suma = sum(result['seconds'] for result in results)
+    print(f"  Total: {wall_seconds:.1f} s (suma de clientes {suma:.1f} s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Corre los ETL de clientes en paralelo")
+    parser.add_argument(
+        '--clients',
+        nargs='+',
+        choices=sorted(clients_config.CLIENTS),
+        default=sorted(clients_config.CLIENTS),
+        help="Clientes a correr (default: todos)"
+    )
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Procesos en paralelo (1 = en serie)")
+    parser.add_argument('--date', help="Fecha objetivo AAAA-MM-DD (default: hoy; yza usa siempre hoy)")
+    parser.add_argument(
+        '--batch',
+        action='store_true',
+        help="Hacer primero una sola consulta a Athena para todos los clientes (athena_batch.py)"
+    )
+    parser.add_argument('--log-dir', help="Carpeta para un log por cliente (default: todo a la consola)")
+    parser.add_argument(
+        '--profile',
+        nargs='*',
+        metavar='FUNCION',
+        help=f"Perfilar funciones (sin nombres: {', '.join(profiling.DEFAULT_FUNCTIONS)})"
+    )
+    parser.add_argument('--profile-mode', choices=profiling.MODES, help="cprofile (default) o sample")
+    parser.add_argument('--profile-dir', help="Carpeta de los perfiles (default: profiles)")
+    args = parser.parse_args()
+
+    # Antes de importar functions_db: el perfilado se decide al importar
+    if args.profile is not None:
+        profiling.configure(args.profile, args.profile_mode, args.profile_dir)
+
+    start = time.perf_counter()
+
+    if args.batch:
+        aws_session.load_env()
+        # Los clientes de esta corrida toman su parte del batch (el cache de
+        # Athena esta apagado por default); la consulta batch va a Athena
+        import athena_cache
+        os.environ.setdefault('ATHENA_CACHE_TTL', str(athena_cache.BATCH_RUN_TTL))
+        import functions_db
+
+        target_date = datetime.strptime(args.date, '%Y-%m-%d') if args.date else datetime.now()
+        clients = {name: clients_config.CLIENTS[name] for name in args.clients}
+        functions_db.load_raw_data_for_clients(clients, target_date, aws_session.get_session(), cache_ttl=0)
+
+    results = []
+    if args.workers <= 1:
+        for name in args.clients:
+            results.append(_run_worker(name, args.date, args.log_dir))
+    else:
+        # spawn: cada proceso arranca limpio y crea sus propios clientes de boto3
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(args.workers, len(args.clients)), mp_context=context) as pool:
+            futures = {pool.submit(_run_worker, name, args.date, args.log_dir): name for name in args.clients}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # El proceso del cliente murio (por ejemplo sin memoria)
+                    result = {'client': futures[future], 'status': 'ERROR', 'rows': None, 'seconds': time.perf_counter() - start, 'error': str(e)}
+                print(f"[{result['client']}] {result['status']} en {result['seconds']:.1f} s")
+                results.append(result)
+
+    print_timing_table(results, time.perf_counter() - start)
+
+    if any(result['status'] == 'ERROR' for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,25 +1,81 @@
-import awswrangler as wr
 from datetime import datetime, timedelta
 import os
 import re
+import numpy as np
 import pandas as pd
 from io import StringIO
 import tempfile
 import os
-from dotenv import load_dotenv
+import aws_session
 
-load_dotenv()
+# LAST_PRICE_TOLERANCE (y lo que leen los modulos de abajo) puede venir del .env
+aws_session.load_env()
 
+import snapshot_catalog
+import s3_csv
+import parquet_history
+import athena_cache
+import store_dates_index
+import upc_utils
+import key_encoding
+import profiling
+import tracing
 
+
+def _athena_settings(database, s3_output):
+    """Tabla y ubicacion de resultados de Athena del .env si no se pasan"""
+    aws_session.load_env()
+    if database is None:
+        database = os.getenv('DATA_BASE_NAME')
+    if s3_output is None:
+        s3_output = os.getenv('ATHENA_LOCATION')
+    return database, s3_output
+
+
+@tracing.traced()
 def load_raw_data_from_athena(
     channels,
     store_ids,
     target_date,
     session,
-    database=os.getenv('DATA_BASE_NAME'),
-    s3_output=os.getenv('ATHENA_LOCATION')
+    database=None,
+    s3_output=None,
+    cache_ttl=None,
+    athena_cache_settings=None,
+    keep_channel=False,
+    use_date_index=True,
+    chunksize=None
 ):
-  
+    """
+    Carga el último día disponible de cada store id desde Athena.
+
+    Si ya existe una consulta batch del día (load_raw_data_for_clients) que
+    cubre estos canales y store ids, se toma la parte correspondiente sin
+    volver a consultar Athena.
+
+    Args:
+        channels: Lista de canales
+        store_ids: Lista de store ids
+        target_date: Fecha límite (datetime, None para hoy)
+        session: boto3 Session
+        database: Tabla de Athena (default: variable DATA_BASE_NAME)
+        s3_output: Ubicacion de resultados de Athena (default: ATHENA_LOCATION)
+        cache_ttl: Segundos de vigencia del resultado cacheado en local
+            (0 para ir siempre a Athena; None: athena_cache.cache_ttl())
+        athena_cache_settings: Se pasa tal cual a wr.athena.read_sql_query
+            para reutilizar resultados de queries en Athena,
+            ej. {'max_cache_seconds': 3600}
+        keep_channel: Conservar la columna de partición 'channel'
+        use_date_index: Usar el índice local de última fecha por store id
+            para consultar solo ese día de cada store id (cruza meses). Con
+            False se usa el query original sobre el mes de target_date
+        chunksize: Si se indica, regresa un iterador de DataFrames de hasta
+            chunksize filas (awswrangler) en lugar del DataFrame completo.
+            En este modo no se usa el cache local ni la consulta batch
+    """
+
+    database, s3_output = _athena_settings(database, s3_output)
+
     # Definir fecha objetivo
     if target_date is None:
         target_date = datetime.now()
@@ -28,245 +84,470 @@ def load_raw_data_from_athena(
     max_date_limit = target_date.strftime('%Y-%m-%d')
     year = str(target_date.year)
     month = str(target_date.month).zfill(2)
+
+    drop_columns = ['year', 'month'] if keep_channel else ['year', 'month', 'channel']
+
+    if cache_ttl is None:
+        cache_ttl = athena_cache.cache_ttl()
+
+    # Tomar la parte de este cliente de una consulta batch del día
+    if cache_ttl and not chunksize:
+        df_batch = athena_cache.find_batch(max_date_limit, channels, store_ids, ttl=cache_ttl)
+        if df_batch is not None:
+            df = df_batch[
+                df_batch['store id'].isin(store_ids) &
+                df_batch['channel'].isin(channels)
+            ].reset_index(drop=True)
+            print(f"Resultado de Athena tomado de la consulta batch del día ({len(df)} filas)")
+            return df.drop(columns=drop_columns, errors='ignore')
     
-    # Construir query
-    sql_query = f"""
-        WITH max_dates AS (
-            SELECT 
-                "store id",
-                MAX(date) as max_date
-            FROM {database}
-            WHERE "store id" IN ('{"', '".join(store_ids)}')
-              AND channel IN ('{"', '".join(channels)}')
-              AND year = '{year}'
-              AND month = '{month}'
-              AND date <= '{max_date_limit}'
-            GROUP BY "store id"
+    # Última fecha de cada store id según el índice (solo consulta lo nuevo)
+    latest_dates = {}
+    if use_date_index:
+        latest_dates = store_dates_index.resolve_latest_dates(
+            channels, store_ids, target_date, session, database, s3_output
         )
-        SELECT r.*
-        FROM {database} r
-        INNER JOIN max_dates m 
-            ON r."store id" = m."store id" 
-            AND r.date = m.max_date
-        WHERE r."store id" IN ('{"', '".join(store_ids)}')
-          AND r.channel IN ('{"', '".join(channels)}')
-          AND r.year = '{year}'
-          AND r.month = '{month}'
-          AND r.date <= '{max_date_limit}'
-    """
+
+    # Construir query
+    if latest_dates:
+        sql_query = store_dates_index.build_pruned_query(channels, latest_dates, database)
+    else:
+        sql_query = f"""
+            WITH max_dates AS (
+                SELECT 
+                    "store id",
+                    MAX(date) as max_date
+                FROM {database}
+                WHERE "store id" IN ('{"', '".join(store_ids)}')
+                  AND channel IN ('{"', '".join(channels)}')
+                  AND year = '{year}'
+                  AND month = '{month}'
+                  AND date <= '{max_date_limit}'
+                GROUP BY "store id"
+            )
+            SELECT r.*
+            FROM {database} r
+            INNER JOIN max_dates m 
+                ON r."store id" = m."store id" 
+                AND r.date = m.max_date
+            WHERE r."store id" IN ('{"', '".join(store_ids)}')
+              AND r.channel IN ('{"', '".join(channels)}')
+              AND r.year = '{year}'
+              AND r.month = '{month}'
+              AND r.date <= '{max_date_limit}'
+        """
     
+    if chunksize:
+        return _iter_athena_chunks(
+            sql_query, database, session, s3_output, athena_cache_settings,
+            chunksize, drop_columns, use_date_index
+        )
+
+    # Buscar resultado cacheado de una corrida anterior
+    query_key = athena_cache.cache_key(sql_query, channels, store_ids, max_date_limit)
+    df = athena_cache.load(query_key, ttl=cache_ttl)
+    if df is not None:
+        print(f"Resultado de Athena tomado del cache local ({len(df)} filas)")
+        return df.drop(columns=drop_columns, errors='ignore')
+
+    import awswrangler as wr
+
     df = wr.athena.read_sql_query(
         sql=sql_query,
         database=database,
         boto3_session=session,
         s3_output=s3_output,
+        athena_cache_settings=athena_cache_settings,
     )
     
+    if cache_ttl:
+        athena_cache.save(query_key, df)
+
+    # Actualizar el índice de última fecha por store id con lo recién cargado
+    if use_date_index:
+        store_dates_index.record_dates(df)
+
     # Eliminar columnas de partición si existen
-    df = df.drop(columns=['year', 'month', 'channel'], errors='ignore')
+    df = df.drop(columns=drop_columns, errors='ignore')
     
     return df
 
-def clean_competitor_data(df):
+
+def _iter_athena_chunks(sql_query, database, session, s3_output, athena_cache_settings, chunksize, drop_columns, use_date_index):
+    """Bloques del resultado de Athena, sin columnas de partición"""
+    import awswrangler as wr
+
+    chunks = wr.athena.read_sql_query(
+        sql=sql_query,
+        database=database,
+        boto3_session=session,
+        s3_output=s3_output,
+        athena_cache_settings=athena_cache_settings,
+        chunksize=chunksize,
+    )
+    for df in chunks:
+        if use_date_index:
+            store_dates_index.record_dates(df)
+        yield df.drop(columns=drop_columns, errors='ignore')
+
+
+@tracing.traced()
+def load_raw_data_for_clients(
+    clients,
+    target_date,
+    session,
+    database=None,
+    s3_output=None,
+    cache_ttl=None,
+    athena_cache_settings=None
+):
     """
-    Limpia y transforma el DataFrame de competidores
-    NOTA: Todos los campos ya vienen como string desde Athena
+    Modo batch: una sola consulta a Athena con la unión de canales y store
+    ids de varios clientes. El resultado se materializa en el cache local
+    del día, así que las corridas de cada cliente (load_raw_data_from_athena)
+    toman su parte sin volver a escanear la tabla.
+
+    Args:
+        clients: dict nombre -> {'channels': [...], 'store_ids': [...]}
+        target_date: Fecha límite (datetime, None para hoy)
+        session: boto3 Session
+
+    Returns:
+        dict: nombre del cliente -> DataFrame con su parte
     """
-    def homogenize_date_format(strDate):
-        """
-        Funcion para establecer la fecha de un mismo formato "AAAA-MM-DD"
-        """
-        lstDate_Substrs = strDate.split('-')
-        if len(lstDate_Substrs[0]) == 2:
-            strDate = lstDate_Substrs[2] + '-' + lstDate_Substrs[1] + '-' + lstDate_Substrs[0]
-        return strDate
-    
-    df = df.drop(columns=['year', 'month', 'channel'], errors='ignore')
-    
-    # 1. Homogenizar fechas
-    df['date'] = df['date'].str.replace('/', '-')
-    df['date'] = df['date'].apply(homogenize_date_format)
-    print(df["canal"].value_counts())
-
-    # 2. Limpiar stock (eliminar .0 al final)
-    df['stock'] = df['stock'].str.replace(r'\.0+$', '', regex=True)
-    print(df["canal"].value_counts())
-
-    # 3. Validaciones de UPC
-    df = df[
-        df['upc'].notna() & 
-        (df['upc'] != "") & 
-        (df['upc'] != "0") & 
-        (df['upc'] != "nan")
-    ].reset_index(drop=True)
-    df["upc"] = df["upc"].str.lstrip('0')
-    print(df["canal"].value_counts())
-
-    # 4. Inicializar columnas (si existe upc wm)
-    df['upc wm2'] = df['upc wm']
-    print(df["canal"].value_counts())
-    
-    canales_a_conservar = ["9999_farmaciasdelahorro_promos", "9999_benavides_promos"]
+    if target_date is None:
+        target_date = datetime.now()
 
-    mask_canal_no_protegido = ~df["store id"].isin(canales_a_conservar)
+    channels = []
+    store_ids = []
+    for config in clients.values():
+        channels += [c for c in config['channels'] if c not in channels]
+        store_ids += [s for s in config['store_ids'] if s not in store_ids]
 
-    mask_precio_invalido = (
-        df['final price'].isna() |
-        (df['final price'] == '') |
-        (df['final price'] == '0') |
-        (df['final price'] == '0.0') |
-        (df['final price'] == 'nan')
+    df = load_raw_data_from_athena(
+        channels,
+        store_ids,
+        target_date,
+        session,
+        database=database,
+        s3_output=s3_output,
+        cache_ttl=cache_ttl,
+        athena_cache_settings=athena_cache_settings,
+        keep_channel=True
     )
+    print(f"Consulta batch: {len(clients)} clientes, {len(store_ids)} store ids, {len(df)} filas")
 
-    df = df[~(mask_canal_no_protegido & mask_precio_invalido)].reset_index(drop=True)
+    athena_cache.save_batch(target_date.strftime('%Y-%m-%d'), channels, store_ids, df)
 
-    print("se limpio el precio vacio ________________")
-    print(df["canal"].value_counts())
+    results = {}
+    for name, config in clients.items():
+        results[name] = df[
+            df['store id'].isin(config['store_ids']) &
+            df['channel'].isin(config['channels'])
+        ].drop(columns=['channel']).reset_index(drop=True)
+    return results
 
-    
-    df["comp"] = ""
-    
-    # 7. Limpiar precios (remover $, comas, corchetes, espacios)
-    price_cols = ['price', 'sale price', 'final price']
-    for col in price_cols:
-        if col in df.columns:
-            df[col] = df[col].str.replace(r'[\$,\[\] ]', '', regex=True)
-    print(df["canal"].value_counts())
+def _homogenize_dates(dates):
+    """
+    Fechas a un mismo formato "AAAA-MM-DD": '/' se cambia por '-' y las
+    fechas DD-MM-AAAA se invierten
+    """
+    dates = dates.str.replace('/', '-', regex=False)
+    return dates.str.replace(r'^([^-]{2})-([^-]*)-([^-]*)(?:-.*)?$', r'\3-\2-\1', regex=True)
+
+
+def _strip_price_symbols(values):
+    """Remueve $, comas, corchetes y espacios"""
+    return values.str.replace(r'[\$,\[\] ]', '', regex=True)
+
+
+# Store ids de promociones que se conservan aunque no tengan final price
+PROTECTED_STORE_IDS = ["9999_farmaciasdelahorro_promos", "9999_benavides_promos"]
+
+# Reglas de eliminación: cada una regresa la máscara de filas a eliminar.
+# Se evalúan sobre las columnas originales y se combinan en una sola máscara
+CLEANING_FILTERS = [
+    {
+        'name': 'upc_invalido',
+        'drop': lambda df: df['upc'].isna() | df['upc'].isin(["", "0", "nan"]),
+    },
+    {
+        'name': 'final_price_invalido',
+        'drop': lambda df: (
+            ~df['store id'].isin(PROTECTED_STORE_IDS) &
+            (df['final price'].isna() | df['final price'].isin(['', '0', '0.0', 'nan']))
+        ),
+    },
+    {
+        'name': 'sku_invalido',
+        'drop': lambda df: df['sku'].isna() | df['sku'].isin(['', 'nan']),
+    },
+]
+
+# Transformaciones por columna, en orden, sobre las filas que se conservan.
+# 'optional': la regla se omite si la columna de origen no existe
+CLEANING_TRANSFORMS = [
+    {'column': 'date', 'transform': lambda df: _homogenize_dates(df['date'])},
+    {'column': 'stock', 'transform': lambda df: df['stock'].str.replace(r'\.0+$', '', regex=True)},
+    # Solo ceros a la izquierda: la llave tiene que coincidir con la del
+    # historico (last_price), que se escribio sin quitar ".0" ni espacios
+    {'column': 'upc', 'transform': lambda df: upc_utils.strip_leading_zeros(df['upc'])},
+    {'column': 'upc wm2', 'transform': lambda df: df['upc wm']},
+    {'column': 'comp', 'transform': lambda df: ""},
+    {'column': 'price', 'transform': lambda df: _strip_price_symbols(df['price']), 'optional': True},
+    {'column': 'sale price', 'transform': lambda df: _strip_price_symbols(df['sale price']), 'optional': True},
+    {'column': 'final price', 'transform': lambda df: _strip_price_symbols(df['final price']), 'optional': True},
+]
+
+# Llaves de deduplicación (sobre los valores ya transformados)
+CLEANING_DEDUP_KEYS = ['date', 'store id', 'sku', 'upc']
+
+
+@tracing.traced()
+@profiling.profiled
+def clean_competitor_data(df, diagnostics=False):
     """
-    df = df[
-        df['price'].notna() &
-        ~df['price'].astype(str).str.contains('None', na=False) &
-        (df['price'] != '') &
-        (df['price'] != '0')
-    ].reset_index(drop=True)
-
-    print(df["canal"].value_counts())
+    Limpia y transforma el DataFrame de competidores
+    NOTA: Todos los campos ya vienen como string desde Athena
+
+    Las reglas de CLEANING_FILTERS se combinan en una sola máscara, después
+    se aplican las transformaciones de CLEANING_TRANSFORMS y al final se
+    deduplica por CLEANING_DEDUP_KEYS.
+
+    Args:
+        df: DataFrame crudo de Athena
+        diagnostics: Calcular e imprimir cuántas filas elimina cada regla
+            (en orden, como si se aplicaran una tras otra) y su distribución
+            por canal. Los conteos quedan en df.attrs['clean_diagnostics']
     """
+    df = df.drop(columns=['year', 'month', 'channel'], errors='ignore')
+    initial_rows = len(df)
+
+    # 1. Una sola máscara con todas las reglas de eliminación
+    keep = np.ones(initial_rows, dtype=bool)
+    drop_counts = {}
+    for rule in CLEANING_FILTERS:
+        drop = rule['drop'](df).to_numpy(dtype=bool)
+        if diagnostics:
+            dropped = keep & drop
+            drop_counts[rule['name']] = {
+                'filas': int(dropped.sum()),
+                'por_canal': df.loc[dropped, 'canal'].value_counts().to_dict() if 'canal' in df.columns else {}
+            }
+        keep &= ~drop
+
+    df = df.take(np.flatnonzero(keep))
+
+    # 2. Transformaciones vectorizadas sobre las filas conservadas
+    for rule in CLEANING_TRANSFORMS:
+        if rule.get('optional') and rule['column'] not in df.columns:
+            continue
+        df[rule['column']] = rule['transform'](df)
+
+    # 3. Deduplicar
+    rows_before_dedup = len(df)
+    df = df.drop_duplicates(subset=CLEANING_DEDUP_KEYS, ignore_index=True)
+
+    print(f"Limpieza: {initial_rows:,} -> {len(df):,} registros")
+
+    if diagnostics:
+        drop_counts['duplicados'] = {'filas': rows_before_dedup - len(df), 'por_canal': {}}
+        for name, counts in drop_counts.items():
+            print(f"   - {name}: {counts['filas']:,} eliminados")
+            for canal, count in counts['por_canal'].items():
+                print(f"      {canal}: {count:,}")
+        print(df["store id"].value_counts())
+        df.attrs['clean_diagnostics'] = drop_counts
 
-    # 9. Validaciones de SKU
-    df = df[
-        df['sku'].notna() &
-        (df['sku'] != '') &
-        (df['sku'] != 'nan')
-    ].reset_index(drop=True)
-    print(df["canal"].value_counts())
-
-    # 10. Deduplicar
-    df.drop_duplicates(subset=['date', 'store id', 'sku', 'upc'], inplace=True, ignore_index=True)
-    print(df["store id"].value_counts())
-        
     return df
 
-def get_last_price_from_s3(df, s3_client, bucket_name, prefix, merge_keys=None):
+# Diferencia máxima para considerar dos precios iguales ("85" vs "85.0")
+LAST_PRICE_TOLERANCE = float(os.getenv('LAST_PRICE_TOLERANCE', 0.005))
+
+
+def parse_prices(values):
+    """Precios como float64 (quita $, comas, corchetes y espacios); NaN si no es número"""
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype('float64')
+    return pd.to_numeric(_strip_price_symbols(values.astype('string')), errors='coerce').astype('float64')
+
+
+@tracing.traced()
+def load_last_price_history(s3_client, bucket_name, prefix, merge_keys=None, lookback=1):
     """
-    Obtiene el last_price del archivo más reciente en S3
-    SE MANEJA COMO STRING - sin conversiones de tipo
+    Carga los snapshots más recientes del prefijo para calcular last_price:
+    solo las llaves y el precio ('final price') como float64 para comparar
+    y como el texto entregado para regresarlo sin cambios. Usa el sidecar
+    Parquet si existe y si no el CSV.
 
     Args:
-        df: DataFrame actual
-        s3_client: Cliente boto3 S3
-        bucket_name: Nombre del bucket
-        prefix: Prefijo donde están los archivos históricos
-        merge_keys: Lista de columnas para hacer merge (default: ['store id', 'sku', 'upc'])
+        lookback: Cuántos snapshots (uno por fecha) revisar hacia atrás
+
+    Returns:
+        list: [(fecha, DataFrame llaves + 'last_price_num' + 'last_price_text'), ...]
+            del más reciente al más antiguo (vacía si no hay archivos)
     """
 
     # Llaves por defecto
     if merge_keys is None:
         merge_keys = ['store id', 'sku', 'upc']
 
-    # Obtener lista de archivos
-    response = s3_client.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
-    all_objects = response.get('Contents', [])
+    # Buscar los archivos más recientes en el catálogo del prefijo
+    catalog = snapshot_catalog.get_catalog(s3_client, bucket_name, prefix)
+    latest_file = catalog.latest()
 
-    if not all_objects:
-        df['last_price'] = ""
-        return df
+    if latest_file is None:
+        return []
 
-    regex = r"\d{4}-\d{2}-\d{2}"
+    # Uno por fecha (el primero en orden de key, como catalog.latest())
+    snapshots = [latest_file]
+    while len(snapshots) < lookback:
+        previous_file = catalog.latest_before(snapshots[-1].date)
+        if previous_file is None:
+            break
+        snapshots.append(previous_file)
 
-    # Extraer fecha del nombre del archivo
-    def extract_date_from_key(key):
-        match = re.search(regex, key)
-        if match:
-            return datetime.strptime(match.group(), "%Y-%m-%d")
-        return None
+    history = []
+    for snapshot in snapshots:
+        print(f"Usando archivo para last_price: {snapshot.key}")
 
-    # Crear lista con fechas y claves
-    files_with_dates = [(extract_date_from_key(obj['Key']), obj['Key']) for obj in all_objects]
-    files_with_dates = [f for f in files_with_dates if f[0] is not None]
+        df_snapshot = parquet_history.read_snapshot(
+            s3_client,
+            bucket_name,
+            snapshot.key,
+            columns=merge_keys + ['final price'],
+            text_prices=True
+        )
 
-    if not files_with_dates:
-        df['last_price'] = ""
-        return df
+        # Normalizar nombres de columnas
+        df_snapshot.columns = df_snapshot.columns.str.lower()
 
-    # Encontrar el archivo más reciente
-    latest_file = max(files_with_dates, key=lambda x: x[0])
-    latest_file_key = latest_file[1]
-    latest_date = latest_file[0].strftime('%Y-%m-%d')
+        # Deduplicar histórico usando las llaves especificadas
+        df_snapshot = df_snapshot.drop_duplicates(subset=merge_keys, keep='first')
 
-    print(f"Usando archivo para last_price: {latest_file_key}")
+        df_snapshot['last_price_num'] = parse_prices(df_snapshot['final price'])
+        df_snapshot['last_price_text'] = df_snapshot['final price']
+        history.append((snapshot.date, df_snapshot[merge_keys + ['last_price_num', 'last_price_text']]))
 
-    # Descargar archivo desde S3
-    obj_response = s3_client.get_object(Bucket=bucket_name, Key=latest_file_key)
-    file_content = obj_response['Body'].read().decode('utf-8')
+    return history
 
-    # Cargar como DataFrame - COMO STRING
-    df_last_price = pd.read_csv(
-        StringIO(file_content),
-        dtype=str,
-        low_memory=False
-    )
 
-    # Normalizar nombres de columnas
-    df_last_price.columns = df_last_price.columns.str.lower()
+@tracing.traced()
+@profiling.profiled
+def get_last_price_from_s3(
+    df,
+    s3_client,
+    bucket_name,
+    prefix,
+    merge_keys=None,
+    history=None,
+    lookback=1,
+    tolerance=LAST_PRICE_TOLERANCE,
+    target_date=None,
+    days_since_change=False,
+    key_encoder=None
+):
+    """
+    Obtiene el last_price de los archivos más recientes en S3.
 
-    # Eliminar columna 'last_price' si existe
-    df_last_price = df_last_price.drop(columns=['last_price'], errors='ignore')
+    last_price es el precio anterior, con el mismo texto del snapshot,
+    cuando difiere del final price actual por más de `tolerance`
+    (comparación numérica, "85" == "85.0"; los que no son número, como
+    "Agotado", se comparan como texto), y "" si no cambió o no hay
+    precio anterior. Con lookback > 1 se busca hacia
+    atrás el último precio distinto en los últimos `lookback` snapshots.
 
-    # Deduplicar histórico usando las llaves especificadas
-    df_last_price = df_last_price.drop_duplicates(
-        subset=merge_keys,
-        keep='first'
-    )
+    Args:
+        df: DataFrame actual
+        s3_client: Cliente boto3 S3
+        bucket_name: Nombre del bucket
+        prefix: Prefijo donde están los archivos históricos
+        merge_keys: Lista de columnas para hacer merge (default: ['store id', 'sku', 'upc'])
+        history: Resultado de load_last_price_history ya cargado (para
+            aplicarlo a varios bloques sin volver a leer los archivos)
+        lookback: Snapshots a revisar hacia atrás (1 = solo el más reciente)
+        tolerance: Diferencia máxima para considerar el precio sin cambio
+        target_date: Fecha de la corrida para days_since_change (default: hoy)
+        days_since_change: Agregar la columna 'days_since_change' con los
+            días desde que se observó el precio actual por primera vez
+            (vacía si no cambió dentro del lookback)
+        key_encoder: key_encoding.KeyEncoder de merge_keys; si se pasa, el
+            dedup y el cruce con los snapshots se hacen sobre ids enteros
+    """
 
-    # Renombrar 'final price' a 'last_price_full'
-    df_last_price.rename(columns={'final price': 'last_price_full'}, inplace=True)
+    # Llaves por defecto
+    if merge_keys is None:
+        merge_keys = ['store id', 'sku', 'upc']
 
-    # Preparar columnas para merge
-    merge_columns = merge_keys + ['last_price_full']
-    available_columns = [col for col in merge_columns if col in df_last_price.columns]
+    if history is None:
+        history = load_last_price_history(s3_client, bucket_name, prefix, merge_keys, lookback)
 
-    # Merge con datos actuales
-    df = pd.merge(
-        df,
-        df_last_price[available_columns],
-        on=merge_keys,
-        how='left'
-    )
+    if not history:
+        df['last_price'] = ""
+        if days_since_change:
+            df['days_since_change'] = pd.array([pd.NA] * len(df), dtype='Int64')
+        return df
 
-    # Deduplicar después del merge
-    df = df.drop_duplicates(
-        subset=merge_keys,
-        keep='first'
-    )
+    # Deduplicar usando las llaves
+    if key_encoder is not None:
+        key_ids = key_encoder.encode(df, merge_keys)
+        unique_rows = ~key_encoding.duplicated(key_ids)
+        df = df[unique_rows]
+        key_ids = key_ids[unique_rows]
+    else:
+        df = df.drop_duplicates(subset=merge_keys, keep='first')
 
-    # Rellenar NaN con string vacío
-    df['last_price_full'] = df['last_price_full'].fillna("")
+    current = parse_prices(df['final price']).to_numpy()
+    current_text = df['final price'].to_numpy(dtype=object)
+    keys = df[merge_keys]
+    run_date = (target_date or datetime.now()).date()
 
-    # Lógica de comparación
-    df['last_price'] = df.apply(
-        lambda row: "" if (row['last_price_full'] == "" or
-                            row['last_price_full'] == row['final price'])
-                    else row['last_price_full'],
-        axis=1
-    )
+    last_price = np.full(len(df), "", dtype=object)
+    change_seen = np.full(len(df), None, dtype=object)
+    resolved = np.zeros(len(df), dtype=bool)
+    # Fecha más antigua en que se ha visto el precio actual
+    seen_since = np.full(len(df), run_date, dtype=object)
+
+    # Del snapshot más reciente al más antiguo: el primero con precio distinto
+    for snapshot_date, df_snapshot in history:
+        if key_encoder is not None:
+            positions = key_encoding.first_match(
+                key_ids,
+                key_encoder.encode(df_snapshot, merge_keys),
+                np.arange(len(df_snapshot)),
+                fill_value=-1
+            ).astype('int64')
+            found = positions >= 0
+            previous = np.full(len(df), np.nan)
+            previous[found] = df_snapshot['last_price_num'].to_numpy()[positions[found]]
+            previous_text = np.full(len(df), None, dtype=object)
+            previous_text[found] = df_snapshot['last_price_text'].to_numpy(dtype=object)[positions[found]]
+        else:
+            matched = keys.merge(df_snapshot, on=merge_keys, how='left')
+            previous = matched['last_price_num'].to_numpy()
+            previous_text = matched['last_price_text'].to_numpy(dtype=object)
+        present = pd.notna(previous_text) & (previous_text != "")
+        with np.errstate(invalid='ignore'):
+            same = np.abs(previous - current) <= tolerance
+        # Precio anterior que no es número: sin cambio solo si el texto es igual
+        same |= present & np.isnan(previous) & (previous_text == current_text)
+        changed = ~resolved & present & ~same
+
+        last_price[changed] = previous_text[changed]
+        change_seen[changed] = seen_since[changed]
+        resolved |= changed
+        seen_since[~resolved & same] = snapshot_date.date() if isinstance(snapshot_date, datetime) else snapshot_date
 
-    # Eliminar columna temporal
-    df.drop(columns=['last_price_full'], inplace=True)
+    df['last_price'] = last_price
+
+    if days_since_change:
+        days = [pd.NA if seen is None else (run_date - seen).days for seen in change_seen]
+        df['days_since_change'] = pd.array(days, dtype='Int64')
 
     return df
 
-def save_to_s3(df, bucket, prefix, filename, s3_client ,column_order):
+@tracing.traced()
+def save_to_s3(df, bucket, prefix, filename, s3_client ,column_order, write_parquet=True, compress=None):
     """
     Guarda DataFrame en S3
     
@@ -276,6 +557,12 @@ def save_to_s3(df, bucket, prefix, filename, s3_client ,column_order):
         prefix: carpeta/prefijo en S3
         filename: nombre del archivo
         column_order: orden de columnas (opcional)
+        write_parquet: escribir también el sidecar Parquet tipado del
+            histórico (solo para prefijos derivables/<cliente>/competitors*)
+        compress: variantes comprimidas adicionales, ej. ['gzip', 'zstd']
+
+    Returns:
+        dict: bytes, tiempo y throughput por archivo subido
     """
 
     if column_order:
@@ -284,294 +571,432 @@ def save_to_s3(df, bucket, prefix, filename, s3_client ,column_order):
     # Construir la key completa
     key = f"{prefix}/{filename}" if prefix else filename
 
-    
-    # Escribir a archivo temporal en disco
-    with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.csv', newline='', encoding='utf-8') as tmp_file:
-        tmp_filename = tmp_file.name
-        df.to_csv(tmp_filename, index=False)
-    
-    # Subir a S3
-    s3_client.upload_file(tmp_filename, bucket, key)
-    
-    # Limpiar archivo temporal
-    os.remove(tmp_filename)
+    # Serializar por bloques directo a un multipart upload (sin archivo temporal)
+    upload_stats = s3_csv.write_csv_s3(df, s3_client, bucket, key, compress=compress)
+    for uploaded_key, stats in upload_stats.items():
+        print(
+            f"Subido s3://{bucket}/{uploaded_key}: {stats['bytes'] / 1024 ** 2:.2f} MB "
+            f"en {stats['seconds']:.2f} s ({stats['mb_per_s']} MB/s)"
+        )
 
-def validate_and_log_data(
-    df,
-    store_ids_expected,
-    target_date,
-    s3_client,
-    bucket_name,
-    log_prefix,
-    data_prefix
-):
+    # Sidecar Parquet particionado por cliente y fecha
+    history_target = parquet_history.history_target(prefix, filename)
+    if write_parquet and history_target:
+        try:
+            parquet_key = parquet_history.write_history(
+                df, s3_client, bucket, *history_target, source_etag=upload_stats[key]['etag']
+            )
+            print(f"Sidecar Parquet guardado en: s3://{bucket}/{parquet_key}")
+        except Exception as e:
+            print(f"⚠️  No se pudo guardar el sidecar Parquet: {str(e)}")
+
+    return upload_stats
+
+class _KeyTracker:
     """
-    Valida el DataFrame, elimina datos problemáticos, documenta todo y guarda log en S3.
-    
-    Args:
-        df: DataFrame a validar
-        store_ids_expected: Lista de store_ids que se esperan
-        target_date: Fecha objetivo (datetime)
-        s3_client: Cliente boto3 S3
-        bucket_name: Nombre del bucket
-        log_prefix: Prefijo para guardar el log (ej: 'derivables/isdin/logs')
-        data_prefix: Prefijo donde están los archivos de datos (para comparación histórica)
-    
-    Returns:
-        tuple: (df_cleaned, validation_summary dict)
+    Recuerda las llaves ya vistas entre bloques (hash de 64 bits de las
+    columnas llave) para deduplicar y contar duplicados sin tener el
+    DataFrame completo en memoria. Por cada llave guarda cuántas filas la
+    han tenido y la etiqueta (canal) de la primera.
     """
-    from io import StringIO
-    import re
-    
-    log_lines = []
-    validation_summary = {
-        'nivel': 'SUCCESS',  # SUCCESS, WARNING, ERROR
-        'errores_criticos': [],
-        'warnings': [],
-        'metricas': {}
-    }
-    
-    # Header del log
-    log_lines.append("="*80)
-    log_lines.append(f"REPORTE DE VALIDACIÓN - {target_date.strftime('%Y-%m-%d %H:%M:%S')}")
-    log_lines.append("="*80)
-    log_lines.append("")
-    
-    # Estadísticas iniciales
-    initial_shape = df.shape
-    log_lines.append(f"📊 DATOS INICIALES:")
-    log_lines.append(f"   Total de registros: {initial_shape[0]:,}")
-    log_lines.append(f"   Total de columnas: {initial_shape[1]}")
-    log_lines.append("")
-    
-    # ========== VALIDACIÓN 1: STORE IDs ==========
-    log_lines.append("-"*80)
-    log_lines.append("1️⃣  VALIDACIÓN DE STORE IDs")
-    log_lines.append("-"*80)
-    
-    df_store_ids = set(df['store id'].unique())
-    missing_ids = list(set(store_ids_expected) - df_store_ids)
-    extra_ids = list(df_store_ids - set(store_ids_expected))
-    
-    log_lines.append(f"   Store IDs esperados: {len(store_ids_expected)}")
-    log_lines.append(f"   Store IDs encontrados: {len(df_store_ids)}")
-    
-    if missing_ids:
-        validation_summary['nivel'] = 'WARNING'
-        validation_summary['warnings'].append(f"Faltan {len(missing_ids)} store IDs")
-        log_lines.append(f"   ⚠️  FALTAN {len(missing_ids)} STORE IDs:")
-        for store_id in missing_ids:
-            log_lines.append(f"      - {store_id}")
-    else:
-        log_lines.append(f"   ✅ Todos los store IDs esperados están presentes")
-    
-    if extra_ids:
-        log_lines.append(f"   ℹ️  Store IDs adicionales no esperados: {len(extra_ids)}")
-        for store_id in extra_ids:
-            log_lines.append(f"      - {store_id}")
-    
-    validation_summary['metricas']['store_ids_esperados'] = len(store_ids_expected)
-    validation_summary['metricas']['store_ids_encontrados'] = len(df_store_ids)
-    validation_summary['metricas']['store_ids_faltantes'] = len(missing_ids)
-    log_lines.append("")
-    
-    # ========== VALIDACIÓN 2: FINAL PRICE NULOS/VACÍOS ==========
-    log_lines.append("-"*80)
-    log_lines.append("2️⃣  VALIDACIÓN DE FINAL PRICE")
-    log_lines.append("-"*80)
-    
-    nulos_final_price = df[(df["final price"].isnull()) | (df["final price"] == "")]
-    count_nulos = len(nulos_final_price)
-    
-    log_lines.append(f"   Registros con final price nulo/vacío: {count_nulos:,}")
-    
-    if count_nulos > 0:
-        validation_summary['warnings'].append(f"Se eliminaron {count_nulos} registros con final price vacío")
-        log_lines.append(f"   ⚠️  Se encontraron y ELIMINARON {count_nulos} registros")
-        
-        # Mostrar distribución por canal
-        if 'canal' in nulos_final_price.columns:
-            dist_canal = nulos_final_price['canal'].value_counts()
-            log_lines.append(f"   Distribución por canal:")
-            for canal, count in dist_canal.items():
-                log_lines.append(f"      - {canal}: {count}")
-        
-        # ELIMINAR registros con final price nulo/vacío
-        df = df.dropna(subset=["final price"])
-        df = df[df["final price"] != ""]
-    else:
-        log_lines.append(f"   ✅ No hay registros con final price nulo/vacío")
-    
-    validation_summary['metricas']['registros_eliminados_final_price'] = count_nulos
-    log_lines.append("")
-    
-    # ========== VALIDACIÓN 3: LAST PRICE ==========
-    log_lines.append("-"*80)
-    log_lines.append("3️⃣  VALIDACIÓN DE LAST PRICE")
-    log_lines.append("-"*80)
-    
-    if 'last_price' in df.columns:
-        # Registros donde se aplicó last_price (diferente de final price y no nulo)
-        last_price_aplicado = df[(df["last_price"] != df["final price"]) & (df["last_price"].notna()) & (df["last_price"] != "")]
-        count_last_price = len(last_price_aplicado)
-        
-        log_lines.append(f"   Registros con last_price aplicado: {count_last_price:,}")
-        
-        if count_last_price > 0:
-            log_lines.append(f"   ✅ Se aplicó last_price a {count_last_price} registros")
-            
-            # Distribución por canal
-            if 'canal' in last_price_aplicado.columns:
-                dist_last_price = last_price_aplicado['canal'].value_counts()
+
+    def __init__(self):
+        self.keys = np.empty(0, dtype=np.uint64)
+        self.counts = np.empty(0, dtype=np.int64)
+        self.first_labels = np.empty(0, dtype=np.int64)
+        self.label_names = []
+        self.label_codes = {}
+
+    def _encode_labels(self, labels):
+        codes = np.empty(len(labels), dtype=np.int64)
+        for pos, label in enumerate(labels):
+            if pd.isna(label):
+                codes[pos] = -1
+                continue
+            code = self.label_codes.get(label)
+            if code is None:
+                code = len(self.label_names)
+                self.label_codes[label] = code
+                self.label_names.append(label)
+            codes[pos] = code
+        return codes
+
+    def _label(self, code):
+        return self.label_names[code] if code >= 0 else None
+
+    def add(self, df, subset, label_column=None):
+        """
+        Registra las filas de un bloque.
+
+        Args:
+            df: Bloque de datos
+            subset: Columnas llave
+            label_column: Columna para distribuir el conteo de duplicados
+
+        Returns:
+            tuple: (máscara de filas repetidas, equivalente a
+                duplicated(keep='first') sobre todos los bloques,
+                dict etiqueta -> filas que quedan en un grupo duplicado,
+                equivalente a duplicated(keep=False); None agrupa las
+                filas sin etiqueta)
+        """
+        if len(df) == 0:
+            return np.zeros(0, dtype=bool), {}
+
+        hashes = pd.util.hash_pandas_object(df[subset], index=False).to_numpy()
+        if label_column is not None and label_column in df.columns:
+            labels = self._encode_labels(df[label_column].tolist())
+        else:
+            labels = np.full(len(df), -1, dtype=np.int64)
+
+        uniques, first_pos, inverse, chunk_counts = np.unique(
+            hashes, return_index=True, return_inverse=True, return_counts=True
+        )
+        inverse = inverse.reshape(-1)
+
+        # Llaves que ya se habían visto en bloques anteriores
+        insert_pos = np.searchsorted(self.keys, uniques)
+        if len(self.keys):
+            pos = np.minimum(insert_pos, len(self.keys) - 1)
+            seen = self.keys[pos] == uniques
+            prev_counts = np.where(seen, self.counts[pos], 0)
+        else:
+            pos = insert_pos
+            seen = np.zeros(len(uniques), dtype=bool)
+            prev_counts = np.zeros(len(uniques), dtype=np.int64)
+
+        # Repetida: la llave ya existía o no es su primera aparición en el bloque
+        repeated = seen[inverse] | (np.arange(len(df)) != first_pos[inverse])
+
+        # Filas que quedan en un grupo duplicado: las del bloque, más la
+        # primera fila de bloques anteriores si el grupo pasa de 1 a 2+
+        in_dup_group = ((prev_counts + chunk_counts) >= 2)[inverse]
+        dup_counts = {}
+        codes, counts = np.unique(labels[in_dup_group], return_counts=True)
+        for code, count in zip(codes, counts):
+            dup_counts[self._label(code)] = int(count)
+        for code in self.first_labels[pos[seen & (prev_counts == 1)]]:
+            label = self._label(code)
+            dup_counts[label] = dup_counts.get(label, 0) + 1
+
+        # Actualizar llaves conocidas (se mantienen ordenadas)
+        self.counts[pos[seen]] += chunk_counts[seen]
+        new = ~seen
+        if new.any():
+            self.keys = np.insert(self.keys, insert_pos[new], uniques[new])
+            self.counts = np.insert(self.counts, insert_pos[new], chunk_counts[new])
+            self.first_labels = np.insert(self.first_labels, insert_pos[new], labels[first_pos[new]])
+
+        return repeated, dup_counts
+
+
+def _add_counts(totals, counts):
+    for label, count in counts.items():
+        totals[label] = totals.get(label, 0) + int(count)
+
+
+def _sorted_counts(counts):
+    """Conteos ordenados de mayor a menor, como value_counts()"""
+    return pd.Series(counts, dtype='int64').sort_values(ascending=False)
+
+
+class _ValidationAccumulator:
+    """
+    Métricas de validate_and_log_data calculadas por bloques. process()
+    aplica las mismas eliminaciones que la validación completa a cada
+    bloque y finish() arma el log y el resumen con los totales.
+    """
+
+    def __init__(self, store_ids_expected, target_date):
+        self.store_ids_expected = store_ids_expected
+        self.target_date = target_date
+        self.initial_rows = 0
+        self.initial_columns = None
+        self.store_ids_found = set()
+        self.has_canal = False
+        self.null_price_by_canal = {}
+        self.null_price_count = 0
+        self.has_last_price = None
+        self.last_price_by_canal = {}
+        self.last_price_count = 0
+        self.duplicates = _KeyTracker()
+        self.duplicates_by_canal = {}
+        self.duplicates_count = 0
+        self.store_date_counts = {}
+        self.date_counts = {}
+        self.store_counts = {}
+        self.final_rows = 0
+
+    def process(self, df):
+        """
+        Valida un bloque y regresa el bloque limpio (sin final price
+        vacío, sin duplicados y con la fecha objetivo en 'date').
+        """
+        self.initial_rows += len(df)
+        if self.initial_columns is None:
+            self.initial_columns = df.shape[1]
+            self.has_canal = 'canal' in df.columns
+        self.store_ids_found.update(df['store id'].unique())
+
+        # 2. Final price nulo/vacío
+        mask_nulos = (df["final price"].isnull()) | (df["final price"] == "")
+        count_nulos = int(mask_nulos.sum())
+        if count_nulos > 0:
+            self.null_price_count += count_nulos
+            if self.has_canal:
+                _add_counts(self.null_price_by_canal, df.loc[mask_nulos, 'canal'].value_counts(sort=False))
+            df = df.dropna(subset=["final price"])
+            df = df[df["final price"] != ""]
+
+        # 3. Last price aplicado
+        if self.has_last_price is None:
+            self.has_last_price = 'last_price' in df.columns
+        if self.has_last_price:
+            mask_last_price = (df["last_price"] != df["final price"]) & (df["last_price"].notna()) & (df["last_price"] != "")
+            self.last_price_count += int(mask_last_price.sum())
+            if self.has_canal:
+                _add_counts(self.last_price_by_canal, df.loc[mask_last_price, 'canal'].value_counts(sort=False))
+
+        # 4. Duplicados (contra este bloque y los anteriores)
+        repeated, dup_counts = self.duplicates.add(
+            df, ['sku', 'upc', "store id", "final price"], label_column='canal'
+        )
+        count_duplicados = sum(dup_counts.values())
+        if count_duplicados > 0:
+            self.duplicates_count += count_duplicados
+            _add_counts(self.duplicates_by_canal, dup_counts)
+        if repeated.any():
+            df = df[~repeated]
+
+        # 5. Distribución store id / fecha (antes de igualar la fecha)
+        _add_counts(self.store_date_counts, df[["store id", "date"]].value_counts())
+
+        # Igualamos la fecha target a la fecha de todas las filas
+        df['date'] = self.target_date.strftime('%Y-%m-%d')
+
+        _add_counts(self.date_counts, df['date'].value_counts(sort=False))
+        _add_counts(self.store_counts, df.groupby("store id").size())
+        self.final_rows += len(df)
+        return df
+
+    def finish(self, s3_client, bucket_name, log_prefix, data_prefix):
+        """
+        Arma el reporte con los totales, lo guarda en S3 y regresa el
+        validation_summary.
+        """
+        target_date = self.target_date
+        store_ids_expected = self.store_ids_expected
+
+        log_lines = []
+        validation_summary = {
+            'nivel': 'SUCCESS',  # SUCCESS, WARNING, ERROR
+            'errores_criticos': [],
+            'warnings': [],
+            'metricas': {}
+        }
+
+        # Header del log
+        log_lines.append("="*80)
+        log_lines.append(f"REPORTE DE VALIDACIÓN - {target_date.strftime('%Y-%m-%d %H:%M:%S')}")
+        log_lines.append("="*80)
+        log_lines.append("")
+
+        # Estadísticas iniciales
+        initial_shape = (self.initial_rows, self.initial_columns or 0)
+        log_lines.append(f"📊 DATOS INICIALES:")
+        log_lines.append(f"   Total de registros: {initial_shape[0]:,}")
+        log_lines.append(f"   Total de columnas: {initial_shape[1]}")
+        log_lines.append("")
+
+        # ========== VALIDACIÓN 1: STORE IDs ==========
+        log_lines.append("-"*80)
+        log_lines.append("1️⃣  VALIDACIÓN DE STORE IDs")
+        log_lines.append("-"*80)
+
+        df_store_ids = self.store_ids_found
+        missing_ids = list(set(store_ids_expected) - df_store_ids)
+        extra_ids = list(df_store_ids - set(store_ids_expected))
+
+        log_lines.append(f"   Store IDs esperados: {len(store_ids_expected)}")
+        log_lines.append(f"   Store IDs encontrados: {len(df_store_ids)}")
+
+        if missing_ids:
+            validation_summary['nivel'] = 'WARNING'
+            validation_summary['warnings'].append(f"Faltan {len(missing_ids)} store IDs")
+            log_lines.append(f"   ⚠️  FALTAN {len(missing_ids)} STORE IDs:")
+            for store_id in missing_ids:
+                log_lines.append(f"      - {store_id}")
+        else:
+            log_lines.append(f"   ✅ Todos los store IDs esperados están presentes")
+
+        if extra_ids:
+            log_lines.append(f"   ℹ️  Store IDs adicionales no esperados: {len(extra_ids)}")
+            for store_id in extra_ids:
+                log_lines.append(f"      - {store_id}")
+
+        validation_summary['metricas']['store_ids_esperados'] = len(store_ids_expected)
+        validation_summary['metricas']['store_ids_encontrados'] = len(df_store_ids)
+        validation_summary['metricas']['store_ids_faltantes'] = len(missing_ids)
+        log_lines.append("")
+
+        # ========== VALIDACIÓN 2: FINAL PRICE NULOS/VACÍOS ==========
+        log_lines.append("-"*80)
+        log_lines.append("2️⃣  VALIDACIÓN DE FINAL PRICE")
+        log_lines.append("-"*80)
+
+        count_nulos = self.null_price_count
+
+        log_lines.append(f"   Registros con final price nulo/vacío: {count_nulos:,}")
+
+        if count_nulos > 0:
+            validation_summary['warnings'].append(f"Se eliminaron {count_nulos} registros con final price vacío")
+            log_lines.append(f"   ⚠️  Se encontraron y ELIMINARON {count_nulos} registros")
+
+            # Mostrar distribución por canal
+            if self.has_canal:
                 log_lines.append(f"   Distribución por canal:")
-                for canal, count in dist_last_price.items():
+                for canal, count in _sorted_counts(self.null_price_by_canal).items():
                     log_lines.append(f"      - {canal}: {count}")
         else:
-            log_lines.append(f"   ℹ️  No hay cambios de precio (last_price = final price en todos)")
-        
-        validation_summary['metricas']['registros_con_last_price'] = count_last_price
-    else:
-        log_lines.append(f"   ⚠️  Columna 'last_price' no encontrada")
-        validation_summary['warnings'].append("Columna last_price no encontrada")
-    
-    log_lines.append("")
-    
-    # ========== VALIDACIÓN 4: DUPLICADOS ==========
-    log_lines.append("-"*80)
-    log_lines.append("4️⃣  VALIDACIÓN DE DUPLICADOS")
-    log_lines.append("-"*80)
-    
-    duplicados = df[df.duplicated(subset=['sku', 'upc', "store id", "final price"], keep=False)]
-    count_duplicados = len(duplicados)
-    
-    log_lines.append(f"   Registros duplicados encontrados: {count_duplicados:,}")
-    
-    if count_duplicados > 0:
-        validation_summary['warnings'].append(f"Se eliminaron {count_duplicados} duplicados")
-        log_lines.append(f"   ⚠️  Se encontraron y ELIMINARON {count_duplicados} duplicados")
-        
-        # Mostrar distribución por canal
-        if 'canal' in duplicados.columns:
-            dist_canal_dup = duplicados['canal'].value_counts()
-            log_lines.append(f"   Distribución de duplicados por canal:")
-            for canal, count in dist_canal_dup.items():
-                log_lines.append(f"      - {canal}: {count}")
-        
-        # ELIMINAR duplicados
-        df = df.drop_duplicates(subset=['sku', 'upc', "store id", "final price"], keep='first')
-    else:
-        log_lines.append(f"   ✅ No hay registros duplicados")
-    
-    validation_summary['metricas']['registros_eliminados_duplicados'] = count_duplicados
-    log_lines.append("")
+            log_lines.append(f"   ✅ No hay registros con final price nulo/vacío")
 
-    # ========== VALIDACIÓN 5: DISTRIBUCIÓN STORE ID / FECHA ==========
-    log_lines.append("-"*80)
-    log_lines.append("5️⃣  DISTRIBUCIÓN STORE ID / FECHA")
-    log_lines.append("-"*80)
-    
-    conteo_fechas_store = df[["store id", "date"]].value_counts().sort_index()
+        validation_summary['metricas']['registros_eliminados_final_price'] = count_nulos
+        log_lines.append("")
 
-    log_lines.append("   Distribución store id / fecha:")
-    for (store, fecha), count in conteo_fechas_store.items():
-        log_lines.append(f"      - Store {store} | Fecha {fecha}: {count} registros")
-    
-    log_lines.append("")
+        # ========== VALIDACIÓN 3: LAST PRICE ==========
+        log_lines.append("-"*80)
+        log_lines.append("3️⃣  VALIDACIÓN DE LAST PRICE")
+        log_lines.append("-"*80)
 
-    # Igualamos la fecha target a la fecha de todas las filas
-    strToday = target_date.strftime('%Y-%m-%d')
-    df['date'] = strToday
-    
-    # ========== VALIDACIÓN 6: FECHAS (DESPUÉS DE IGUALAR) ==========
-    log_lines.append("-"*80)
-    log_lines.append("6️⃣  VALIDACIÓN DE FECHAS")
-    log_lines.append("-"*80)
-    
-    fecha_hoy = target_date.strftime("%Y-%m-%d")
-    conteo_fechas = df['date'].value_counts()
-    
-    log_lines.append(f"   Fecha objetivo: {fecha_hoy}")
-    log_lines.append(f"   Fechas únicas en el archivo: {len(conteo_fechas)}")
-    log_lines.append("")
-    log_lines.append("   Distribución de fechas:")
-    for fecha, count in conteo_fechas.items():
-        es_hoy = "✅" if str(fecha) == fecha_hoy else "  "
-        log_lines.append(f"      {es_hoy} {fecha}: {count:,} registros")
-    
-    if fecha_hoy in conteo_fechas.index.astype(str):
-        log_lines.append(f"   ✅ El archivo contiene la fecha objetivo")
-        validation_summary['metricas']['tiene_fecha_objetivo'] = True
-    else:
-        validation_summary['warnings'].append("No contiene fecha objetivo")
-        log_lines.append(f"   ⚠️  El archivo NO contiene la fecha objetivo")
-        validation_summary['metricas']['tiene_fecha_objetivo'] = False
-    
-    log_lines.append("")
-    
-    # ========== VALIDACIÓN 7: COMPARACIÓN CON ARCHIVO ANTERIOR ==========
-    log_lines.append("-"*80)
-    log_lines.append("7️⃣  COMPARACIÓN CON ARCHIVO ANTERIOR")
-    log_lines.append("-"*80)
-    
-    try:
-        # Buscar archivo anterior en S3
-        response = s3_client.list_objects_v2(Bucket=bucket_name, Prefix=data_prefix)
-        all_objects = response.get('Contents', [])
-        
-        if not all_objects:
-            log_lines.append(f"   ℹ️  No se encontró archivo anterior para comparar")
-            validation_summary['metricas']['comparacion_anterior'] = 'no_disponible'
+        if self.has_last_price:
+            count_last_price = self.last_price_count
+
+            log_lines.append(f"   Registros con last_price aplicado: {count_last_price:,}")
+
+            if count_last_price > 0:
+                log_lines.append(f"   ✅ Se aplicó last_price a {count_last_price} registros")
+
+                # Distribución por canal
+                if self.has_canal:
+                    log_lines.append(f"   Distribución por canal:")
+                    for canal, count in _sorted_counts(self.last_price_by_canal).items():
+                        log_lines.append(f"      - {canal}: {count}")
+            else:
+                log_lines.append(f"   ℹ️  No hay cambios de precio (last_price = final price en todos)")
+
+            validation_summary['metricas']['registros_con_last_price'] = count_last_price
+        else:
+            log_lines.append(f"   ⚠️  Columna 'last_price' no encontrada")
+            validation_summary['warnings'].append("Columna last_price no encontrada")
+
+        log_lines.append("")
+
+        # ========== VALIDACIÓN 4: DUPLICADOS ==========
+        log_lines.append("-"*80)
+        log_lines.append("4️⃣  VALIDACIÓN DE DUPLICADOS")
+        log_lines.append("-"*80)
+
+        count_duplicados = self.duplicates_count
+
+        log_lines.append(f"   Registros duplicados encontrados: {count_duplicados:,}")
+
+        if count_duplicados > 0:
+            validation_summary['warnings'].append(f"Se eliminaron {count_duplicados} duplicados")
+            log_lines.append(f"   ⚠️  Se encontraron y ELIMINARON {count_duplicados} duplicados")
+
+            # Mostrar distribución por canal
+            dist_canal_dup = {canal: count for canal, count in self.duplicates_by_canal.items() if canal is not None}
+            if self.has_canal:
+                log_lines.append(f"   Distribución de duplicados por canal:")
+                for canal, count in _sorted_counts(dist_canal_dup).items():
+                    log_lines.append(f"      - {canal}: {count}")
+        else:
+            log_lines.append(f"   ✅ No hay registros duplicados")
+
+        validation_summary['metricas']['registros_eliminados_duplicados'] = count_duplicados
+        log_lines.append("")
+
+        # ========== VALIDACIÓN 5: DISTRIBUCIÓN STORE ID / FECHA ==========
+        log_lines.append("-"*80)
+        log_lines.append("5️⃣  DISTRIBUCIÓN STORE ID / FECHA")
+        log_lines.append("-"*80)
+
+        log_lines.append("   Distribución store id / fecha:")
+        for (store, fecha), count in sorted(self.store_date_counts.items()):
+            log_lines.append(f"      - Store {store} | Fecha {fecha}: {count} registros")
+
+        log_lines.append("")
+
+        # ========== VALIDACIÓN 6: FECHAS (DESPUÉS DE IGUALAR) ==========
+        log_lines.append("-"*80)
+        log_lines.append("6️⃣  VALIDACIÓN DE FECHAS")
+        log_lines.append("-"*80)
+
+        fecha_hoy = target_date.strftime("%Y-%m-%d")
+        conteo_fechas = _sorted_counts(self.date_counts)
+
+        log_lines.append(f"   Fecha objetivo: {fecha_hoy}")
+        log_lines.append(f"   Fechas únicas en el archivo: {len(conteo_fechas)}")
+        log_lines.append("")
+        log_lines.append("   Distribución de fechas:")
+        for fecha, count in conteo_fechas.items():
+            es_hoy = "✅" if str(fecha) == fecha_hoy else "  "
+            log_lines.append(f"      {es_hoy} {fecha}: {count:,} registros")
+
+        if fecha_hoy in conteo_fechas.index.astype(str):
+            log_lines.append(f"   ✅ El archivo contiene la fecha objetivo")
+            validation_summary['metricas']['tiene_fecha_objetivo'] = True
         else:
-            regex = r"\d{4}-\d{2}-\d{2}"
-            
-            def extract_date_from_key(key):
-                match = re.search(regex, key)
-                if match:
-                    return datetime.strptime(match.group(), "%Y-%m-%d")
-                return None
-            
-            # Filtrar archivos anteriores a la fecha objetivo
-            files_with_dates = [(extract_date_from_key(obj['Key']), obj['Key']) for obj in all_objects]
-            files_with_dates = [f for f in files_with_dates if f[0] is not None and f[0] < target_date]
-            
-            if not files_with_dates:
+            validation_summary['warnings'].append("No contiene fecha objetivo")
+            log_lines.append(f"   ⚠️  El archivo NO contiene la fecha objetivo")
+            validation_summary['metricas']['tiene_fecha_objetivo'] = False
+
+        log_lines.append("")
+
+        # ========== VALIDACIÓN 7: COMPARACIÓN CON ARCHIVO ANTERIOR ==========
+        log_lines.append("-"*80)
+        log_lines.append("7️⃣  COMPARACIÓN CON ARCHIVO ANTERIOR")
+        log_lines.append("-"*80)
+
+        try:
+            # Buscar archivo anterior a la fecha objetivo en el catálogo
+            catalog = snapshot_catalog.get_catalog(s3_client, bucket_name, data_prefix)
+            latest_file = catalog.latest_before(target_date)
+
+            if latest_file is None:
                 log_lines.append(f"   ℹ️  No se encontró archivo anterior para comparar")
                 validation_summary['metricas']['comparacion_anterior'] = 'no_disponible'
             else:
-                # Archivo más reciente
-                latest_file = max(files_with_dates, key=lambda x: x[0])
-                latest_file_key = latest_file[1]
-                latest_date = latest_file[0].strftime('%Y-%m-%d')
-                
+                latest_file_key = latest_file.key
+                latest_date = latest_file.date.strftime('%Y-%m-%d')
+
                 log_lines.append(f"   Archivo anterior encontrado: {latest_date}")
-                
+
                 # Descargar y comparar
-                obj_response = s3_client.get_object(Bucket=bucket_name, Key=latest_file_key)
-                file_content = obj_response['Body'].read().decode('utf-8')
-                df_anterior = pd.read_csv(StringIO(file_content), dtype=str, low_memory=False)
-                
+                df_anterior = parquet_history.read_snapshot(s3_client, bucket_name, latest_file_key, columns=['store id'])
+
                 # Normalizar columnas
                 df_anterior.columns = df_anterior.columns.str.lower()
-                
+
                 # Contar productos por store id
-                conteo_actual = df.groupby("store id").size()
+                conteo_actual = pd.Series(self.store_counts, dtype='int64')
                 conteo_anterior = df_anterior.groupby("store id").size()
-                
+
                 comparacion = pd.DataFrame({
                     "anterior": conteo_anterior,
                     "actual": conteo_actual
                 }).fillna(0).astype(int)
-                
+
                 comparacion["diferencia"] = comparacion["anterior"] - comparacion["actual"]
                 comparacion["porcentaje"] = (comparacion["diferencia"] / comparacion["anterior"] * 100).round(1)
-                
+
                 # Ordenar por porcentaje descendente
                 comparacion = comparacion.sort_values("porcentaje", ascending=False)
-                
+
                 log_lines.append("")
                 log_lines.append(f"   {'Store ID':<50} {'Anterior':>10} {'Actual':>10} {'Diferencia':>12} {'%':>8}")
                 log_lines.append(f"   {'-'*50} {'-'*10} {'-'*10} {'-'*12} {'-'*8}")
-                
+
                 for store_id, row in comparacion.iterrows():
                     diff_symbol = ""
                     if row['diferencia'] > 0:
@@ -580,79 +1005,244 @@ def validate_and_log_data(
                         diff_symbol = "📈 "
                     else:
                         diff_symbol = "✅ "
-                    
+
                     log_lines.append(
                         f"   {diff_symbol}{store_id:<48} {row['anterior']:>10} {row['actual']:>10} "
                         f"{row['diferencia']:>12} {row['porcentaje']:>7.1f}%"
                     )
-                
+
                 # Alertas si hay disminuciones significativas
                 disminuciones_significativas = comparacion[comparacion["porcentaje"] > 10]
                 if len(disminuciones_significativas) > 0:
                     validation_summary['warnings'].append(f"{len(disminuciones_significativas)} store IDs con disminución >10%")
                     log_lines.append("")
                     log_lines.append(f"   ⚠️  {len(disminuciones_significativas)} store IDs con disminución mayor al 10%")
-                
+
                 validation_summary['metricas']['comparacion_anterior'] = 'completada'
                 validation_summary['metricas']['archivo_anterior_fecha'] = latest_date
-                
-    except Exception as e:
-        log_lines.append(f"   ⚠️  Error al comparar con archivo anterior: {str(e)}")
-        validation_summary['warnings'].append(f"Error en comparación: {str(e)}")
-        validation_summary['metricas']['comparacion_anterior'] = 'error'
-    
-    log_lines.append("")
-    
-    # ========== RESUMEN FINAL ==========
-    final_shape = df.shape
-    registros_eliminados_total = initial_shape[0] - final_shape[0]
-    
-    log_lines.append("="*80)
-    log_lines.append("📋 RESUMEN FINAL")
-    log_lines.append("="*80)
-    log_lines.append(f"   Registros iniciales: {initial_shape[0]:,}")
-    log_lines.append(f"   Registros finales: {final_shape[0]:,}")
-    log_lines.append(f"   Registros eliminados: {registros_eliminados_total:,}")
-    log_lines.append(f"   Porcentaje de datos limpiados: {(registros_eliminados_total/initial_shape[0]*100):.2f}%")
-    log_lines.append("")
-    
-    # Determinar nivel final
-    if len(validation_summary['errores_criticos']) > 0:
-        validation_summary['nivel'] = 'ERROR'
-        log_lines.append(f"   🔴 NIVEL: ERROR - Se encontraron problemas críticos")
-    elif len(validation_summary['warnings']) > 0:
-        validation_summary['nivel'] = 'WARNING'
-        log_lines.append(f"   🟡 NIVEL: WARNING - Se encontraron advertencias")
-    else:
-        validation_summary['nivel'] = 'SUCCESS'
-        log_lines.append(f"   🟢 NIVEL: SUCCESS - Validación completada sin problemas")
-    
-    if validation_summary['warnings']:
+
+        except Exception as e:
+            log_lines.append(f"   ⚠️  Error al comparar con archivo anterior: {str(e)}")
+            validation_summary['warnings'].append(f"Error en comparación: {str(e)}")
+            validation_summary['metricas']['comparacion_anterior'] = 'error'
+
         log_lines.append("")
-        log_lines.append("   Advertencias:")
-        for warning in validation_summary['warnings']:
-            log_lines.append(f"      ⚠️  {warning}")
-    
-    validation_summary['metricas']['registros_finales'] = final_shape[0]
-    validation_summary['metricas']['registros_eliminados_total'] = registros_eliminados_total
-    
-    log_lines.append("")
-    log_lines.append("="*80)
-    log_lines.append(f"FIN DEL REPORTE")
-    log_lines.append("="*80)
-    
-    # Guardar log en S3
-    log_content = "\n".join(log_lines)
-    log_filename = f"validation_{target_date.strftime('%Y-%m-%d')}.txt"
-    log_key = f"{log_prefix}/{log_filename}"
-    
-    s3_client.put_object(
-        Bucket=bucket_name,
-        Key=log_key,
-        Body=log_content.encode('utf-8'),
-        ContentType='text/plain'
-    )
-    
-    print(f"✅ Log de validación guardado en: s3://{bucket_name}/{log_key}")
-    
-    return df, validation_summary
\ No newline at end of file
+
+        # ========== RESUMEN FINAL ==========
+        final_shape = (self.final_rows, initial_shape[1])
+        registros_eliminados_total = initial_shape[0] - final_shape[0]
+
+        log_lines.append("="*80)
+        log_lines.append("📋 RESUMEN FINAL")
+        log_lines.append("="*80)
+        log_lines.append(f"   Registros iniciales: {initial_shape[0]:,}")
+        log_lines.append(f"   Registros finales: {final_shape[0]:,}")
+        log_lines.append(f"   Registros eliminados: {registros_eliminados_total:,}")
+        log_lines.append(f"   Porcentaje de datos limpiados: {(registros_eliminados_total/initial_shape[0]*100):.2f}%")
+        log_lines.append("")
+
+        # Determinar nivel final
+        if len(validation_summary['errores_criticos']) > 0:
+            validation_summary['nivel'] = 'ERROR'
+            log_lines.append(f"   🔴 NIVEL: ERROR - Se encontraron problemas críticos")
+        elif len(validation_summary['warnings']) > 0:
+            validation_summary['nivel'] = 'WARNING'
+            log_lines.append(f"   🟡 NIVEL: WARNING - Se encontraron advertencias")
+        else:
+            validation_summary['nivel'] = 'SUCCESS'
+            log_lines.append(f"   🟢 NIVEL: SUCCESS - Validación completada sin problemas")
+
+        if validation_summary['warnings']:
+            log_lines.append("")
+            log_lines.append("   Advertencias:")
+            for warning in validation_summary['warnings']:
+                log_lines.append(f"      ⚠️  {warning}")
+
+        validation_summary['metricas']['registros_finales'] = final_shape[0]
+        validation_summary['metricas']['registros_eliminados_total'] = registros_eliminados_total
+
+        log_lines.append("")
+        log_lines.append("="*80)
+        log_lines.append(f"FIN DEL REPORTE")
+        log_lines.append("="*80)
+
+        # Guardar log en S3
+        log_content = "\n".join(log_lines)
+        log_filename = f"validation_{target_date.strftime('%Y-%m-%d')}.txt"
+        log_key = f"{log_prefix}/{log_filename}"
+
+        s3_client.put_object(
+            Bucket=bucket_name,
+            Key=log_key,
+            Body=log_content.encode('utf-8'),
+            ContentType='text/plain'
+        )
+
+        print(f"✅ Log de validación guardado en: s3://{bucket_name}/{log_key}")
+
+        return validation_summary
+
+
+@tracing.traced()
+@profiling.profiled
+def validate_and_log_data(
+    df,
+    store_ids_expected,
+    target_date,
+    s3_client,
+    bucket_name,
+    log_prefix,
+    data_prefix
+):
+    """
+    Valida el DataFrame, elimina datos problemáticos, documenta todo y guarda log en S3.
+
+    Args:
+        df: DataFrame a validar
+        store_ids_expected: Lista de store_ids que se esperan
+        target_date: Fecha objetivo (datetime)
+        s3_client: Cliente boto3 S3
+        bucket_name: Nombre del bucket
+        log_prefix: Prefijo para guardar el log (ej: 'derivables/isdin/logs')
+        data_prefix: Prefijo donde están los archivos de datos (para comparación histórica)
+
+    Returns:
+        tuple: (df_cleaned, validation_summary dict)
+    """
+    validator = _ValidationAccumulator(store_ids_expected, target_date)
+    df = validator.process(df)
+    validation_summary = validator.finish(s3_client, bucket_name, log_prefix, data_prefix)
+    return df, validation_summary
+
+
+@tracing.traced()
+def run_chunked_etl(
+    df_chunks,
+    store_ids_expected,
+    target_date,
+    s3_client,
+    bucket_name,
+    prefix,
+    filename,
+    column_order,
+    log_prefix,
+    transform=None,
+    last_price=True,
+    merge_keys=None,
+    last_price_lookback=1,
+    write_parquet=True,
+    compress=None
+):
+    """
+    Ejecuta limpieza, last_price, validación y guardado bloque por bloque,
+    para que clientes grandes corran con memoria acotada por el tamaño del
+    bloque. Equivale a clean_competitor_data -> get_last_price_from_s3 ->
+    validate_and_log_data -> save_to_s3 sobre el DataFrame completo: la
+    deduplicación y las métricas de validación se llevan entre bloques.
+
+    Args:
+        df_chunks: Iterador de DataFrames crudos, ej.
+            load_raw_data_from_athena(..., chunksize=200_000)
+        store_ids_expected: Lista de store_ids que se esperan
+        target_date: Fecha objetivo (datetime)
+        s3_client: Cliente boto3 S3
+        bucket_name: Nombre del bucket
+        prefix: Prefijo de los archivos de datos (last_price, comparación y salida)
+        filename: Nombre del archivo de salida
+        column_order: Orden de columnas de salida
+        log_prefix: Prefijo para guardar el log de validación
+        transform: Función opcional bloque -> bloque con la lógica del
+            cliente (se aplica después de limpiar y antes de last_price)
+        last_price: Calcular last_price contra los archivos anteriores
+        merge_keys: Llaves para last_price (default: ['store id', 'sku', 'upc'])
+        last_price_lookback: Snapshots a revisar para last_price
+        write_parquet: Escribir también el sidecar Parquet
+        compress: Variantes comprimidas adicionales, ej. ['gzip', 'zstd']
+
+    Returns:
+        tuple: (validation_summary dict, dict de estadísticas de subida)
+    """
+    if merge_keys is None:
+        merge_keys = ['store id', 'sku', 'upc']
+
+    # El catálogo se lista antes de escribir para que el archivo nuevo no
+    # cuente como "anterior" en last_price ni en la comparación
+    history = []
+    if last_price:
+        history = load_last_price_history(s3_client, bucket_name, prefix, merge_keys, last_price_lookback)
+    snapshot_catalog.get_catalog(s3_client, bucket_name, prefix)
+
+    key = f"{prefix}/{filename}" if prefix else filename
+    csv_writer = s3_csv.CsvS3Writer(s3_client, bucket_name, key, compress=compress)
+
+    history_writer = None
+    history_target = parquet_history.history_target(prefix, filename)
+    if write_parquet and history_target:
+        history_writer = parquet_history.HistoryWriter(s3_client, bucket_name, *history_target)
+
+    seen_rows = _KeyTracker()
+    seen_merge_keys = _KeyTracker()
+    validator = _ValidationAccumulator(store_ids_expected, target_date)
+
+    try:
+        for chunk_number, df in enumerate(df_chunks, start=1):
+            print(f"Bloque {chunk_number}: {len(df):,} filas")
+            df = clean_competitor_data(df)
+
+            # Deduplicar contra los bloques anteriores
+            repeated, _ = seen_rows.add(df, ['date', 'store id', 'sku', 'upc'])
+            if repeated.any():
+                df = df[~repeated].reset_index(drop=True)
+            if len(df) == 0:
+                continue
+
+            if transform is not None:
+                df = transform(df)
+
+            if last_price and not history:
+                df['last_price'] = ""
+            elif last_price:
+                df = get_last_price_from_s3(
+                    df, s3_client, bucket_name, prefix,
+                    merge_keys=merge_keys, history=history, target_date=target_date
+                )
+                repeated, _ = seen_merge_keys.add(df, merge_keys)
+                if repeated.any():
+                    df = df[~repeated]
+
+            df = validator.process(df)
+            if len(df) == 0:
+                continue
+
+            if column_order:
+                df = df[column_order]
+            csv_writer.write(df)
+
+            if history_writer is not None:
+                try:
+                    history_writer.write(df)
+                except Exception as e:
+                    print(f"⚠️  No se pudo guardar el sidecar Parquet: {str(e)}")
+                    history_writer = None
+
+        upload_stats = csv_writer.close()
+    except Exception:
+        csv_writer.abort()
+        raise
+
+    for uploaded_key, stats in upload_stats.items():
+        print(
+            f"Subido s3://{bucket_name}/{uploaded_key}: {stats['bytes'] / 1024 ** 2:.2f} MB "
+            f"en {stats['seconds']:.2f} s ({stats['mb_per_s']} MB/s)"
+        )
+
+    if history_writer is not None:
+        try:
+            parquet_key = history_writer.close(source_etag=upload_stats[key]['etag'])
+            if parquet_key:
+                print(f"Sidecar Parquet guardado en: s3://{bucket_name}/{parquet_key}")
+        except Exception as e:
+            print(f"⚠️  No se pudo guardar el sidecar Parquet: {str(e)}")
+
+    validation_summary = validator.finish(s3_client, bucket_name, log_prefix, prefix)
+    return validation_summary, upload_stats
@@ -0,0 +1,310 @@
+"""
+Micro-benchmarks de functions_db con datos sinteticos (synthetic_data) y
+un S3 local, sin tocar Athena ni los buckets reales.
+
+Por cada tamaño se generan los datos crudos y un snapshot anterior (para
+last_price) y se mide cada funcion: tiempo (mediana de --repeat
+corridas), pico de RSS y filas por segundo. Los resultados se guardan en
+un JSON que se puede comparar contra una corrida anterior con --compare.
+
+Backends de S3:
+    local: LocalS3Client sobre una carpeta temporal (default)
+    moto: boto3 real contra el S3 simulado de moto (pip install moto)
+
+Uso:
+    python functions_db_benchmark.py
+    python functions_db_benchmark.py --rows 10000 1000000 10000000 --repeat 1
+    python functions_db_benchmark.py --functions clean_competitor_data get_last_price_from_s3
+    python functions_db_benchmark.py --output nuevo.json --compare base.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BUCKET = 'etl-benchmark'
+
+# Orden de medicion: cada funcion usa el resultado de la anterior
+FUNCTIONS = [
+    'clean_competitor_data',
+    'load_last_price_history',
+    'get_last_price_from_s3',
+    'validate_and_log_data',
+    'save_to_s3',
+    'run_chunked_etl',
+]
+
+
+def make_s3_client(backend, root):
+    """Cliente de S3 del backend con el bucket del benchmark ya creado"""
+    if backend == 'moto':
+        from moto import mock_aws
+        import boto3
+
+        mock = mock_aws()
+        mock.start()
+        s3_client = boto3.client('s3', region_name='us-east-1')
+    else:
+        import local_s3
+
+        mock = None
+        s3_client = local_s3.LocalS3Client(root)
+
+    s3_client.create_bucket(Bucket=BUCKET)
+    return s3_client, mock
+
+
+class Benchmark:
+    """
+    Mide funciones con tiempo de pared y pico de RSS (memory_usage.RssSampler).
+    Las funciones que no estan en functions solo se corren (sus resultados
+    alimentan a las siguientes). La salida de las funciones se descarta
+    salvo con verbose.
+    """
+
+    def __init__(self, repeat, functions, verbose=False):
+        import memory_usage
+
+        self.repeat = repeat
+        self.functions = functions
+        self.verbose = verbose
+        self.memory_usage = memory_usage
+        self.sampler = memory_usage.RssSampler().start()
+        self.results = []
+
+    def measure(self, name, rows, func, setup=None):
+        """
+        Corre func(setup()) repeat veces y registra la mediana; setup (por
+        ejemplo copiar la entrada o vaciar el cache) no se mide.
+
+        Returns:
+            El resultado de la ultima corrida
+        """
+        if name not in self.functions:
+            with contextlib.redirect_stdout(sys.stdout if self.verbose else io.StringIO()):
+                return func(setup() if setup is not None else None)
+
+        seconds = []
+        peaks = []
+        result = None
+        for _ in range(self.repeat):
+            data = setup() if setup is not None else None
+            output = io.StringIO()
+            rss_before = self.memory_usage.current_rss()
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(sys.stdout if self.verbose else output):
+                result = func(data)
+            end = time.perf_counter()
+            self.sampler.sample()
+            del data
+            seconds.append(end - start)
+            peak = self.sampler.peak_between(start, time.perf_counter())
+            if peak is not None and rss_before is not None:
+                peaks.append((peak, peak - rss_before))
+
+        median = statistics.median(seconds)
+        record = {
+            'function': name,
+            'rows': rows,
+            'runs': self.repeat,
+            'seconds': round(median, 4),
+            'seconds_min': round(min(seconds), 4),
+            'rows_per_s': round(rows / median) if median else None,
+            'peak_rss_mb': round(max(p[0] for p in peaks) / 1024 ** 2, 1) if peaks else None,
+            'peak_rss_delta_mb': round(max(p[1] for p in peaks) / 1024 ** 2, 1) if peaks else None,
+        }
+        self.results.append(record)
+        print(
+            f"  {name:<26} {rows:>11,} {record['seconds']:>9.3f} s {record['rows_per_s'] or 0:>12,} filas/s "
+            f"{record['peak_rss_delta_mb'] if record['peak_rss_delta_mb'] is not None else '-':>9} MB"
+        )
+        return result
+
+    def close(self):
+        self.sampler.stop()
+
+
+def run_size(bench, rows, s3_client, client, seed, chunksize):
+    """Mide las funciones seleccionadas sobre rows filas sinteticas"""
+    import clients_config
+    import functions_db
+    import s3_cache
+    import snapshot_catalog
+    import synthetic_data
+
+    config = clients_config.CLIENTS[client]
+    prefix = f"derivables/{client}/benchmark_{rows}/competitors"
+    log_prefix = f"derivables/{client}/benchmark_{rows}/logs"
+    order_columns = clients_config.COMPETITOR_COLUMNS + ['last_price']
+    target_date = datetime.now()
+    previous_date = target_date - timedelta(days=1)
+    file_name = f"{client}_local_{target_date.strftime('%Y-%m-%d')}.csv"
+
+    def cold_cache():
+        # Cada corrida lee S3 como la primera del dia
+        snapshot_catalog.invalidate_catalog(BUCKET, prefix)
+        s3_cache.evict(max_bytes=0)
+
+    raw = synthetic_data.generate_raw_data(rows, seed=seed, client=client, target_date=target_date)
+
+    df_clean = bench.measure(
+        'clean_competitor_data', rows,
+        functions_db.clean_competitor_data,
+        setup=raw.copy
+    )
+    del raw
+
+    # Snapshot anterior para last_price y la comparacion historica
+    with contextlib.redirect_stdout(io.StringIO()):
+        df_previous = synthetic_data.generate_previous_snapshot(df_clean, seed=seed + 1)
+        df_previous['last_price'] = ''
+        functions_db.save_to_s3(
+            df_previous, BUCKET, prefix, f"{client}_local_{previous_date.strftime('%Y-%m-%d')}.csv",
+            s3_client, order_columns
+        )
+    del df_previous
+
+    history = bench.measure(
+        'load_last_price_history', len(df_clean),
+        lambda _: functions_db.load_last_price_history(s3_client, BUCKET, prefix),
+        setup=cold_cache
+    )
+
+    df_last_price = bench.measure(
+        'get_last_price_from_s3', len(df_clean),
+        lambda df: functions_db.get_last_price_from_s3(df, s3_client, BUCKET, prefix, history=history),
+        setup=df_clean.copy
+    )
+    del df_clean
+
+    def copy_cold():
+        cold_cache()
+        return df_last_price.copy()
+
+    df_valid, _ = bench.measure(
+        'validate_and_log_data', len(df_last_price),
+        lambda df: functions_db.validate_and_log_data(
+            df, config['store_ids'], target_date, s3_client, BUCKET, log_prefix, prefix
+        ),
+        setup=copy_cold
+    )
+    del df_last_price
+
+    if 'save_to_s3' in bench.functions:
+        bench.measure(
+            'save_to_s3', len(df_valid),
+            lambda _: functions_db.save_to_s3(df_valid, BUCKET, prefix, file_name, s3_client, order_columns)
+        )
+    del df_valid
+
+    if 'run_chunked_etl' in bench.functions:
+        bench.measure(
+            'run_chunked_etl', rows,
+            lambda _: functions_db.run_chunked_etl(
+                synthetic_data.iter_raw_chunks(rows, chunksize, seed=seed, client=client, target_date=target_date),
+                config['store_ids'], target_date, s3_client, BUCKET, prefix,
+                f"chunked_{file_name}", order_columns, log_prefix
+            ),
+            setup=cold_cache
+        )
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline_path):
+    """Tabla de tiempos contra un archivo de resultados anterior"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    previous = {(r['function'], r['rows']): r for r in baseline['results']}
+
+    print(f"\nComparacion contra {baseline_path} ({baseline['meta'].get('commit')}):")
+    print(f"  {'Funcion':<26} {'Filas':>11} {'Antes':>10} {'Ahora':>10} {'Cambio':>8} {'RSS antes':>10} {'RSS ahora':>10}")
+    for record in results:
+        old = previous.get((record['function'], record['rows']))
+        if old is None:
+            continue
+        ratio = record['seconds'] / old['seconds'] if old['seconds'] else float('nan')
+        print(
+            f"  {record['function']:<26} {record['rows']:>11,} {old['seconds']:>8.3f} s {record['seconds']:>8.3f} s "
+            f"{ratio:>7.2f}x {str(old.get('peak_rss_delta_mb')):>10} {str(record.get('peak_rss_delta_mb')):>10}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks de functions_db con datos sinteticos")
+    parser.add_argument('--rows', nargs='+', type=int, default=[10_000, 100_000, 1_000_000], help="Tamaños a medir")
+    parser.add_argument('--functions', nargs='+', choices=FUNCTIONS, default=FUNCTIONS, help="Funciones a medir")
+    parser.add_argument('--backend', choices=['local', 'moto'], default='local', help="S3 local o moto")
+    parser.add_argument('--client', default='isdin', help="Cliente del que se toman store ids y canales")
+    parser.add_argument('--repeat', type=int, default=3, help="Corridas por funcion (se toma la mediana)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunksize', type=int, default=200_000, help="Bloque para run_chunked_etl")
+    parser.add_argument('--output', help="Archivo JSON de resultados (default: functions_db_benchmark_<fecha>.json)")
+    parser.add_argument('--compare', help="Archivo de resultados anterior para comparar")
+    parser.add_argument('--verbose', action='store_true', help="Mostrar la salida de las funciones")
+    args = parser.parse_args()
+
+    # Cache local y S3 en carpetas temporales: no se mezclan con las del ETL
+    work_dir = tempfile.mkdtemp(prefix='etl_benchmark_')
+    os.environ['ETL_CACHE_DIR'] = os.path.join(work_dir, 'cache')
+
+    import pandas as pd
+
+    s3_client, mock = make_s3_client(args.backend, os.path.join(work_dir, 's3'))
+    bench = Benchmark(args.repeat, args.functions, verbose=args.verbose)
+
+    print(f"Backend: {args.backend} | repeticiones: {args.repeat} | cliente: {args.client}")
+    print(f"  {'Funcion':<26} {'Filas':>11} {'Mediana':>11} {'Throughput':>20} {'Pico RSS':>12}")
+    try:
+        for rows in args.rows:
+            run_size(bench, rows, s3_client, args.client, args.seed, args.chunksize)
+    finally:
+        bench.close()
+        if mock is not None:
+            mock.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = args.output or f"functions_db_benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'backend': args.backend,
+            'client': args.client,
+            'repeat': args.repeat,
+            'seed': args.seed,
+            'chunksize': args.chunksize,
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'cpu_count': os.cpu_count(),
+            'copy_on_write': bench.memory_usage.copy_on_write_enabled(),
+        },
+        'results': bench.results,
+    }
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados guardados en {output}")
+
+    if args.compare:
+        compare(bench.results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
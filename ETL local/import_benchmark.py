@@ -0,0 +1,134 @@
+"""
+Benchmark del tiempo de importacion (arranque en frio) de los ETL.
+
+Importa cada modulo en un proceso nuevo de Python varias veces y compara
+la mediana contra su presupuesto. Tambien revisa que importar no cargue
+las dependencias pesadas de AWS (awswrangler, boto3): esas se cargan
+hasta la primera consulta o el primer acceso a S3. Sale con codigo 1 si
+algun modulo se pasa del presupuesto o carga algo que no debe, para
+usarlo como guardia antes de subir cambios.
+
+Uso:
+    python import_benchmark.py
+    python import_benchmark.py --modules functions_db etl_runner --runs 10
+    python import_benchmark.py --importtime
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Segundos (mediana) que puede tardar cada import, sin contar el arranque
+# del interprete. pandas/numpy se importan siempre (~0.4 s)
+BUDGETS = {
+    'functions_db': 0.8,
+    'yza_etl': 0.9,
+    'etl_runner': 0.15,
+    'athena_batch': 0.15,
+    'isdin_etl': 0.15,
+    'naos_etl': 0.15,
+    'bodesa_etl': 0.15,
+    'soriana_etl': 0.15,
+    'soriana_client_etl': 0.15,
+    'farma_comercio_etl': 0.15,
+}
+
+# Modulos que no deben quedar cargados solo por importar un ETL
+LAZY_MODULES = ['awswrangler', 'boto3', 'botocore']
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'loaded': [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure(module, runs):
+    """
+    Importa module en runs procesos nuevos.
+
+    Returns:
+        dict con la mediana y el minimo en segundos, los modulos pesados
+        que quedaron cargados y el error si el import fallo
+    """
+    seconds = []
+    loaded = []
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, '-c', _PROBE.format(module=module, lazy=LAZY_MODULES)],
+            cwd=_DIR, capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            return {'module': module, 'error': proc.stderr.strip().splitlines()[-1]}
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        seconds.append(result['seconds'])
+        loaded = result['loaded']
+    return {
+        'module': module,
+        'median': statistics.median(seconds),
+        'min': min(seconds),
+        'loaded': loaded,
+    }
+
+
+def top_imports(module, limit=15):
+    """Los imports mas tardados de module segun python -X importtime"""
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=_DIR, capture_output=True, text=True
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de importacion de los ETL contra su presupuesto")
+    parser.add_argument('--modules', nargs='+', default=list(BUDGETS), help="Modulos a medir (default: todos)")
+    parser.add_argument('--runs', type=int, default=5, help="Procesos por modulo (se toma la mediana)")
+    parser.add_argument('--importtime', action='store_true', help="Mostrar los imports mas tardados de cada modulo")
+    args = parser.parse_args()
+
+    failures = 0
+    print(f"  {'Modulo':<20} {'Mediana':>9} {'Minimo':>9} {'Presup.':>9}  Estado")
+    for module in args.modules:
+        result = measure(module, args.runs)
+        budget = BUDGETS.get(module)
+
+        if result.get('error'):
+            failures += 1
+            print(f"  {module:<20} {'-':>9} {'-':>9} {budget or '-':>9}  ERROR: {result['error']}")
+            continue
+
+        status = 'OK'
+        if budget is not None and result['median'] > budget:
+            status = 'LENTO'
+        if result['loaded']:
+            status = f"CARGA {', '.join(result['loaded'])}"
+        if status != 'OK':
+            failures += 1
+
+        budget_text = f"{budget:.2f} s" if budget is not None else '-'
+        print(f"  {module:<20} {result['median']:>7.3f} s {result['min']:>7.3f} s {budget_text:>9}  {status}")
+
+        if args.importtime:
+            for cumulative_us, self_us, name in top_imports(module):
+                print(f"      {cumulative_us / 1e6:>7.3f} s  {name}")
+
+    if failures:
+        print(f"\n{failures} modulo(s) fuera de presupuesto")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
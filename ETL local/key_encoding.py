@@ -0,0 +1,128 @@
+"""
+Llaves enteras (int64) para llaves compuestas como (canal, sku, upc).
+
+Un KeyEncoder se crea una vez por corrida y asigna el mismo id a la misma
+combinacion de valores en cualquier DataFrame que se codifique con el (el
+consolidado, el output y los snapshots historicos), asi los dedup, merges
+y busquedas se hacen sobre una sola columna entera.
+
+Los nulos (None/NaN) se tratan como un valor mas, igual que en
+drop_duplicates y merge de pandas. encode() se puede llamar desde varios
+hilos (etapas en paralelo) sobre el mismo KeyEncoder.
+"""
+import threading
+import numpy as np
+import pandas as pd
+
+
+# Los codigos de cada columna se empacan de dos en dos en un int64
+_MAX_CODES = 2 ** 31
+
+
+class _Vocabulary:
+    """Valor -> codigo, solo se agregan valores (los codigos no cambian)"""
+
+    def __init__(self, dtype=object):
+        self.index = pd.Index([], dtype=dtype)
+
+    def __len__(self):
+        return len(self.index)
+
+    def codes(self, values):
+        codes, uniques = pd.factorize(values, use_na_sentinel=False)
+        positions = self.index.get_indexer(uniques)
+        new = positions < 0
+        if new.any():
+            self.index = self.index.append(pd.Index(uniques[new], dtype=self.index.dtype))
+            positions[new] = np.arange(len(self.index) - new.sum(), len(self.index))
+            if len(self.index) >= _MAX_CODES:
+                raise OverflowError("Demasiados valores distintos para KeyEncoder")
+        return positions[codes].astype(np.int64)
+
+
+class KeyEncoder:
+    """
+    Codifica llaves compuestas a ids int64 estables durante la corrida.
+
+    Args:
+        columns: Columnas de la llave, ej. ['canal', 'sku', 'upc']
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self._values = {col: _Vocabulary() for col in self.columns}
+        # Un vocabulario de pares por cada columna despues de la primera
+        self._pairs = [_Vocabulary(dtype=np.int64) for _ in self.columns[1:]]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Numero de llaves distintas vistas"""
+        return len(self._pairs[-1]) if self._pairs else len(self._values[self.columns[0]])
+
+    def encode(self, df, columns=None):
+        """
+        Ids int64 de la llave de cada fila.
+
+        Args:
+            df: DataFrame con las columnas de la llave
+            columns: Nombres de las columnas en df si son distintos (mismo
+                orden que self.columns)
+
+        Returns:
+            np.ndarray int64 alineado con df
+        """
+        columns = list(columns) if columns is not None else self.columns
+        if len(columns) != len(self.columns):
+            raise ValueError(f"Se esperaban {len(self.columns)} columnas: {columns}")
+
+        with self._lock:
+            ids = self._values[self.columns[0]].codes(df[columns[0]])
+            for pairs, name, col in zip(self._pairs, self.columns[1:], columns[1:]):
+                codes = self._values[name].codes(df[col])
+                ids = pairs.codes((ids << 32) | codes)
+        return ids
+
+
+def duplicated(ids, *others, keep='first'):
+    """
+    Equivalente a DataFrame.duplicated sobre (llave, otras columnas...) con
+    la llave ya codificada.
+
+    Args:
+        ids: Ids de KeyEncoder.encode
+        others: Columnas adicionales (Series o arrays) del dedup
+        keep: 'first', 'last' o False (igual que pandas)
+
+    Returns:
+        np.ndarray bool
+    """
+    if not others:
+        return pd.Series(ids).duplicated(keep=keep).to_numpy()
+    frame = {'_id': ids}
+    for i, values in enumerate(others):
+        frame[f'_c{i}'] = pd.factorize(pd.Series(values), use_na_sentinel=False)[0]
+    return pd.DataFrame(frame).duplicated(keep=keep).to_numpy()
+
+
+def first_match(ids, lookup_ids, values, fill_value=np.nan):
+    """
+    Para cada id en `ids` toma el valor de la primera fila de `lookup_ids`
+    con el mismo id (si la llave esta repetida gana la primera aparicion).
+
+    Args:
+        ids: Ids a buscar
+        lookup_ids: Ids de la tabla de busqueda
+        values: Valores de la tabla de busqueda alineados con lookup_ids
+        fill_value: Valor cuando el id no esta en la tabla
+
+    Returns:
+        np.ndarray (dtype object) alineado con ids
+    """
+    lookup_ids = np.asarray(lookup_ids)
+    first = ~pd.Series(lookup_ids).duplicated(keep='first').to_numpy()
+    positions = pd.Index(lookup_ids[first]).get_indexer(np.asarray(ids))
+
+    found_values = np.asarray(values, dtype=object)[first]
+    result = np.full(len(positions), fill_value, dtype=object)
+    result[positions >= 0] = found_values[positions[positions >= 0]]
+    return result
@@ -0,0 +1,151 @@
+"""
+Cliente de S3 sobre el sistema de archivos local, para correr y medir las
+funciones de functions_db sin tocar los buckets reales.
+
+Implementa solo las llamadas de boto3 que usan los ETL (put_object,
+get_object con IfNoneMatch, list_objects_v2 paginado y multipart) con las
+mismas formas de respuesta. Cada objeto es un archivo en
+<root>/<bucket>/<key>; el ETag es el md5 del contenido.
+"""
+import hashlib
+import io
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+
+# list_objects_v2 regresa maximo 1,000 objetos por pagina
+MAX_KEYS = 1000
+
+
+def _client_error(code, operation, status):
+    from botocore.exceptions import ClientError
+
+    return ClientError(
+        {'Error': {'Code': code, 'Message': code}, 'ResponseMetadata': {'HTTPStatusCode': status}},
+        operation
+    )
+
+
+class _ListObjectsPaginator:
+    def __init__(self, client):
+        self.client = client
+
+    def paginate(self, Bucket, Prefix='', StartAfter=None):
+        keys = self.client._list_keys(Bucket, Prefix, StartAfter)
+        for start in range(0, len(keys), MAX_KEYS):
+            page = keys[start:start + MAX_KEYS]
+            yield {
+                'KeyCount': len(page),
+                'Contents': [self.client._describe(Bucket, key) for key in page]
+            }
+        if not keys:
+            yield {'KeyCount': 0}
+
+
+class LocalS3Client:
+    """
+    Sustituto de boto3.client('s3') que guarda los objetos en disco.
+
+    Args:
+        root: Carpeta raiz; cada bucket es una subcarpeta
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._uploads = {}
+        self._lock = threading.Lock()
+
+    def _path(self, bucket, key):
+        return os.path.join(self.root, bucket, *key.split('/'))
+
+    def _etag(self, path):
+        with open(path, 'rb') as f:
+            return hashlib.md5(f.read()).hexdigest()
+
+    def _describe(self, bucket, key):
+        path = self._path(bucket, key)
+        stat = os.stat(path)
+        return {
+            'Key': key,
+            'ETag': f'"{self._etag(path)}"',
+            'Size': stat.st_size,
+            'LastModified': datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
+        }
+
+    def _list_keys(self, bucket, prefix, start_after=None):
+        bucket_dir = os.path.join(self.root, bucket)
+        keys = []
+        for folder, _, files in os.walk(bucket_dir):
+            for name in files:
+                key = os.path.relpath(os.path.join(folder, name), bucket_dir).replace(os.sep, '/')
+                if key.startswith(prefix) and (start_after is None or key > start_after):
+                    keys.append(key)
+        return sorted(keys)
+
+    def _write(self, bucket, key, body):
+        path = self._path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+        return hashlib.md5(body).hexdigest()
+
+    def create_bucket(self, Bucket, **kwargs):
+        os.makedirs(os.path.join(self.root, Bucket), exist_ok=True)
+        return {}
+
+    def put_object(self, Bucket, Key, Body=b'', **kwargs):
+        if isinstance(Body, str):
+            Body = Body.encode('utf-8')
+        elif hasattr(Body, 'read'):
+            Body = Body.read()
+        return {'ETag': f'"{self._write(Bucket, Key, bytes(Body))}"'}
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None, **kwargs):
+        path = self._path(Bucket, Key)
+        if not os.path.exists(path):
+            raise _client_error('NoSuchKey', 'GetObject', 404)
+        etag = self._etag(path)
+        if IfNoneMatch and IfNoneMatch.strip('"') == etag:
+            raise _client_error('304', 'GetObject', 304)
+        with open(path, 'rb') as f:
+            body = f.read()
+        return {'Body': io.BytesIO(body), 'ETag': f'"{etag}"', 'ContentLength': len(body)}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        if not os.path.exists(self._path(Bucket, Key)):
+            raise _client_error('404', 'HeadObject', 404)
+        description = self._describe(Bucket, Key)
+        return {'ETag': description['ETag'], 'ContentLength': description['Size'], 'LastModified': description['LastModified']}
+
+    def list_objects_v2(self, Bucket, Prefix='', StartAfter=None, **kwargs):
+        return next(_ListObjectsPaginator(self).paginate(Bucket=Bucket, Prefix=Prefix, StartAfter=StartAfter))
+
+    def get_paginator(self, operation):
+        if operation != 'list_objects_v2':
+            raise NotImplementedError(f"LocalS3Client no implementa el paginador {operation}")
+        return _ListObjectsPaginator(self)
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._uploads[upload_id] = {}
+        return {'UploadId': upload_id, 'Bucket': Bucket, 'Key': Key}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        with self._lock:
+            self._uploads[UploadId][PartNumber] = bytes(Body)
+        return {'ETag': f'"{hashlib.md5(Body).hexdigest()}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        with self._lock:
+            parts = self._uploads.pop(UploadId)
+        body = b''.join(parts[part['PartNumber']] for part in MultipartUpload['Parts'])
+        return {'ETag': f'"{self._write(Bucket, Key, body)}"', 'Bucket': Bucket, 'Key': Key}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        with self._lock:
+            self._uploads.pop(UploadId, None)
+        return {}
@@ -0,0 +1,128 @@
+"""
+Memoria del proceso (RSS) y modo copy-on-write de pandas para los ETL.
+
+Con copy-on-write (CoW) las columnas se comparten entre DataFrames hasta
+que alguien las modifica, asi que filtrar, renombrar o pasar un DataFrame
+a otra etapa no duplica los datos. Las etapas que modifican un DataFrame
+que no crearon piden su propia copia con private_copy(): con CoW es una
+copia perezosa (solo se copia lo que se escribe), sin CoW una completa.
+"""
+import os
+import sys
+import time
+import threading
+
+import aws_session
+
+# ETL_COPY_ON_WRITE y ETL_RSS_SAMPLE_SECONDS pueden venir del .env
+aws_session.load_env()
+
+
+# ETL_COPY_ON_WRITE=0 regresa al comportamiento clasico de pandas
+COPY_ON_WRITE = os.getenv('ETL_COPY_ON_WRITE', '1') == '1'
+
+# Cada cuanto se muestrea el RSS mientras corren las etapas
+RSS_SAMPLE_SECONDS = float(os.getenv('ETL_RSS_SAMPLE_SECONDS', 0.05))
+
+try:
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = 4096
+
+
+def enable_copy_on_write(enabled=COPY_ON_WRITE):
+    """Activa (o desactiva) copy-on-write de pandas para todo el proceso"""
+    import pandas as pd
+
+    pd.set_option('mode.copy_on_write', bool(enabled))
+
+
+def copy_on_write_enabled():
+    import pandas as pd
+
+    return pd.get_option('mode.copy_on_write') is True
+
+
+def private_copy(df):
+    """
+    Copia de df que la etapa puede modificar sin afectar a quien se lo
+    paso (perezosa con CoW, completa sin CoW).
+    """
+    return df.copy(deep=not copy_on_write_enabled())
+
+
+def peak_rss():
+    """RSS maximo del proceso en bytes (None si la plataforma no lo da)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo reporta en KB, macOS en bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def current_rss():
+    """RSS actual del proceso en bytes (None si la plataforma no lo da)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def format_bytes(value):
+    if value is None:
+        return "n/d"
+    return f"{value / 1024 ** 2:,.1f} MB"
+
+
+class RssSampler:
+    """
+    Hilo que muestrea el RSS del proceso para obtener el pico de cada
+    intervalo (por ejemplo de cada etapa). El RSS es del proceso completo:
+    si dos etapas corren al mismo tiempo, ambas ven el pico de las dos.
+    """
+
+    def __init__(self, interval=RSS_SAMPLE_SECONDS):
+        self.interval = interval
+        self.samples = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def available(self):
+        return current_rss() is not None
+
+    def sample(self):
+        rss = current_rss()
+        if rss is not None:
+            with self._lock:
+                self.samples.append((time.perf_counter(), rss))
+        return rss
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        if not self.available or self._thread is not None:
+            return self
+        self.sample()
+        self._thread = threading.Thread(target=self._loop, name='rss_sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.sample()
+
+    def peak_between(self, start, end):
+        """Pico de RSS entre dos tiempos de time.perf_counter() (None sin muestras)"""
+        with self._lock:
+            values = [rss for moment, rss in self.samples if start <= moment <= end]
+        return max(values) if values else None
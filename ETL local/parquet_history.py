@@ -0,0 +1,279 @@
+import io
+import re
+import pandas as pd
+
+import s3_cache
+import s3_csv
+import tracing
+
+
+# Historico columnar: derivables/competitors_parquet/client=<cliente>/dt=<AAAA-MM-DD>/competitors.parquet
+PARQUET_ROOT = 'derivables/competitors_parquet'
+PARQUET_FILENAME = 'competitors.parquet'
+
+PRICE_COLUMNS = ['price', 'sale price', 'final price', 'last_price']
+DICTIONARY_COLUMNS = ['canal', 'store id']
+
+# Metadata del Parquet con el ETag del CSV del que se genero el sidecar: si
+# el CSV se reescribe (rerun, correccion manual) el sidecar deja de usarse
+SOURCE_ETAG_KEY = b'source_etag'
+
+# Cada precio se guarda tambien con el texto tal cual se entrego ("85.50",
+# "5326"): last_price regresa el precio anterior sin reformatearlo
+TEXT_SUFFIX = '_text'
+
+CLIENT_REGEX = re.compile(r"derivables/([^/]+)/competitors")
+DATE_REGEX = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+def client_from_prefix(prefix):
+    """Obtiene el cliente de un prefijo tipo 'derivables/<cliente>/competitors...'"""
+    match = CLIENT_REGEX.search(prefix or '')
+    return match.group(1) if match else None
+
+
+def partition_prefix(client):
+    return f"{PARQUET_ROOT}/client={client}/"
+
+
+def partition_key(client, str_date):
+    return f"{partition_prefix(client)}dt={str_date}/{PARQUET_FILENAME}"
+
+
+def text_column(col):
+    """Columna del sidecar con el texto original de un precio"""
+    return f"{col}{TEXT_SUFFIX}"
+
+
+def _text_values(series):
+    values = series.where(series.notna(), None).astype(object)
+    return values.map(lambda v: v if v is None or isinstance(v, str) else str(v))
+
+
+def to_typed_table(df):
+    """
+    Convierte la entrega (todo string) a una tabla Arrow tipada:
+    precios como float64 (mas su texto original en <precio>_text) y
+    canal/store id codificados como diccionario.
+    """
+    # pyarrow se importa hasta que se usa (tarda en cargar)
+    import pyarrow as pa
+
+    columns = {}
+    for col in df.columns:
+        lower = col.lower()
+        if lower in PRICE_COLUMNS:
+            values = df[col].astype(str).str.replace(r'[\$,\[\] ]', '', regex=True)
+            columns[col] = pa.array(pd.to_numeric(values, errors='coerce'), type=pa.float64())
+            columns[text_column(col)] = pa.array(_text_values(df[col]), type=pa.string()).dictionary_encode()
+        elif lower in DICTIONARY_COLUMNS:
+            values = df[col].where(df[col].notna(), None).astype(object)
+            columns[col] = pa.array(values, type=pa.string()).dictionary_encode()
+        else:
+            columns[col] = pa.array(_text_values(df[col]), type=pa.string())
+    return pa.table(columns)
+
+
+def history_target(prefix, filename):
+    """
+    (cliente, fecha) del sidecar que corresponde a una entrega, o None si el
+    prefijo no es de competidores o el archivo no tiene fecha.
+    """
+    client = client_from_prefix(prefix)
+    date_match = DATE_REGEX.search(filename)
+    if not client or not date_match:
+        return None
+    return client, date_match.group()
+
+
+class HistoryWriter:
+    """
+    Acumula bloques de una entrega en un Parquet tipado (en memoria, ya
+    comprimido) y lo sube a su particion client=<cliente>/dt=<fecha> al cerrar.
+    """
+
+    def __init__(self, s3_client, bucket, client, str_date):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.client = client
+        self.key = partition_key(client, str_date)
+        self.buffer = io.BytesIO()
+        self.writer = None
+
+    def write(self, df):
+        import pyarrow.parquet as pq
+
+        table = to_typed_table(df)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.buffer, table.schema, compression='zstd')
+        self.writer.write_table(table)
+
+    def close(self, source_etag=None):
+        """
+        Args:
+            source_etag: ETag del CSV entregado (se guarda en la metadata)
+
+        Returns:
+            str: key del archivo Parquet en S3
+        """
+        if self.writer is None:
+            return None
+        if source_etag:
+            self.writer.add_key_value_metadata({SOURCE_ETAG_KEY: _normalize_etag(source_etag)})
+        self.writer.close()
+        body = self.buffer.getvalue()
+        self.s3_client.put_object(Bucket=self.bucket, Key=self.key, Body=body)
+        tracing.add_bytes(written=len(body))
+        return self.key
+
+
+def write_history(df, s3_client, bucket, client, str_date, source_etag=None):
+    """
+    Escribe el sidecar Parquet de una entrega en su particion
+    client=<cliente>/dt=<fecha>.
+
+    Args:
+        source_etag: ETag del CSV entregado
+
+    Returns:
+        str: key del archivo Parquet en S3
+    """
+    writer = HistoryWriter(s3_client, bucket, client, str_date)
+    writer.write(df)
+    return writer.close(source_etag)
+
+
+def _normalize_etag(etag):
+    return (etag or '').strip('"')
+
+
+def source_etag(path):
+    """ETag del CSV con el que se genero un sidecar local (None si no lo tiene)"""
+    import pyarrow.parquet as pq
+
+    metadata = pq.read_metadata(path).metadata or {}
+    value = metadata.get(SOURCE_ETAG_KEY)
+    return value.decode('utf-8') if value else None
+
+
+def _is_not_found(error):
+    code = str(error.response.get('Error', {}).get('Code', ''))
+    status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    return code in ('404', 'NoSuchKey', 'NotFound') or status == 404
+
+
+def _csv_etag(s3_client, bucket, key):
+    from botocore.exceptions import ClientError
+
+    try:
+        return _normalize_etag(s3_client.head_object(Bucket=bucket, Key=key).get('ETag'))
+    except ClientError:
+        return None
+
+
+def read_history_file(path, columns=None, categories=False, text_prices=False):
+    """
+    Lee un archivo Parquet local cargando solo las columnas pedidas
+    (comparadas sin importar mayusculas/minusculas).
+
+    Args:
+        text_prices: Regresar los precios con su texto original (string)
+            en lugar de float64. Si el archivo no tiene el texto (sidecars
+            anteriores) regresa None
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pq.read_schema(path)
+    names = [name for name in schema.names if not name.endswith(TEXT_SUFFIX)]
+    if columns:
+        by_lower = {name.lower(): name for name in names}
+        columns = [by_lower[col.lower()] for col in columns if col.lower() in by_lower]
+    else:
+        columns = names
+
+    renames = {}
+    if text_prices:
+        for col in columns:
+            if col.lower() in PRICE_COLUMNS:
+                if text_column(col) not in schema.names:
+                    return None
+                renames[text_column(col)] = col
+        columns = [text_column(col) if text_column(col) in renames else col for col in columns]
+
+    table = pq.read_table(path, columns=columns)
+    if renames:
+        table = table.rename_columns([renames.get(name, name) for name in table.column_names])
+
+    if not categories:
+        # Decodificar diccionarios para que se comporten igual que el CSV
+        for i, field in enumerate(table.schema):
+            if pa.types.is_dictionary(field.type):
+                table = table.set_column(i, field.name, table.column(i).cast(pa.string()))
+
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def read_history(s3_client, bucket, client, str_date, columns=None, categories=False, text_prices=False):
+    """Lee la particion Parquet de un cliente y fecha"""
+    path = s3_cache.download(s3_client, bucket, partition_key(client, str_date))
+    return read_history_file(path, columns=columns, categories=categories, text_prices=text_prices)
+
+
+def has_history(s3_client, bucket, client, str_date):
+    """Indica si existe el sidecar Parquet para el cliente y fecha (HEAD de su key)"""
+    from botocore.exceptions import ClientError
+
+    try:
+        s3_client.head_object(Bucket=bucket, Key=partition_key(client, str_date))
+        return True
+    except ClientError as e:
+        if _is_not_found(e):
+            return False
+        raise
+
+
+def _download_sidecar(s3_client, bucket, client, str_date):
+    """Ruta local del sidecar (pasando por s3_cache); None si no existe"""
+    from botocore.exceptions import ClientError
+
+    try:
+        return s3_cache.download(s3_client, bucket, partition_key(client, str_date))
+    except ClientError as e:
+        if _is_not_found(e):
+            return None
+        raise
+
+
+def read_snapshot(s3_client, bucket, csv_key, columns=None, text_prices=False):
+    """
+    Lee un snapshot historico de competidores: usa el sidecar Parquet si
+    existe (tipado, solo las columnas pedidas) y corresponde a la version
+    actual del CSV (mismo ETag, y ambos conocidos); si no, el CSV original.
+
+    Args:
+        s3_client: Cliente boto3 S3
+        bucket: Nombre del bucket
+        csv_key: Key del CSV entregado (de ahi se obtienen cliente y fecha)
+        columns: Columnas a cargar (None para todas)
+        text_prices: Precios como el texto entregado (igual que el CSV) en
+            lugar de float64
+    """
+    client = client_from_prefix(csv_key)
+    date_match = DATE_REGEX.search(csv_key.split('/')[-1])
+
+    path = None
+    if client and date_match:
+        path = _download_sidecar(s3_client, bucket, client, date_match.group())
+    if path is not None:
+        etag = source_etag(path)
+        # Sin ETag en el sidecar (o sin poder leer el del CSV) no se sabe si
+        # corresponde: se lee el CSV
+        if etag is not None and etag == _csv_etag(s3_client, bucket, csv_key):
+            df = read_history_file(path, columns=columns, text_prices=text_prices)
+            if df is not None:
+                return df
+        else:
+            print(f"Sidecar Parquet de {csv_key} no corresponde al CSV actual, se lee el CSV")
+
+    return s3_csv.read_csv_s3(s3_client, bucket, csv_key, columns=columns)
@@ -0,0 +1,227 @@
+"""
+Escenarios de permanencia de precios calculados sobre una matriz
+(llaves x K semanas) en lugar de fila por fila.
+
+Las columnas de la ventana son N-K ... N-1 (N-1 es la semana mas reciente).
+Los resultados son los mismos que daba procesar_fila con statistics:
+promedio/mediana/moda redondeados a 2 decimales, la moda es el primer
+valor mas repetido y el precio recomendado se toma sin redondear.
+
+El redondeo depende del tipo que recibia procesar_fila en apply(axis=1):
+np.float64 (np.round) si todas las columnas del DataFrame son numericas,
+float de Python (round) si hay alguna de texto, como las llaves de yza.
+price_scenarios_check.py compara contra procesar_fila.
+"""
+from statistics import mean
+import numpy as np
+import pandas as pd
+
+
+# Semanas de la ventana por default (N-4 ... N-1)
+DEFAULT_WINDOW = 4
+# Semanas con precio que necesita un escenario (con menos: sin datos suficientes)
+MIN_WINDOW = 2
+
+OUTPUT_COLUMNS = ["Precio Promedio", "Precio Mediana", "Precio Moda", "Precio recomendado", "Escenario aplicado"]
+
+SIN_DATOS = "Sin datos suficientes"
+DATOS_INCOMPLETOS = "Datos incompletos"
+SIN_MODA = "Sin moda"
+SIN_RECOMENDACION = "No hay recomendacion por cambio de precio cada semana"
+NO_APLICA = "No aplica"
+DATOS_EXCEDEN = "Datos exceden escenarios definidos"
+
+# Margen (en centavos) alrededor de un .5 en el que el promedio de numpy
+# podria redondear distinto que statistics.mean (que es exacto)
+_ROUND_MARGIN = 1e-6
+
+
+def window_columns(window=DEFAULT_WINDOW):
+    """Columnas de la ventana de la mas antigua a la mas reciente (N-K ... N-1)"""
+    return [f"N-{i}" for i in range(window, 0, -1)]
+
+
+def price_matrix(df, window=DEFAULT_WINDOW):
+    """
+    Matriz float (n, window) con los precios de N-K ... N-1; los nulos (o
+    columnas faltantes) quedan como NaN.
+    """
+    columns = []
+    for col in window_columns(window):
+        if col in df.columns:
+            columns.append(pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float, na_value=np.nan))
+        else:
+            columns.append(np.full(len(df), np.nan))
+    if not columns:
+        return np.empty((len(df), 0))
+    return np.column_stack(columns)
+
+
+def _round2(values, missing, python_round):
+    """Redondeo a 2 decimales por elemento (round de Python o np.round); None donde missing"""
+    if not python_round:
+        values = np.round(values, 2)
+        return [None if skip else value for value, skip in zip(values.tolist(), missing.tolist())]
+    return [None if skip else round(value, 2) for value, skip in zip(values.tolist(), missing.tolist())]
+
+
+def numpy_rows(df):
+    """
+    True si apply(axis=1) le pasaria a procesar_fila filas np.float64 (todas
+    las columnas numericas); False si son objetos con float de Python.
+    """
+    return df.iloc[:0].to_numpy().dtype != object
+
+
+def compute_scenarios(prices, python_round=False):
+    """
+    Calcula promedio, mediana, moda, precio recomendado y escenario para
+    cada fila de una matriz de precios.
+
+    Escenarios (sobre las semanas con precio, en orden cronologico):
+        - menos de 2 semanas: sin datos suficientes
+        - 2 semanas: Escenario 1 si son iguales, si no Escenario 2
+          (se recomienda la mas reciente)
+        - 3 semanas: Escenario 3 si dos semanas consecutivas repiten precio,
+          si no Escenario 5
+        - 4 semanas: Escenario 4 con el precio que se repite, Escenario 5 si
+          los 4 son distintos
+        - mas de 4 semanas: Escenario 5 (excede los escenarios definidos)
+
+    Args:
+        prices: Matriz float (n, K) de la semana mas antigua a la mas
+            reciente, NaN donde no hay precio
+        python_round: round de Python en lugar de np.round (ver numpy_rows)
+
+    Returns:
+        dict columna -> lista de valores (OUTPUT_COLUMNS)
+    """
+    prices = np.asarray(prices, dtype=float)
+    n, window = prices.shape
+
+    valid = ~np.isnan(prices)
+    count = valid.sum(axis=1)
+
+    # Compactar los precios validos a la izquierda conservando el orden
+    order = np.argsort(~valid, axis=1, kind='stable')
+    packed = np.take_along_axis(prices, order, axis=1)
+    packed_valid = np.arange(window) < count[:, None]
+    no_data = count == 0
+
+    # Promedio: fl(suma)/c coincide con statistics.mean salvo en el ultimo
+    # bit; solo las filas cerca de un .5 (o con inf) se recalculan exactas
+    with np.errstate(invalid='ignore', divide='ignore'):
+        total = np.where(packed_valid, packed, 0.0).sum(axis=1)
+        means = total / count
+        cents = means * 100
+        distance = np.abs(cents - np.floor(cents) - 0.5)
+        margin = np.maximum(_ROUND_MARGIN, 64 * window * np.finfo(float).eps * np.abs(cents))
+    with np.errstate(invalid='ignore'):
+        unusual = (packed_valid & (~np.isfinite(packed) | (packed < 0))).any(axis=1)
+    ambiguous = (count >= 3) & ((distance < margin) | unusual)
+    failed = np.zeros(n, dtype=bool)
+    for i in np.flatnonzero(ambiguous):
+        try:
+            means[i] = mean(packed[i, :count[i]].tolist())
+        except Exception:
+            failed[i] = True
+
+    # Mediana: mismo calculo que statistics.median sobre los valores ordenados
+    ordered = np.sort(prices, axis=1)
+    idx = np.arange(n)
+    upper = ordered[idx, np.minimum(count // 2, window - 1)] if window else np.full(n, np.nan)
+    lower = ordered[idx, np.maximum(count // 2 - 1, 0)] if window else np.full(n, np.nan)
+    with np.errstate(invalid='ignore'):
+        medians = np.where(count % 2 == 1, upper, (lower + upper) / 2)
+
+    # Repeticiones de cada precio dentro de la fila (solo entre validos)
+    with np.errstate(invalid='ignore'):
+        same = (packed[:, :, None] == packed[:, None, :]) & packed_valid[:, None, :]
+    counts = np.where(packed_valid, same.sum(axis=2), 0)
+
+    # Moda: primer precio con el maximo de repeticiones
+    first_mode = np.argmax(counts, axis=1) if window else np.zeros(n, dtype=int)
+    modes = packed[idx, first_mode] if window else np.full(n, np.nan)
+    max_count = counts[idx, first_mode] if window else np.zeros(n, dtype=int)
+
+    promedio = _round2(means, no_data | failed, python_round)
+    mediana = _round2(medians, no_data, python_round)
+    moda = _round2(modes, np.zeros(n, dtype=bool), python_round)
+    moda = [SIN_MODA if skip else value for value, skip in zip(moda, no_data.tolist())]
+
+    escenario = np.full(n, SIN_DATOS, dtype=object)
+    sugerido = np.full(n, DATOS_INCOMPLETOS, dtype=object)
+
+    def column(j):
+        return packed[:, j] if j < window else np.full(n, np.nan)
+
+    v0, v1, v2 = column(0), column(1), column(2)
+
+    # 2 semanas
+    two = count == 2
+    escenario[two] = np.where(v0[two] == v1[two], "Escenario 1", "Escenario 2")
+    sugerido[two] = v1[two].tolist()
+
+    # 3 semanas
+    three = count == 3
+    first_pair = three & (v0 == v1)
+    second_pair = three & ~first_pair & (v1 == v2)
+    no_pair = three & ~first_pair & ~second_pair
+    escenario[first_pair | second_pair] = "Escenario 3"
+    sugerido[first_pair] = v0[first_pair].tolist()
+    sugerido[second_pair] = v1[second_pair].tolist()
+    escenario[no_pair] = "Escenario 5"
+    sugerido[no_pair] = SIN_RECOMENDACION
+
+    # 4 semanas
+    four = count == 4
+    if four.any():
+        pairs = counts == 2
+        n_pairs = pairs.sum(axis=1) // 2
+        n_distinct = np.where(packed_valid, 1.0 / np.maximum(counts, 1), 0.0).sum(axis=1).round().astype(int)
+        first_pair_value = packed[idx, np.argmax(pairs, axis=1)]
+
+        one_pair = four & (n_pairs == 1)
+        all_distinct = four & ~one_pair & (n_distinct == 4)
+        most_common = four & ~one_pair & ~all_distinct & (max_count >= 2)
+        other = four & ~one_pair & ~all_distinct & ~most_common
+
+        escenario[one_pair] = "Escenario 4"
+        sugerido[one_pair] = first_pair_value[one_pair].tolist()
+        escenario[all_distinct] = "Escenario 5"
+        sugerido[all_distinct] = SIN_RECOMENDACION
+        escenario[most_common] = "Escenario 4"
+        sugerido[most_common] = modes[most_common].tolist()
+        escenario[other] = "Escenario 5"
+        sugerido[other] = NO_APLICA
+
+    # Mas de 4 semanas (ventanas K > 4)
+    more = count > 4
+    escenario[more] = "Escenario 5"
+    sugerido[more] = DATOS_EXCEDEN
+
+    return dict(zip(OUTPUT_COLUMNS, [promedio, mediana, moda, sugerido.tolist(), escenario.tolist()]))
+
+
+def apply_scenarios(df, window=DEFAULT_WINDOW):
+    """
+    Agrega a df las columnas de OUTPUT_COLUMNS calculadas sobre N-K ... N-1.
+
+    Args:
+        df: DataFrame con las columnas de la ventana
+        window: Numero de semanas K
+
+    Returns:
+        El mismo DataFrame con las columnas agregadas
+    """
+    # procesar_fila recibia las columnas faltantes como None (filas object)
+    missing = any(col not in df.columns for col in window_columns(window))
+    python_round = missing or not numpy_rows(df)
+    results = compute_scenarios(price_matrix(df, window), python_round=python_round)
+    columns = {
+        name: pd.Series(values, index=df.index, dtype=object)
+        for name, values in results.items()
+    }
+    # Mismos dtypes que daba apply(axis=1) (float64 donde solo hay numeros)
+    df[OUTPUT_COLUMNS] = pd.DataFrame(columns, index=df.index).infer_objects()
+    return df
@@ -0,0 +1,179 @@
+"""
+Compara price_scenarios.apply_scenarios contra procesar_fila (la version
+fila por fila que se usaba en yza_etl) con precios aleatorios.
+
+Los precios imitan promedios semanales (muchos terminan en .xx5, justo en
+el limite del redondeo) e incluyen nulos, semanas repetidas, inf y
+negativos. Cada caso se corre con llaves de texto (como en yza, filas
+object) y con solo columnas numericas (filas np.float64). Sale con codigo
+1 si alguna fila o dtype es distinto.
+
+Uso:
+    python price_scenarios_check.py
+    python price_scenarios_check.py --rows 20000 --seeds 20
+"""
+import argparse
+import sys
+from collections import Counter
+from statistics import StatisticsError, mean, median, mode
+
+import numpy as np
+import pandas as pd
+
+import price_scenarios
+
+COLUMNS = price_scenarios.OUTPUT_COLUMNS
+
+
+def procesar_fila(row):
+    """Version original de yza_etl (referencia, no cambiar)"""
+    precios = [row.get("N-4", None), row.get("N-3", None), row.get("N-2", None), row.get("N-1", None)]
+
+    try:
+        promedio = round(mean([p for p in precios if not pd.isna(p)]), 2)
+    except:
+        promedio = None
+
+    try:
+        mediana = round(median([p for p in precios if not pd.isna(p)]), 2)
+    except:
+        mediana = None
+
+    try:
+        moda = round(mode([p for p in precios if not pd.isna(p)]), 2)
+    except StatisticsError:
+        moda = "Sin moda"
+    except:
+        moda = None
+
+    p40, p41, p42, p43 = precios
+    precios_validos = [p for p in precios if not pd.isna(p)]
+
+    escenario = "Sin datos suficientes"
+    sugerido = "Datos incompletos"
+
+    if len(precios_validos) < 2:
+        return pd.Series([promedio, mediana, moda, sugerido, escenario])
+
+    semanas_disponibles = []
+    if not pd.isna(p40):
+        semanas_disponibles.append(('S40', p40))
+    if not pd.isna(p41):
+        semanas_disponibles.append(('S41', p41))
+    if not pd.isna(p42):
+        semanas_disponibles.append(('S42', p42))
+    if not pd.isna(p43):
+        semanas_disponibles.append(('S43', p43))
+
+    num_semanas = len(semanas_disponibles)
+
+    if num_semanas == 2:
+        if semanas_disponibles[0][1] == semanas_disponibles[1][1]:
+            escenario = "Escenario 1"
+            sugerido = semanas_disponibles[1][1]
+        else:
+            escenario = "Escenario 2"
+            sugerido = semanas_disponibles[1][1]
+
+    elif num_semanas == 3:
+        precio_repetido = None
+
+        if semanas_disponibles[0][1] == semanas_disponibles[1][1]:
+            precio_repetido = semanas_disponibles[0][1]
+        elif semanas_disponibles[1][1] == semanas_disponibles[2][1]:
+            precio_repetido = semanas_disponibles[1][1]
+
+        if precio_repetido is not None:
+            escenario = "Escenario 3"
+            sugerido = precio_repetido
+        else:
+            escenario = "Escenario 5"
+            sugerido = "No hay recomendacion por cambio de precio cada semana"
+
+    elif num_semanas == 4:
+        contador_precios = Counter([precio for _, precio in semanas_disponibles])
+
+        precios_repetidos_2_veces = [precio for precio, count in contador_precios.items() if count == 2]
+
+        if len(precios_repetidos_2_veces) == 1:
+            escenario = "Escenario 4"
+            sugerido = precios_repetidos_2_veces[0]
+        elif len(set(precios_validos)) == 4:
+            escenario = "Escenario 5"
+            sugerido = "No hay recomendacion por cambio de precio cada semana"
+        else:
+            precio_mas_frecuente = contador_precios.most_common(1)[0][0]
+            if contador_precios[precio_mas_frecuente] >= 2:
+                escenario = "Escenario 4"
+                sugerido = precio_mas_frecuente
+            else:
+                escenario = "Escenario 5"
+                sugerido = "No aplica"
+
+    else:
+        escenario = "Escenario 5"
+        sugerido = "Datos exceden escenarios definidos"
+
+    return pd.Series([promedio, mediana, moda, sugerido, escenario])
+
+
+def random_prices(rows, seed):
+    """Matriz (rows, 4) de N-4 ... N-1 con precios de promedios semanales"""
+    rng = np.random.default_rng(seed)
+    base = rng.integers(100, 500_000, rows) / 100
+    # Promedio de 2 a 7 precios diarios: terminaciones .xx5, .xx33, ...
+    days = rng.integers(2, 8, (rows, 4))
+    steps = rng.integers(-3, 4, (rows, 4)) * np.array([0.01, 0.05, 0.5])[rng.integers(0, 3, (rows, 4))]
+    weekly = np.round(base[:, None] + steps / days, 3)
+    # Semanas que repiten precio (escenarios 1, 3 y 4)
+    repeat = rng.random((rows, 4)) < 0.35
+    weekly[:, 1:][repeat[:, 1:]] = weekly[:, :-1][repeat[:, 1:]]
+    weekly[rng.random((rows, 4)) < 0.2] = np.nan
+    special = rng.random(rows) < 0.002
+    weekly[special, rng.integers(0, 4, int(special.sum()))] = rng.choice([np.inf, -np.inf, -15.5], int(special.sum()))
+    return weekly
+
+
+def check(rows, seed, text_keys):
+    """Numero de filas distintas entre procesar_fila y apply_scenarios"""
+    prices = random_prices(rows, seed)
+    df = pd.DataFrame(prices, columns=price_scenarios.window_columns(4))
+    if text_keys:
+        df.insert(0, 'UPC_llave_cod_interno', [f"{i}_cod" for i in range(rows)])
+
+    expected = df.copy()
+    expected[COLUMNS] = expected.apply(procesar_fila, axis=1)
+    result = price_scenarios.apply_scenarios(df.copy())
+
+    same = (expected[COLUMNS] == result[COLUMNS]) | (expected[COLUMNS].isna() & result[COLUMNS].isna())
+    different = ~same.all(axis=1)
+    if different.any():
+        print(expected[different].head(3).T)
+        print(result[different].head(3).T)
+    if not (expected.dtypes == result.dtypes).all():
+        print(f"dtypes distintos:\n{expected.dtypes}\n{result.dtypes}")
+        return max(int(different.sum()), 1)
+    return int(different.sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="apply_scenarios contra procesar_fila")
+    parser.add_argument('--rows', type=int, default=20_000, help="Filas por caso")
+    parser.add_argument('--seeds', type=int, default=5, help="Casos por tipo de fila")
+    args = parser.parse_args()
+
+    failures = 0
+    for text_keys in (True, False):
+        for seed in range(args.seeds):
+            different = check(args.rows, seed, text_keys)
+            status = 'OK' if not different else f"{different} filas distintas"
+            print(f"  semilla {seed} {'llaves de texto' if text_keys else 'solo numeros':<16} {status}")
+            failures += bool(different)
+
+    if failures:
+        print(f"\n{failures} caso(s) distintos")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+"""
+Perfilado bajo demanda de las funciones pesadas de los ETL.
+
+Las funciones marcadas con @profiling.profiled se perfilan solo si su
+nombre esta en ETL_PROFILE (o con --profile en etl_runner.py). La decision
+se toma al importar el modulo: deshabilitado, el decorador regresa la
+funcion original y no hay ningun costo.
+
+Cada llamada perfilada deja en ETL_PROFILE_DIR:
+    <traza>_<funcion>_<pid>_<n>.pstats     (python -m pstats, snakeviz)
+    <traza>_<funcion>_<pid>_<n>.collapsed  (flamegraph.pl, speedscope)
+
+Variables de entorno:
+    ETL_PROFILE: 'all' (las de DEFAULT_FUNCTIONS) o nombres separados por coma
+    ETL_PROFILE_MODE: 'cprofile' (determinista, default) o 'sample'
+        (muestreo de la pila, menor costo; en el .pstats las llamadas
+        son muestras)
+    ETL_PROFILE_DIR: Carpeta de salida (default: profiles)
+    ETL_PROFILE_INTERVAL: Segundos entre muestras (default: 0.005)
+    ETL_PROFILE_MAX_CALLS: Llamadas perfiladas por funcion y proceso (default: 10)
+"""
+import cProfile
+import functools
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+import aws_session
+import tracing
+
+# Las variables ETL_PROFILE* pueden venir del .env
+aws_session.load_env()
+
+DEFAULT_FUNCTIONS = [
+    'clean_competitor_data',
+    'get_last_price_from_s3',
+    'validate_and_log_data',
+    'actualizar_upc_y_codigo',
+    'procesar_permanencia',
+]
+
+MODES = ['cprofile', 'sample']
+
+PROFILE = os.getenv('ETL_PROFILE', '')
+PROFILE_MODE = os.getenv('ETL_PROFILE_MODE', 'cprofile')
+PROFILE_DIR = os.getenv('ETL_PROFILE_DIR', 'profiles')
+PROFILE_INTERVAL = float(os.getenv('ETL_PROFILE_INTERVAL', 0.005))
+PROFILE_MAX_CALLS = int(os.getenv('ETL_PROFILE_MAX_CALLS', 10))
+
+_CALLS = Counter()
+_CALLS_LOCK = threading.Lock()
+_ACTIVE = threading.local()
+
+
+def enabled_functions(value=PROFILE):
+    """Funciones a perfilar segun ETL_PROFILE"""
+    value = value.strip()
+    if not value or value == '0':
+        return set()
+    if value in ('1', 'all'):
+        return set(DEFAULT_FUNCTIONS)
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+_ENABLED = enabled_functions()
+
+
+def configure(functions=None, mode=None, directory=None):
+    """
+    Variables de entorno para perfilar (las hereda cualquier proceso hijo).
+    Se llama antes de importar los modulos del ETL.
+
+    Args:
+        functions: Nombres a perfilar (vacio o None = DEFAULT_FUNCTIONS)
+        mode: 'cprofile' o 'sample'
+        directory: Carpeta de salida
+    """
+    global _ENABLED, PROFILE_MODE, PROFILE_DIR
+    os.environ['ETL_PROFILE'] = ','.join(functions) if functions else 'all'
+    _ENABLED = enabled_functions(os.environ['ETL_PROFILE'])
+    if mode:
+        os.environ['ETL_PROFILE_MODE'] = PROFILE_MODE = mode
+    if directory:
+        os.environ['ETL_PROFILE_DIR'] = PROFILE_DIR = directory
+
+
+def _frame_key(code):
+    return (code.co_filename, code.co_firstlineno, code.co_name)
+
+
+def _frame_label(key):
+    return f"{key[2]} ({os.path.basename(key[0])}:{key[1]})"
+
+
+class StackSampler:
+    """
+    Muestrea la pila de un hilo cada interval segundos (desde otro hilo).
+    Las pilas se recortan desde la funcion perfilada hacia adentro.
+
+    Args:
+        thread_id: Hilo a muestrear (threading.get_ident())
+        root_code: code object de la funcion perfilada
+        interval: Segundos entre muestras
+    """
+
+    def __init__(self, thread_id, root_code, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.root_code = root_code
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name='stack_sampler', daemon=True)
+
+    def _sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None:
+            stack.append(frame.f_code)
+            if frame.f_code is self.root_code:
+                break
+            frame = frame.f_back
+        if stack:
+            self.stacks[tuple(_frame_key(code) for code in reversed(stack))] += 1
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write_collapsed(self, path):
+        """Pilas en formato colapsado: 'f1;f2;f3 muestras' por linea"""
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, samples in sorted(self.stacks.items()):
+                f.write(';'.join(_frame_label(key) for key in stack) + f" {samples}\n")
+
+    def stats(self):
+        """
+        Muestras en el formato de pstats: tiempo propio para la funcion de
+        hasta arriba de la pila, acumulado para todas; las llamadas son
+        muestras.
+        """
+        stats = {}
+        for stack, samples in self.stacks.items():
+            seconds = samples * self.interval
+            for position, key in enumerate(stack):
+                leaf = position == len(stack) - 1
+                if key in stack[:position]:
+                    continue
+                cc, nc, tt, ct, callers = stats.get(key, (0, 0, 0.0, 0.0, {}))
+                stats[key] = (cc + samples, nc + samples, tt + (seconds if leaf else 0.0), ct + seconds, callers)
+                if position:
+                    caller = stack[position - 1]
+                    c_cc, c_nc, c_tt, c_ct = callers.get(caller, (0, 0, 0.0, 0.0))
+                    callers[caller] = (c_cc + samples, c_nc + samples, c_tt + (seconds if leaf else 0.0), c_ct + seconds)
+        return stats
+
+
+class _SampledStats:
+    """Adaptador para que pstats.Stats lea las muestras de StackSampler"""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def _output_base(name):
+    trace = tracing.current_trace()
+    with _CALLS_LOCK:
+        _CALLS[name] += 1
+        number = _CALLS[name]
+    prefix = f"{trace.name}_" if trace is not None else ""
+    return os.path.join(PROFILE_DIR, f"{prefix}{name}_{os.getpid()}_{number}")
+
+
+def _run_profiled(func, args, kwargs):
+    name = func.__name__
+    with _CALLS_LOCK:
+        if _CALLS[name] >= PROFILE_MAX_CALLS:
+            return func(*args, **kwargs)
+    base = _output_base(name)
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+
+    sampler = StackSampler(threading.get_ident(), func.__code__).start()
+    profiler = None
+    if PROFILE_MODE == 'cprofile':
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Otro hilo ya tiene un profiler activo (Python 3.12+): solo muestreo
+            profiler = None
+
+    _ACTIVE.running = True
+    start = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        seconds = time.perf_counter() - start
+        _ACTIVE.running = False
+        if profiler is not None:
+            profiler.disable()
+        sampler.stop()
+        if not sampler.stacks:
+            # Llamada mas corta que el intervalo: una muestra con su duracion
+            sampler.stacks[(_frame_key(func.__code__),)] = max(1, round(seconds / sampler.interval))
+
+        try:
+            stats_source = profiler if profiler is not None else _SampledStats(sampler.stats())
+            stats = pstats.Stats(stats_source)
+            stats.dump_stats(base + '.pstats')
+            sampler.write_collapsed(base + '.collapsed')
+            print(f"Perfil de {name} ({seconds:.2f} s) guardado en {base}.pstats / .collapsed")
+
+            span = tracing.current_span()
+            if span is not None:
+                span.set(profile=base + '.pstats')
+        except Exception as e:
+            print(f"⚠️  No se pudo guardar el perfil de {name}: {str(e)}")
+
+
+def profiled(func):
+    """
+    Decorador: perfila func si su nombre esta habilitado. Deshabilitado
+    regresa func sin envolver. Las llamadas anidadas dentro de una funcion
+    ya perfilada quedan en el perfil de la de afuera.
+    """
+    if func.__name__ not in _ENABLED:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if getattr(_ACTIVE, 'running', False):
+            return func(*args, **kwargs)
+        return _run_profiled(func, args, kwargs)
+    return wrapper
+
+
+def print_top(path, limit=20, sort='cumulative'):
+    """Las funciones mas costosas de un archivo .pstats"""
+    pstats.Stats(path).sort_stats(sort).print_stats(limit)
@@ -0,0 +1,158 @@
+import os
+import hashlib
+import tempfile
+
+import aws_session
+import tracing
+from snapshot_catalog import CACHE_DIR
+
+# ETL_CACHE_MAX_BYTES puede venir del .env
+aws_session.load_env()
+
+
+# Tamaño maximo del cache local (default 2 GB)
+MAX_CACHE_BYTES = int(os.getenv('ETL_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+
+OBJECTS_DIR = os.path.join(CACHE_DIR, 'objects')
+REFS_DIR = os.path.join(CACHE_DIR, 'refs')
+
+# Bloque de lectura del cuerpo de S3 al descargar a disco
+DOWNLOAD_CHUNK_BYTES = 8 * 1024 * 1024
+
+
+def _hash(*parts):
+    return hashlib.sha256("\x00".join(parts).encode('utf-8')).hexdigest()
+
+
+def _blob_path(bucket, key, etag):
+    """Ruta del contenido: direccionada por bucket/key/ETag"""
+    return os.path.join(OBJECTS_DIR, _hash(bucket, key, etag))
+
+
+def _ref_path(bucket, key):
+    """Ruta del apuntador bucket/key -> ultimo ETag descargado"""
+    return os.path.join(REFS_DIR, _hash(bucket, key))
+
+
+def _read_ref(bucket, key):
+    try:
+        with open(_ref_path(bucket, key), encoding='utf-8') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _write_atomic(path, data, mode='wb'):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, mode) as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _write_stream(path, body):
+    """
+    Copia el cuerpo de S3 a path en bloques de DOWNLOAD_CHUNK_BYTES (sin
+    tener el objeto completo en memoria). Regresa los bytes escritos.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    written = 0
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while True:
+                chunk = body.read(DOWNLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                f.write(chunk)
+                written += len(chunk)
+                tracing.add_bytes(read=len(chunk))
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    return written
+
+
+def _is_not_modified(error):
+    code = str(error.response.get('Error', {}).get('Code', ''))
+    status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    return code in ('304', 'NotModified') or status == 304
+
+
+def evict(max_bytes=MAX_CACHE_BYTES, keep=None):
+    """
+    Elimina los archivos usados menos recientemente hasta quedar bajo
+    max_bytes (nunca elimina `keep`, el archivo recien descargado)
+    """
+    if not os.path.isdir(OBJECTS_DIR):
+        return 0
+
+    blobs = []
+    total = 0
+    for name in os.listdir(OBJECTS_DIR):
+        path = os.path.join(OBJECTS_DIR, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        blobs.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+
+    removed = 0
+    for _, size, path in sorted(blobs):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+
+def download(s3_client, bucket, key):
+    """
+    Descarga un objeto de S3 pasando por el cache local y regresa la ruta
+    del archivo en disco.
+
+    Si el objeto ya se descargo antes se hace un GET condicional
+    (IfNoneMatch con el ETag guardado): S3 responde 304 sin cuerpo cuando
+    no cambio y se usa la copia local.
+    """
+    from botocore.exceptions import ClientError
+
+    cached_etag = _read_ref(bucket, key)
+    params = {'Bucket': bucket, 'Key': key}
+    if cached_etag and os.path.exists(_blob_path(bucket, key, cached_etag)):
+        params['IfNoneMatch'] = f'"{cached_etag}"'
+    else:
+        cached_etag = None
+
+    try:
+        response = s3_client.get_object(**params)
+    except ClientError as e:
+        if cached_etag and _is_not_modified(e):
+            path = _blob_path(bucket, key, cached_etag)
+            # Marcar como usado recientemente para el LRU
+            os.utime(path)
+            tracing.count('s3_cache_hits')
+            return path
+        raise
+
+    etag = response.get('ETag', '').strip('"')
+    path = _blob_path(bucket, key, etag)
+    _write_stream(path, response['Body'])
+    _write_atomic(_ref_path(bucket, key), etag, mode='w')
+
+    evict(keep=path)
+    return path
+
+
+def get_object_bytes(s3_client, bucket, key):
+    """Contenido del objeto como bytes, usando el cache local"""
+    with open(download(s3_client, bucket, key), 'rb') as f:
+        return f.read()
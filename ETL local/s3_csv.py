@@ -0,0 +1,310 @@
+import csv
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import s3_cache
+import tracing
+
+
+ENCODINGS = ('utf-8', 'latin-1')
+
+# Valores que pd.read_csv lee como NaN por default (Arrow no incluye
+# '<NA>' ni 'None')
+NULL_VALUES = [
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+]
+
+
+def _read_header(path, encoding):
+    """
+    Lee solo la primera linea del archivo para conocer las columnas. El BOM
+    de UTF-8 se quita como lo hacen Arrow y pandas.
+    """
+    if encoding.replace('-', '').lower() == 'utf8':
+        encoding = 'utf-8-sig'
+    with open(path, encoding=encoding, newline='') as f:
+        header = next(csv.reader(f), [])
+    if header:
+        header[0] = header[0].lstrip('\ufeff')
+    return header
+
+
+def _resolve_columns(header, columns):
+    """Mapea las columnas pedidas (sin importar mayusculas) a las del archivo"""
+    by_lower = {}
+    for name in header:
+        by_lower.setdefault(name.lower(), name)
+    return [by_lower[col.lower()] for col in columns if col.lower() in by_lower]
+
+
+def read_csv_file(path, columns=None, encoding=None, on_bad_lines='error'):
+    """
+    Lee un CSV local con el parser multihilo de Arrow y regresa un DataFrame
+    con todas las columnas como string (equivalente a pd.read_csv(dtype=str):
+    las celdas vacias o con los valores de NULL_VALUES quedan como NaN).
+
+    Args:
+        path: Ruta del archivo
+        columns: Columnas a cargar (None para todas); se comparan sin
+            importar mayusculas/minusculas
+        encoding: Encoding del archivo; si es None se intenta utf-8 y
+            despues latin-1
+        on_bad_lines: 'error' o 'skip' (omitir filas mal formadas)
+    """
+    # pyarrow se importa al leer el primer archivo, no al importar el modulo
+    import numpy as np
+    import pandas as pd
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+
+    encodings = ENCODINGS if encoding is None else (encoding,)
+
+    last_error = None
+    for enc in encodings:
+        try:
+            header = _read_header(path, enc)
+            include_columns = _resolve_columns(header, columns) if columns else header
+
+            read_options = pa_csv.ReadOptions(use_threads=True, encoding=enc)
+            # Los bloques se cortan respetando comillas: un valor entre comillas
+            # con saltos de linea (descripciones) no parte la fila
+            parse_options = pa_csv.ParseOptions(
+                newlines_in_values=True,
+                invalid_row_handler=(lambda row: 'skip') if on_bad_lines == 'skip' else None
+            )
+            convert_options = pa_csv.ConvertOptions(
+                column_types={col: pa.string() for col in header},
+                include_columns=include_columns,
+                null_values=NULL_VALUES,
+                strings_can_be_null=True
+            )
+
+            table = pa_csv.read_csv(
+                path,
+                read_options=read_options,
+                parse_options=parse_options,
+                convert_options=convert_options
+            )
+            with_nulls = [name for name, column in zip(table.column_names, table.columns) if column.null_count]
+            # Liberar los buffers de Arrow mientras se convierte a pandas
+            df = table.to_pandas(split_blocks=True, self_destruct=True)
+            # Arrow regresa None en los nulos; pd.read_csv regresaba NaN (sin
+            # fillna: una columna toda nula se convertiria a float64)
+            for name in with_nulls:
+                values = df[name].to_numpy(dtype=object, copy=True)
+                values[pd.isna(values)] = np.nan
+                df[name] = pd.Series(values, index=df.index, dtype=object)
+            return df
+        except (UnicodeDecodeError, pa.ArrowInvalid) as e:
+            last_error = e
+            continue
+
+    raise last_error
+
+
+def read_csv_s3(s3_client, bucket, key, columns=None, encoding=None, on_bad_lines='error'):
+    """
+    Lee un CSV de S3 como DataFrame de strings sin pasar por
+    Body.read().decode() + StringIO: el objeto se descarga (o se toma del
+    cache local) a disco y Arrow lo parsea directamente del archivo.
+    """
+    path = s3_cache.download(s3_client, bucket, key)
+    return read_csv_file(path, columns=columns, encoding=encoding, on_bad_lines=on_bad_lines)
+
+
+# Tamaño de parte para multipart upload (minimo de S3: 5 MB)
+PART_SIZE = 8 * 1024 * 1024
+CHUNK_ROWS = 100_000
+
+
+class _MultipartWriter:
+    """
+    Sube a S3 los bytes que recibe en partes de PART_SIZE. Si el total no
+    llega a una parte se sube con un solo put_object.
+    """
+
+    def __init__(self, s3_client, bucket, key, compression=None, content_type='text/csv'):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.content_type = content_type
+        self.upload_id = None
+        self.parts = []
+        self.buffer = bytearray()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.etag = None
+
+        self.compressor = None
+        if compression == 'gzip':
+            self.compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        elif compression == 'zstd':
+            import zstandard
+            self.compressor = zstandard.ZstdCompressor(level=3).compressobj()
+
+    def write(self, data):
+        self.bytes_in += len(data)
+        if self.compressor is not None:
+            data = self.compressor.compress(data)
+        self.buffer.extend(data)
+        if len(self.buffer) >= PART_SIZE:
+            self._upload_part()
+
+    def _upload_part(self):
+        if self.upload_id is None:
+            response = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                ContentType=self.content_type
+            )
+            self.upload_id = response['UploadId']
+
+        part_number = len(self.parts) + 1
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=bytes(self.buffer)
+        )
+        self.parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+        self.bytes_out += len(self.buffer)
+        self.buffer = bytearray()
+
+    def close(self):
+        if self.compressor is not None:
+            self.buffer.extend(self.compressor.flush())
+
+        if self.upload_id is None:
+            response = self.s3_client.put_object(
+                Bucket=self.bucket,
+                Key=self.key,
+                Body=bytes(self.buffer),
+                ContentType=self.content_type
+            )
+            self.bytes_out += len(self.buffer)
+            self.buffer = bytearray()
+            self.etag = response.get('ETag')
+            return
+
+        if self.buffer:
+            self._upload_part()
+        response = self.s3_client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={'Parts': self.parts}
+        )
+        self.etag = response.get('ETag')
+
+    def abort(self):
+        if self.upload_id is not None:
+            self.s3_client.abort_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self.upload_id
+            )
+
+
+class CsvS3Writer:
+    """
+    Escribe bloques de un DataFrame como un solo CSV en S3 (multipart), con
+    variantes comprimidas opcionales que se comprimen en paralelo.
+
+    Args:
+        s3_client: Cliente boto3 S3
+        bucket: Nombre del bucket
+        key: Key del CSV
+        compress: Lista de variantes comprimidas adicionales ('gzip', 'zstd');
+            se escriben en <key>.gz / <key>.zst
+    """
+
+    EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+
+    def __init__(self, s3_client, bucket, key, compress=None):
+        self.writers = [_MultipartWriter(s3_client, bucket, key)]
+        for compression in (compress or []):
+            if compression not in self.EXTENSIONS:
+                raise ValueError(f"Compresion no soportada: {compression}")
+            self.writers.append(_MultipartWriter(
+                s3_client,
+                bucket,
+                key + self.EXTENSIONS[compression],
+                compression=compression,
+                content_type='application/octet-stream'
+            ))
+        self.pool = ThreadPoolExecutor(max_workers=len(self.writers))
+        self.header_written = False
+        self.start = time.perf_counter()
+
+    def _submit(self, method, *args):
+        # Cada variante comprime y sube su bloque en su propio hilo
+        futures = [self.pool.submit(getattr(writer, method), *args) for writer in self.writers]
+        for future in futures:
+            future.result()
+
+    def write(self, df):
+        """Agrega un bloque de filas al CSV (el header solo va en el primero)"""
+        data = df.to_csv(index=False, header=not self.header_written).encode('utf-8')
+        self.header_written = True
+        self._submit('write', data)
+
+    def close(self):
+        """
+        Termina los uploads.
+
+        Returns:
+            dict: key -> {'bytes_csv', 'bytes', 'seconds', 'mb_per_s', 'etag'}
+        """
+        try:
+            self._submit('close')
+        finally:
+            self.pool.shutdown()
+        seconds = time.perf_counter() - self.start
+        tracing.add_bytes(written=sum(writer.bytes_out for writer in self.writers))
+
+        stats = {}
+        for writer in self.writers:
+            stats[writer.key] = {
+                'bytes_csv': writer.bytes_in,
+                'bytes': writer.bytes_out,
+                'seconds': round(seconds, 3),
+                'mb_per_s': round(writer.bytes_in / 1024 ** 2 / seconds, 2) if seconds > 0 else None,
+                'etag': writer.etag
+            }
+        return stats
+
+    def abort(self):
+        self.pool.shutdown()
+        for writer in self.writers:
+            writer.abort()
+
+
+def write_csv_s3(df, s3_client, bucket, key, compress=None, chunk_rows=CHUNK_ROWS):
+    """
+    Escribe un DataFrame como CSV en S3 sin archivo temporal ni copia
+    completa en memoria: se serializa por bloques de filas y cada bloque se
+    manda a un multipart upload.
+
+    Args:
+        df: DataFrame a guardar
+        s3_client: Cliente boto3 S3
+        bucket: Nombre del bucket
+        key: Key del CSV
+        compress: Lista de variantes comprimidas adicionales ('gzip', 'zstd');
+            se escriben en <key>.gz / <key>.zst y se comprimen en paralelo
+        chunk_rows: Filas por bloque de serializacion
+
+    Returns:
+        dict: key -> {'bytes_csv', 'bytes', 'seconds', 'mb_per_s', 'etag'}
+    """
+    writer = CsvS3Writer(s3_client, bucket, key, compress=compress)
+    try:
+        for pos in range(0, max(len(df), 1), chunk_rows):
+            writer.write(df.iloc[pos:pos + chunk_rows])
+        return writer.close()
+    except Exception:
+        writer.abort()
+        raise
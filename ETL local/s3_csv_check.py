@@ -0,0 +1,86 @@
+"""
+Compara s3_csv.read_csv_file contra pd.read_csv(dtype=str) (la lectura que
+se usaba antes) con CSVs generados.
+
+Los casos incluyen valores entre comillas con saltos de linea en un archivo
+de varios bloques de Arrow (los bloques se leen en paralelo), BOM de UTF-8,
+nulos y columnas pedidas con otras mayusculas. Sale con codigo 1 si algun
+DataFrame es distinto o la lectura falla.
+
+Uso:
+    python s3_csv_check.py
+    python s3_csv_check.py --rows 1000000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import s3_csv
+
+
+def multiline_frame(rows, seed=0):
+    """Descripciones con saltos de linea, comas y comillas en filas al azar"""
+    rng = np.random.default_rng(seed)
+    item = np.array([f"Producto {i}" for i in range(rows)], dtype=object)
+    special = rng.random(rows) < 0.1
+    item[special] = [f'linea {i}\nsalto, "comillas"\r\nfin' for i in np.flatnonzero(special)]
+    return pd.DataFrame({
+        'upc': [f"{7501000000000 + i}" for i in range(rows)],
+        'item': item,
+        'final price': np.where(rng.random(rows) < 0.05, '', (rng.integers(100, 99_999, rows) / 100).astype(str)),
+        'store id': rng.choice(['9999_heb', 'NA', 'None', '9999_soriana'], rows),
+    })
+
+
+def check_case(name, path, columns=None, encoding='utf-8'):
+    """True si read_csv_file regresa lo mismo que pd.read_csv(dtype=str)"""
+    expected = pd.read_csv(path, dtype=str, encoding=encoding)
+    if columns:
+        wanted = {col.lower() for col in columns}
+        expected = expected[[col for col in expected.columns if col.lower() in wanted]]
+    try:
+        result = s3_csv.read_csv_file(path, columns=columns)
+    except Exception as e:
+        print(f"  {name:<28} ERROR {type(e).__name__}: {str(e)}")
+        return False
+
+    same = list(result.columns) == list(expected.columns) and result.equals(expected)
+    print(f"  {name:<28} {'OK' if same else 'distinto'} ({len(result):,} filas)")
+    if not same:
+        print(expected.compare(result).head() if expected.shape == result.shape else f"{expected.shape} vs {result.shape}")
+    return same
+
+
+def main():
+    parser = argparse.ArgumentParser(description="read_csv_file contra pd.read_csv(dtype=str)")
+    parser.add_argument('--rows', type=int, default=400_000, help="Filas del archivo grande")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='s3_csv_check_')
+    try:
+        df = multiline_frame(args.rows)
+        multiline = os.path.join(work_dir, 'multilinea.csv')
+        df.to_csv(multiline, index=False)
+        bom = os.path.join(work_dir, 'bom.csv')
+        df.head(1_000).to_csv(bom, index=False, encoding='utf-8-sig')
+
+        results = [
+            check_case('saltos de linea', multiline),
+            check_case('columnas (mayusculas)', multiline, columns=['UPC', 'Final Price']),
+            check_case('BOM utf-8', bom),
+        ]
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if not all(results):
+        print(f"\n{results.count(False)} caso(s) distintos")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+import os
+import re
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import aws_session
+
+# ETL_CACHE_DIR y SNAPSHOT_REFRESH_TAIL_DAYS tambien pueden venir del .env
+aws_session.load_env()
+
+
+# Un snapshot es un archivo con fecha AAAA-MM-DD en el nombre
+Snapshot = namedtuple('Snapshot', ['date', 'key', 'etag', 'size'])
+
+DATE_REGEX = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+CACHE_DIR = os.getenv(
+    'ETL_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'etl_local')
+)
+
+# Cada cuanto se hace un listado completo (detecta archivos borrados o
+# llaves que no quedan al final en orden lexicografico)
+MANIFEST_MAX_AGE_SECONDS = 7 * 24 * 3600
+
+# En el listado incremental se vuelven a listar los archivos de los ultimos
+# N dias (respecto al mas reciente): si se resube un archivo con la misma
+# key (correr de nuevo el dia o un backfill) su ETag cambia y los caches
+# que usan key + ETag no deben quedarse con el anterior
+REFRESH_TAIL_DAYS = int(os.getenv('SNAPSHOT_REFRESH_TAIL_DAYS', 7))
+
+_CATALOGS = {}
+# Las etapas del ETL pueden pedir el mismo catalogo desde varios hilos
+_CATALOGS_LOCK = threading.Lock()
+
+
+def list_all_objects(s3_client, bucket, prefix, start_after=None):
+    """
+    Lista TODOS los objetos de un prefijo usando paginacion
+    (list_objects_v2 regresa maximo 1,000 objetos por llamada)
+    """
+    paginator = s3_client.get_paginator('list_objects_v2')
+    params = {'Bucket': bucket, 'Prefix': prefix}
+    if start_after:
+        params['StartAfter'] = start_after
+
+    objects = []
+    for page in paginator.paginate(**params):
+        objects.extend(page.get('Contents', []))
+    return objects
+
+
+def extract_date_from_key(key):
+    """Extrae la fecha AAAA-MM-DD del key, None si no tiene o es invalida"""
+    match = DATE_REGEX.search(key)
+    if not match:
+        return None
+    try:
+        return datetime.strptime(match.group(), "%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+class SnapshotCatalog:
+    """
+    Indice fecha -> key de los archivos fechados bajo un prefijo de S3.
+
+    El prefijo se lista una sola vez (paginado) y el indice se guarda en un
+    manifiesto local; las siguientes corridas solo listan con StartAfter lo
+    nuevo y los ultimos dias. Las consultas son busquedas binarias sobre
+    listas ordenadas.
+
+    Args:
+        s3_client: Cliente boto3 S3
+        bucket: Nombre del bucket
+        prefix: Prefijo donde estan los archivos historicos
+        manifest_dir: Carpeta del manifiesto local (None para no persistir)
+    """
+
+    def __init__(self, s3_client, bucket, prefix, manifest_dir=CACHE_DIR):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.manifest_path = None
+        if manifest_dir:
+            # El hash distingue prefijos que se verian igual en el nombre
+            # ('.../competitors' lista tambien 'competitors_hist', '.../competitors/' no)
+            digest = hashlib.sha256(f"{bucket}\x00{prefix}".encode('utf-8')).hexdigest()[:16]
+            safe_name = re.sub(r'[^A-Za-z0-9_.-]+', '_', f"{bucket}/{prefix}").strip('_')
+            self.manifest_path = os.path.join(manifest_dir, 'snapshots', f"{safe_name}_{digest}.json")
+
+        self.last_key = None
+        self.listed_at = 0
+        self.undated_keys = []
+        self._objects = {}
+        self._snapshots = []
+        self._dates = []
+        self._by_weekday = {}
+
+    # ------------------------------------------------------------------
+    # Construccion del indice
+    # ------------------------------------------------------------------
+
+    def refresh(self, full=False):
+        """
+        Actualiza el indice. Si hay manifiesto reciente solo lista los
+        objetos nuevos y los de los ultimos REFRESH_TAIL_DAYS dias (ETag y
+        tamaño frescos; los que ya no aparecen se borraron).
+        """
+        if not full and not self._objects:
+            self._load_manifest()
+
+        if full or not self._objects or time.time() - self.listed_at > MANIFEST_MAX_AGE_SECONDS:
+            self._objects = {}
+            objects = list_all_objects(self.s3_client, self.bucket, self.prefix)
+            self.listed_at = time.time()
+        else:
+            start_after = self._tail_start_after()
+            objects = list_all_objects(self.s3_client, self.bucket, self.prefix, start_after=start_after)
+            listed = {obj['Key'] for obj in objects}
+            for key in [k for k in self._objects if (start_after is None or k > start_after) and k not in listed]:
+                del self._objects[key]
+
+        for obj in objects:
+            self._objects[obj['Key']] = {
+                'etag': obj.get('ETag', '').strip('"'),
+                'size': obj.get('Size', 0)
+            }
+
+        if self._objects:
+            self.last_key = max(self._objects)
+
+        self._build_index()
+        self._save_manifest()
+        return self
+
+    def _tail_start_after(self):
+        """
+        StartAfter del listado incremental: la llave anterior (en orden
+        lexicografico) al primer archivo de los ultimos REFRESH_TAIL_DAYS
+        dias. Un solo listado regresa ese tramo y lo nuevo.
+        """
+        dated = [(extract_date_from_key(key), key) for key in self._objects]
+        dated = [(file_date, key) for file_date, key in dated if file_date is not None]
+        if not dated:
+            return self.last_key
+        cutoff = max(file_date for file_date, _ in dated) - timedelta(days=REFRESH_TAIL_DAYS)
+        first_tail_key = min(key for file_date, key in dated if file_date >= cutoff)
+        previous = [key for key in self._objects if key < first_tail_key]
+        return max(previous) if previous else None
+
+    def _build_index(self):
+        snapshots = []
+        undated = []
+        for key, meta in self._objects.items():
+            file_date = extract_date_from_key(key)
+            if file_date is None:
+                undated.append(key)
+                continue
+            snapshots.append(Snapshot(file_date, key, meta['etag'], meta['size']))
+
+        snapshots.sort(key=lambda s: (s.date, s.key))
+        self._snapshots = snapshots
+        self._dates = [s.date for s in snapshots]
+        self.undated_keys = sorted(undated)
+
+        self._by_weekday = {}
+        for pos, snapshot in enumerate(snapshots):
+            self._by_weekday.setdefault(snapshot.date.weekday(), []).append(pos)
+
+    def _load_manifest(self):
+        if not self.manifest_path or not os.path.exists(self.manifest_path):
+            return
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._objects = manifest.get('objects', {})
+        self.last_key = manifest.get('last_key')
+        self.listed_at = manifest.get('listed_at', 0)
+
+    def _save_manifest(self):
+        if not self.manifest_path:
+            return
+        os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        # Temporal unico: varios procesos pueden guardar el mismo prefijo
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.manifest_path), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({
+                'bucket': self.bucket,
+                'prefix': self.prefix,
+                'last_key': self.last_key,
+                'listed_at': self.listed_at,
+                'objects': self._objects
+            }, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+
+    def __len__(self):
+        return len(self._snapshots)
+
+    def snapshots(self):
+        """Todos los snapshots ordenados por (fecha, key)"""
+        return list(self._snapshots)
+
+    def latest(self):
+        """Snapshot mas reciente (None si no hay)"""
+        return self.latest_before(None)
+
+    def latest_before(self, before=None):
+        """
+        Snapshot mas reciente con fecha estrictamente menor a `before`
+        (sin limite si before es None). Si hay varios archivos con la
+        misma fecha regresa el primero en orden de key.
+        """
+        if before is None:
+            pos = len(self._dates)
+        else:
+            pos = bisect_left(self._dates, before)
+        if pos == 0:
+            return None
+        first_same_date = bisect_left(self._dates, self._dates[pos - 1])
+        return self._snapshots[first_same_date]
+
+    def last_n(self, n, weekday=None, before=None):
+        """
+        Ultimos n snapshots del mas reciente al mas antiguo, opcionalmente
+        solo de un dia de la semana (0=lunes, 1=martes, ...).
+        """
+        end = len(self._dates) if before is None else bisect_left(self._dates, before)
+        if weekday is None:
+            positions = range(max(end - n, 0), end)
+        else:
+            weekday_positions = self._by_weekday.get(weekday, [])
+            cut = bisect_left(weekday_positions, end)
+            positions = weekday_positions[max(cut - n, 0):cut]
+        return [self._snapshots[pos] for pos in reversed(positions)]
+
+    def in_range(self, start, end):
+        """Snapshots con start <= fecha <= end, ordenados por fecha"""
+        return self._snapshots[bisect_left(self._dates, start):bisect_right(self._dates, end)]
+
+    def count_weekday(self, weekday):
+        """Numero de snapshots de un dia de la semana"""
+        return len(self._by_weekday.get(weekday, []))
+
+
+def get_catalog(s3_client, bucket, prefix, refresh=True):
+    """
+    Regresa el catalogo compartido del prefijo. Dentro de un mismo proceso
+    el prefijo se lista una sola vez aunque varias etapas lo consulten.
+    """
+    cache_key = (bucket, prefix)
+    with _CATALOGS_LOCK:
+        catalog = _CATALOGS.get(cache_key)
+        if catalog is None:
+            catalog = SnapshotCatalog(s3_client, bucket, prefix)
+            if refresh:
+                catalog.refresh()
+            _CATALOGS[cache_key] = catalog
+    return catalog
+
+
+def invalidate_catalog(bucket, prefix):
+    """Olvida el catalogo en memoria (por ejemplo despues de subir un archivo nuevo)"""
+    with _CATALOGS_LOCK:
+        _CATALOGS.pop((bucket, prefix), None)
@@ -0,0 +1,270 @@
+"""
+Grafo de etapas para los ETL: cada etapa declara de que etapas toma su
+entrada y un executor corre en paralelo (hilos) las que ya tienen todo
+listo, asi el tiempo total queda acotado por la ruta critica y no por la
+suma de todas las descargas.
+
+Propiedad de la memoria entre etapas: el resultado de una etapa se libera
+en cuanto terminan todas las etapas que lo usan (salvo los que se piden en
+run(keep=...)), y una etapa que modifica una de sus entradas la declara en
+`mutates` para recibir su propia copia si alguien mas la sigue usando.
+"""
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import pandas as pd
+
+import memory_usage
+import tracing
+
+
+class Stage:
+    """
+    Etapa del grafo.
+
+    Args:
+        name: Nombre (tambien es el nombre de su resultado)
+        func: Funcion que recibe los resultados de `inputs` en ese orden
+        inputs: Etapas cuyos resultados recibe
+        after: Etapas que deben terminar antes aunque no use su resultado
+            (por ejemplo leer el historico antes de subir el archivo nuevo)
+        mutates: Entradas (de `inputs`) que la etapa modifica en el lugar
+    """
+
+    def __init__(self, name, func, inputs=(), after=(), mutates=()):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.after = list(after)
+        self.mutates = list(mutates)
+        unknown = [dep for dep in self.mutates if dep not in self.inputs]
+        if unknown:
+            raise ValueError(f"La etapa '{name}' modifica entradas que no recibe: {unknown}")
+
+    @property
+    def dependencies(self):
+        return self.inputs + [dep for dep in self.after if dep not in self.inputs]
+
+
+class StageGraph:
+    """
+    Grafo de etapas con executor concurrente.
+
+    Args:
+        name: Nombre del proceso (para los logs)
+        log: Funcion de log (message, level)
+    """
+
+    def __init__(self, name, log=None):
+        self.name = name
+        self.stages = {}
+        self.timings = {}
+        self.log = log or (lambda message, level="INFO": print(f"[{level}] {message}"))
+
+    def add(self, name, func, inputs=(), after=(), mutates=()):
+        if name in self.stages:
+            raise ValueError(f"Etapa duplicada: {name}")
+        self.stages[name] = Stage(name, func, inputs, after, mutates)
+        return func
+
+    def stage(self, name=None, inputs=(), after=(), mutates=()):
+        """Decorador equivalente a add()"""
+        def decorator(func):
+            return self.add(name or func.__name__, func, inputs, after, mutates)
+        return decorator
+
+    def topological_order(self):
+        """Orden de ejecucion secuencial; falla si hay dependencias faltantes o ciclos"""
+        for stage in self.stages.values():
+            missing = [dep for dep in stage.dependencies if dep not in self.stages]
+            if missing:
+                raise ValueError(f"La etapa '{stage.name}' depende de etapas inexistentes: {missing}")
+
+        order = []
+        state = {}
+
+        def visit(name, path):
+            if state.get(name) == 'done':
+                return
+            if state.get(name) == 'visiting':
+                raise ValueError(f"Ciclo en el grafo de etapas: {' -> '.join(path + [name])}")
+            state[name] = 'visiting'
+            for dep in self.stages[name].dependencies:
+                visit(dep, path + [name])
+            state[name] = 'done'
+            order.append(name)
+
+        for name in self.stages:
+            visit(name, [])
+        return order
+
+    def _arguments(self, stage, results, consumers, keep):
+        """
+        Entradas de la etapa; las que modifica se copian si otra etapa
+        pendiente (o el resultado final) todavia las necesita.
+        """
+        arguments = []
+        for dep in stage.inputs:
+            value = results[dep]
+            shared = consumers[dep] > 1 or keep is None or dep in keep
+            if dep in stage.mutates and shared and isinstance(value, (pd.DataFrame, pd.Series)):
+                value = memory_usage.private_copy(value)
+            arguments.append(value)
+        return arguments
+
+    def _release(self, stage, results, consumers, keep):
+        """Libera los resultados que ya nadie va a usar"""
+        for dep in set(stage.inputs):
+            consumers[dep] -= 1
+            if consumers[dep] == 0 and keep is not None and dep not in keep:
+                results.pop(dep, None)
+
+    def _run_stage(self, stage, arguments):
+        start = time.perf_counter()
+        self.timings[stage.name] = {
+            'start': start,
+            'thread': threading.current_thread().name,
+            'rss_start': self._sampler.sample()
+        }
+        self.log(f"[etapa] Inicia {stage.name}")
+        try:
+            with tracing.span(stage.name, stage=True) as span:
+                result = stage.func(*arguments)
+                if isinstance(result, pd.DataFrame):
+                    span.set(rows_out=len(result))
+                return result
+        finally:
+            del arguments[:]
+            end = time.perf_counter()
+            self.timings[stage.name].update({
+                'end': end,
+                'seconds': end - start,
+                'rss_end': self._sampler.sample()
+            })
+            self.log(f"[etapa] Termina {stage.name} ({end - start:.2f} s)")
+
+    def run(self, max_workers=4, keep=None):
+        """
+        Corre todas las etapas. Con max_workers=1 se corren en orden
+        topologico, una por una.
+
+        Args:
+            max_workers: Hilos del executor
+            keep: Etapas cuyo resultado se regresa; los demas resultados se
+                liberan en cuanto ya no los usa ninguna etapa (None = todos)
+
+        Returns:
+            dict etapa -> resultado
+        """
+        order = self.topological_order()
+        results = {}
+        done = set()
+        consumers = {name: 0 for name in self.stages}
+        for stage in self.stages.values():
+            for dep in set(stage.inputs):
+                consumers[dep] += 1
+        keep = set(keep) if keep is not None else None
+
+        self.timings = {}
+        self._sampler = memory_usage.RssSampler().start()
+        self._started = time.perf_counter()
+        try:
+            if max_workers is None or max_workers <= 1:
+                for name in order:
+                    stage = self.stages[name]
+                    results[name] = self._run_stage(stage, self._arguments(stage, results, consumers, keep))
+                    done.add(name)
+                    self._release(stage, results, consumers, keep)
+                return results
+
+            pending = list(order)
+            running = {}
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=self.name) as pool:
+                while pending or running:
+                    for name in list(pending):
+                        stage = self.stages[name]
+                        if all(dep in done for dep in stage.dependencies):
+                            pending.remove(name)
+                            arguments = self._arguments(stage, results, consumers, keep)
+                            # Los spans de la etapa cuelgan del span que corre el grafo
+                            running[pool.submit(tracing.propagate(self._run_stage), stage, arguments)] = name
+
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        name = running.pop(future)
+                        error = future.exception()
+                        if error is not None:
+                            self.log(f"[etapa] Fallo {name}: {error}", "ERROR")
+                            # No lanzar lo pendiente; esperar lo que ya corre
+                            pending.clear()
+                            for other in running:
+                                other.cancel()
+                            raise error
+                        results[name] = future.result()
+                        done.add(name)
+                        self._release(self.stages[name], results, consumers, keep)
+            return results
+        finally:
+            self._finished = time.perf_counter()
+            self._sampler.stop()
+            for timing in self.timings.values():
+                if 'end' in timing:
+                    samples = [timing['rss_start'], timing['rss_end'], self._sampler.peak_between(timing['start'], timing['end'])]
+                    samples = [rss for rss in samples if rss is not None]
+                    timing['rss_peak'] = max(samples) if samples else None
+
+    def critical_path(self):
+        """
+        Ruta mas larga (por duracion) de la ultima corrida.
+
+        Returns:
+            (etapas, segundos)
+        """
+        finish = {}
+        previous = {}
+        for name in self.topological_order():
+            if name not in self.timings or 'seconds' not in self.timings[name]:
+                continue
+            deps = [dep for dep in self.stages[name].dependencies if dep in finish]
+            best = max(deps, key=lambda dep: finish[dep], default=None)
+            finish[name] = self.timings[name]['seconds'] + (finish[best] if best else 0.0)
+            previous[name] = best
+
+        if not finish:
+            return [], 0.0
+        node = max(finish, key=finish.get)
+        total = finish[node]
+        path = []
+        while node:
+            path.append(node)
+            node = previous[node]
+        return path[::-1], total
+
+    def report(self):
+        """
+        Loguea la duracion y el pico de RSS de cada etapa, el total y la
+        ruta critica. El RSS es del proceso: con etapas en paralelo el pico
+        de una incluye lo que usaban las otras en ese momento.
+        """
+        if not self.timings:
+            return
+        self.log(f"Tiempos y memoria por etapa ({self.name}):")
+        for name in self.topological_order():
+            timing = self.timings.get(name)
+            if timing and 'seconds' in timing:
+                offset = timing['start'] - self._started
+                self.log(
+                    f"  {name:<28} inicio +{offset:7.2f} s  duracion {timing['seconds']:7.2f} s  "
+                    f"RSS pico {memory_usage.format_bytes(timing.get('rss_peak')):>12}  "
+                    f"al terminar {memory_usage.format_bytes(timing.get('rss_end')):>12}"
+                )
+        path, seconds = self.critical_path()
+        total = getattr(self, '_finished', time.perf_counter()) - self._started
+        suma = sum(timing.get('seconds', 0.0) for timing in self.timings.values())
+        self.log(f"  Total: {total:.2f} s (suma de etapas {suma:.2f} s)")
+        self.log(f"  Ruta critica ({seconds:.2f} s): {' -> '.join(path)}")
+        self.log(
+            f"  RSS maximo del proceso: {memory_usage.format_bytes(memory_usage.peak_rss())} "
+            f"(copy-on-write {'activo' if memory_usage.copy_on_write_enabled() else 'inactivo'})"
+        )
@@ -0,0 +1,157 @@
+import os
+import json
+from datetime import datetime, timedelta
+
+import aws_session
+from snapshot_catalog import CACHE_DIR
+
+# STORE_DATES_LOOKBACK_DAYS puede venir del .env
+aws_session.load_env()
+
+
+# Indice local store id -> ultima fecha con datos en la tabla raw
+INDEX_PATH = os.path.join(CACHE_DIR, 'store_latest_dates.json')
+
+# Dias hacia atras a revisar para store ids que no estan en el indice
+# (cubre el cambio de mes)
+LOOKBACK_DAYS = int(os.getenv('STORE_DATES_LOOKBACK_DAYS', 62))
+
+
+def load_index(path=INDEX_PATH):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_index(index, path=INDEX_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def record_dates(df, path=INDEX_PATH):
+    """
+    Actualiza el indice con la fecha maxima de cada store id de un
+    DataFrame recien cargado (columnas 'store id' y 'date' AAAA-MM-DD).
+    """
+    if df is None or len(df) == 0 or 'store id' not in df.columns or 'date' not in df.columns:
+        return
+    index = load_index(path)
+    df = df[df['date'].astype(str).str.match(r'\d{4}-\d{2}-\d{2}')]
+    latest = df.groupby('store id')['date'].max()
+    for store_id, str_date in latest.items():
+        str_date = str(str_date)[:10]
+        if str_date > index.get(store_id, ''):
+            index[store_id] = str_date
+    save_index(index, path)
+
+
+def month_partitions(start_date, end_date):
+    """Pares (year, month) entre dos fechas, incluyendo ambos extremos"""
+    partitions = []
+    year, month = start_date.year, start_date.month
+    while (year, month) <= (end_date.year, end_date.month):
+        partitions.append((str(year), str(month).zfill(2)))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return partitions
+
+
+def _partition_filter(partitions):
+    return "(" + " OR ".join(
+        f"(year = '{year}' AND month = '{month}')" for year, month in partitions
+    ) + ")"
+
+
+def resolve_latest_dates(channels, store_ids, target_date, session, database, s3_output, path=INDEX_PATH):
+    """
+    Regresa {store id: ultima fecha <= target_date} usando el indice local.
+
+    Solo se consulta Athena por lo que el indice no sabe: para cada store id
+    se buscan fechas posteriores a la ultima conocida (o LOOKBACK_DAYS hacia
+    atras si no se conoce o es posterior a la fecha objetivo), restringido a
+    las particiones year/month de ese rango. Nunca se revisa mas atras de
+    LOOKBACK_DAYS: los store ids cuya ultima fecha es anterior dejaron de
+    publicar y no se regresan (su ultimo dia no es un dato actual).
+    """
+    str_target = target_date.strftime('%Y-%m-%d')
+    index = load_index(path)
+
+    known = {}
+    pending = []
+    for store_id in store_ids:
+        str_date = index.get(store_id)
+        if str_date is not None and str_date <= str_target:
+            known[store_id] = str_date
+        else:
+            pending.append(store_id)
+
+    # Ya se tiene la fecha objetivo para todos: no puede haber nada mas nuevo
+    if not pending and all(str_date == str_target for str_date in known.values()):
+        return known
+
+    lookback_start = (target_date - timedelta(days=LOOKBACK_DAYS)).strftime('%Y-%m-%d')
+    stale = [s for s in known if known[s] < str_target]
+    starts = [known[s] for s in stale]
+    if pending:
+        starts.append(lookback_start)
+    str_start = max(min(starts), lookback_start)
+    to_check = stale + pending
+
+    partitions = month_partitions(datetime.strptime(str_start, '%Y-%m-%d'), target_date)
+
+    sql_query = f"""
+        SELECT "store id", MAX(date) as max_date
+        FROM {database}
+        WHERE "store id" IN ('{"', '".join(to_check)}')
+          AND channel IN ('{"', '".join(channels)}')
+          AND {_partition_filter(partitions)}
+          AND date > '{str_start}'
+          AND date <= '{str_target}'
+        GROUP BY "store id"
+    """
+    import awswrangler as wr
+
+    df_dates = wr.athena.read_sql_query(
+        sql=sql_query,
+        database=database,
+        boto3_session=session,
+        s3_output=s3_output,
+    )
+
+    for store_id, str_date in zip(df_dates['store id'], df_dates['max_date']):
+        str_date = str(str_date)[:10]
+        if str_date > known.get(store_id, ''):
+            known[store_id] = str_date
+        if str_date > index.get(store_id, ''):
+            index[store_id] = str_date
+    save_index(index, path)
+
+    expired = sorted(s for s in known if known[s] <= lookback_start)
+    if expired:
+        print(f"Store ids sin datos en los ultimos {LOOKBACK_DAYS} dias (se omiten): {', '.join(expired)}")
+    return {s: str_date for s, str_date in known.items() if str_date > lookback_start}
+
+
+def build_pruned_query(channels, latest_dates, database):
+    """
+    Query que trae solo el dia mas reciente de cada store id, filtrando por
+    las particiones year/month de ese dia (funciona aunque los store ids
+    tengan su ultimo dia en meses distintos).
+    """
+    conditions = []
+    for store_id, str_date in sorted(latest_dates.items()):
+        year, month = str_date[:4], str_date[5:7]
+        conditions.append(
+            f"(\"store id\" = '{store_id}' AND year = '{year}' AND month = '{month}' AND date = '{str_date}')"
+        )
+
+    return f"""
+        SELECT *
+        FROM {database}
+        WHERE channel IN ('{"', '".join(channels)}')
+          AND ({" OR ".join(conditions)})
+    """
@@ -0,0 +1,243 @@
+"""
+Datos sinteticos de competidores con la forma del resultado de Athena, para
+medir functions_db a escala de produccion sin tocar datos reales.
+
+Todo viene como string (igual que Athena) e incluye lo que la limpieza
+tiene que resolver: fechas en varios formatos (AAAA-MM-DD, AAAA/MM/DD,
+DD-MM-AAAA), precios con $, comas y corchetes, UPCs con ceros a la
+izquierda o ".0", filas sin UPC/SKU/final price, store ids de promociones
+sin precio y filas duplicadas. Con la misma semilla se generan los mismos
+datos.
+
+Uso:
+    df = synthetic_data.generate_raw_data(1_000_000, client='isdin')
+    df_previo = synthetic_data.generate_previous_snapshot(df_limpio)
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import clients_config
+
+# Columnas que regresa Athena: las de competidores sin las que agrega la
+# limpieza, mas las particiones
+RAW_COLUMNS = [c for c in clients_config.COMPETITOR_COLUMNS if c not in ('upc wm2', 'comp')]
+PARTITION_COLUMNS = ['year', 'month', 'channel']
+
+# Store ids de promociones (sus filas pueden venir sin final price)
+PROMO_STORE_IDS = ["9999_farmaciasdelahorro_promos", "9999_benavides_promos"]
+
+DATE_FORMATS = ['%Y-%m-%d', '%Y/%m/%d', '%d-%m-%Y']
+
+# Formatos de precio: 0 = 123.45, 1 = $123.45, 2 = $1,234.50, 3 = [123.45], 4 = 123
+PRICE_STYLES = 5
+
+SALES_FLAGS = ['', '', '', '2x1', '15% de descuento', '3 MSI', 'Precio exclusivo en línea']
+CATEGORIES = ['Dermocosméticos', 'Farmacia', 'Cuidado personal', 'Higiene bucal', 'Bebés', 'Vitaminas']
+BRANDS = ['Isdin', 'Bioderma', 'La Roche-Posay', 'Vichy', 'Eucerin', 'Cetaphil', 'Avène', 'Genérico']
+
+
+def _format_price(cents, style):
+    value = cents / 100
+    if style == 1:
+        return f"${value:.2f}"
+    if style == 2:
+        return f"${value:,.2f}"
+    if style == 3:
+        return f"[{value:.2f}]"
+    if style == 4:
+        return str(int(round(value)))
+    return f"{value:.2f}"
+
+
+def format_prices(cents, styles):
+    """
+    Precios en centavos -> texto con el formato de cada fila. Solo se
+    formatea cada combinacion (precio, formato) distinta una vez.
+    """
+    codes = cents.astype('int64') * PRICE_STYLES + styles
+    unique_codes, inverse = np.unique(codes, return_inverse=True)
+    texts = np.array(
+        [_format_price(code // PRICE_STYLES, code % PRICE_STYLES) for code in unique_codes],
+        dtype=object
+    )
+    return texts[inverse]
+
+
+def _store_layout(client, store_ids, channels):
+    """Store ids (con los de promociones) y el canal de cada uno"""
+    config = clients_config.CLIENTS[client]
+    store_ids = list(store_ids or config['store_ids'])
+    channels = list(channels or config['channels'])
+    for promo in PROMO_STORE_IDS:
+        if promo not in store_ids:
+            store_ids.append(promo)
+    store_channels = [channels[i % len(channels)] for i in range(len(store_ids))]
+    return store_ids, store_channels
+
+
+def generate_raw_data(
+    rows,
+    seed=0,
+    client='isdin',
+    target_date=None,
+    products=None,
+    store_ids=None,
+    channels=None,
+    invalid_rate=0.03,
+    duplicate_rate=0.05,
+    promo_missing_rate=0.3
+):
+    """
+    DataFrame crudo con la forma de load_raw_data_from_athena (antes de
+    quitar las particiones).
+
+    Args:
+        rows: Filas a generar (10k a 10M)
+        seed: Semilla del generador
+        client: Cliente de clients_config del que se toman store ids y canales
+        target_date: Fecha de los datos (default: hoy)
+        products: Productos distintos (default: rows // 4, minimo 1,000)
+        store_ids, channels: Sustituyen los del cliente
+        invalid_rate: Fraccion de filas sin UPC, SKU o final price validos
+        duplicate_rate: Fraccion de filas que son copia de otra
+        promo_missing_rate: Fraccion de filas de promociones sin final price
+
+    Returns:
+        DataFrame con RAW_COLUMNS + PARTITION_COLUMNS, todo como string
+    """
+    rng = np.random.default_rng(seed)
+    target_date = target_date or datetime.now()
+    products = products or max(1_000, rows // 4)
+    store_ids, store_channels = _store_layout(client, store_ids, channels)
+
+    n_duplicates = int(rows * duplicate_rate)
+    n_base = rows - n_duplicates
+
+    # Catalogo de productos: sku, upc, precio base y descripcion
+    product_ids = np.arange(products)
+    product_sku = np.array([f"{700000 + p}" for p in product_ids], dtype=object)
+    product_upc = np.array([f"{7501000000000 + p * 7:013d}" for p in product_ids], dtype=object)
+    product_upc_wm = np.array([f"{7501000000000 + p * 7:016d}" for p in product_ids], dtype=object)
+    product_item = np.array([f"Producto {p}" for p in product_ids], dtype=object)
+    product_url = np.array([f"https://tienda.example/p/{700000 + p}" for p in product_ids], dtype=object)
+    product_image = np.array([f"https://img.example/{700000 + p}.jpg" for p in product_ids], dtype=object)
+    product_cents = rng.integers(2_000, 900_000, products)
+
+    store_index = rng.integers(0, len(store_ids), n_base)
+    product_index = rng.integers(0, products, n_base)
+
+    store_ids_arr = np.array(store_ids, dtype=object)
+    store_channels_arr = np.array(store_channels, dtype=object)
+    store_canal_arr = np.array([f"{channel} - Online" for channel in store_channels], dtype=object)
+    store_name_arr = np.array([f"Tienda {store_id}" for store_id in store_ids], dtype=object)
+
+    # Cada store id entrega su fecha en un formato
+    previous_date = target_date - timedelta(days=1)
+    store_dates = np.array([
+        (target_date if i % 4 else previous_date).strftime(DATE_FORMATS[i % len(DATE_FORMATS)])
+        for i in range(len(store_ids))
+    ], dtype=object)
+
+    # Precio de la fila: precio base con descuento ocasional
+    discount = np.where(rng.random(n_base) < 0.2, rng.integers(5, 40, n_base), 0)
+    price_cents = product_cents[product_index]
+    final_cents = price_cents * (100 - discount) // 100
+    price_styles = rng.integers(0, PRICE_STYLES, n_base)
+
+    # UPCs como los deja leer un CSV: ceros extra a la izquierda o ".0"
+    upc = product_upc[product_index]
+    upc_style = rng.random(n_base)
+    padded = upc_style < 0.1
+    as_float = (upc_style >= 0.1) & (upc_style < 0.15)
+    upc[padded] = '00' + upc[padded]
+    upc[as_float] = upc[as_float] + '.0'
+
+    df = pd.DataFrame({
+        'date': store_dates[store_index],
+        'canal': store_canal_arr[store_index],
+        'category': np.array(CATEGORIES, dtype=object)[product_index % len(CATEGORIES)],
+        'subcategory': np.array(CATEGORIES, dtype=object)[(product_index // 7) % len(CATEGORIES)],
+        'subcategory2': '',
+        'subcategory3': '',
+        'marca': np.array(BRANDS, dtype=object)[product_index % len(BRANDS)],
+        'modelo': '',
+        'sku': product_sku[product_index],
+        'upc': upc,
+        'item': product_item[product_index],
+        'item characteristics': '',
+        'url sku': product_url[product_index],
+        'image': product_image[product_index],
+        'price': format_prices(price_cents, price_styles),
+        'sale price': np.where(discount > 0, format_prices(final_cents, price_styles), ''),
+        'shipment cost': '',
+        'sales flag': np.array(SALES_FLAGS, dtype=object)[rng.integers(0, len(SALES_FLAGS), n_base)],
+        'store id': store_ids_arr[store_index],
+        'store name': store_name_arr[store_index],
+        'store address': '',
+        'stock': np.array(['0', '1.0', '5.0', '12', '30.0', '100'], dtype=object)[rng.integers(0, 6, n_base)],
+        'final price': format_prices(final_cents, price_styles),
+        'upc wm': product_upc_wm[product_index],
+        'year': str(target_date.year),
+        'month': str(target_date.month).zfill(2),
+        'channel': store_channels_arr[store_index],
+    })
+
+    # Filas invalidas (sin UPC, sin SKU o sin final price)
+    invalid = rng.random(n_base) < invalid_rate
+    kind = rng.integers(0, 3, n_base)
+    invalid_values = np.array(['', '0', 'nan', None], dtype=object)
+    bad_upc = invalid & (kind == 0)
+    bad_sku = invalid & (kind == 1)
+    bad_price = invalid & (kind == 2)
+    df.loc[bad_upc, 'upc'] = invalid_values[rng.integers(0, 4, int(bad_upc.sum()))]
+    df.loc[bad_sku, 'sku'] = np.array(['', 'nan', None], dtype=object)[rng.integers(0, 3, int(bad_sku.sum()))]
+    df.loc[bad_price, 'final price'] = invalid_values[rng.integers(0, 4, int(bad_price.sum()))]
+
+    # Promociones sin final price (la limpieza las conserva)
+    promo = df['store id'].isin(PROMO_STORE_IDS).to_numpy() & (rng.random(n_base) < promo_missing_rate)
+    df.loc[promo, 'final price'] = ''
+
+    if n_duplicates:
+        duplicates = df.take(rng.integers(0, n_base, n_duplicates))
+        df = pd.concat([df, duplicates], ignore_index=True)
+
+    return df[RAW_COLUMNS + PARTITION_COLUMNS]
+
+
+def iter_raw_chunks(rows, chunksize, seed=0, **kwargs):
+    """
+    Los mismos datos de generate_raw_data en bloques (para run_chunked_etl),
+    cada bloque con su propia semilla y el mismo catalogo de productos.
+    """
+    products = kwargs.pop('products', None) or max(1_000, rows // 4)
+    for number, start in enumerate(range(0, rows, chunksize)):
+        yield generate_raw_data(min(chunksize, rows - start), seed=seed + number, products=products, **kwargs)
+
+
+def generate_previous_snapshot(df_clean, seed=1, change_rate=0.1, missing_rate=0.05):
+    """
+    Snapshot "anterior" a partir de datos ya limpios: quita una fraccion
+    de filas (productos nuevos) y cambia el precio de otra (last_price).
+
+    Args:
+        df_clean: Resultado de clean_competitor_data
+        seed: Semilla del generador
+        change_rate: Fraccion de filas con precio distinto
+        missing_rate: Fraccion de filas que no estaban en el snapshot anterior
+
+    Returns:
+        DataFrame con las mismas columnas, listo para save_to_s3
+    """
+    rng = np.random.default_rng(seed)
+    df = df_clean[rng.random(len(df_clean)) >= missing_rate].reset_index(drop=True)
+
+    prices = pd.to_numeric(df['final price'], errors='coerce').to_numpy()
+    changed = (rng.random(len(df)) < change_rate) & ~np.isnan(prices)
+    factors = rng.uniform(0.8, 1.2, int(changed.sum()))
+    new_cents = np.round(prices[changed] * factors * 100).astype('int64')
+    final_price = df['final price'].to_numpy(dtype=object).copy()
+    final_price[changed] = format_prices(new_cents, np.zeros(len(new_cents), dtype='int64'))
+    df['final price'] = final_price
+    return df
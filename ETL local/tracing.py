@@ -0,0 +1,299 @@
+"""
+Trazas por corrida de los ETL: spans con duracion, filas de entrada y
+salida, bytes leidos/escritos en S3 y cambio de RSS.
+
+Un span es un context manager; los spans abiertos dentro de otro quedan
+como sus hijos (tambien en los hilos del grafo de etapas, que heredan el
+contexto). Los contadores (bytes, hits del cache) se suman al span actual
+y a todos sus padres, asi el span raiz tiene los totales de la corrida.
+
+Uso:
+    tracing.start_trace('isdin', date='2025-01-07')
+    with tracing.span('limpieza', rows_in=len(df)) as span:
+        df = limpiar(df)
+        span.set(rows_out=len(df))
+    tracing.add_bytes(read=len(body))
+    tracing.save_trace(s3_client, bucket, 'derivables/isdin/logs/trace_isdin_2025-01-07.json')
+
+Las funciones de functions_db se marcan con @tracing.traced(). Sin traza
+activa los spans se miden igual pero no se guardan.
+"""
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+import aws_session
+import memory_usage
+
+# ETL_TRACE_DIR puede venir del .env
+aws_session.load_env()
+
+# Carpeta local donde tambien se guarda cada traza (vacio = solo S3)
+TRACE_DIR = os.getenv('ETL_TRACE_DIR', '')
+
+_CURRENT_SPAN = contextvars.ContextVar('etl_span', default=None)
+_TRACE = None
+_TRACE_LOCK = threading.Lock()
+_SPAN_IDS = itertools.count(1)
+# Los hilos de una etapa suman a los contadores de los mismos padres
+_COUNTERS_LOCK = threading.Lock()
+
+
+class Span:
+    """
+    Un paso medido de la corrida.
+
+    Args:
+        name: Nombre del paso
+        parent: Span padre (None para los de primer nivel)
+        attrs: Atributos iniciales (rows_in, store_ids, ...)
+    """
+
+    def __init__(self, name, parent=None, **attrs):
+        self.id = next(_SPAN_IDS)
+        self.name = name
+        self.parent = parent
+        self.attrs = attrs
+        self.counters = {}
+        self.thread = threading.current_thread().name
+        self.status = 'ok'
+        self.error = None
+        self.start = time.perf_counter()
+        self.end = None
+        self.rss_start = memory_usage.current_rss()
+        self.rss_end = None
+
+    def set(self, **attrs):
+        """Agrega o reemplaza atributos (rows_out, archivo, ...)"""
+        self.attrs.update(attrs)
+        return self
+
+    def count(self, name, value=1):
+        """Suma value al contador name de este span y de sus padres"""
+        with _COUNTERS_LOCK:
+            span = self
+            while span is not None:
+                span.counters[name] = span.counters.get(name, 0) + value
+                span = span.parent
+
+    def finish(self, error=None):
+        self.end = time.perf_counter()
+        self.rss_end = memory_usage.current_rss()
+        if error is not None:
+            self.status = 'error'
+            self.error = f"{type(error).__name__}: {error}"
+
+    @property
+    def seconds(self):
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def to_dict(self, trace_start):
+        rss_delta = None
+        if self.rss_start is not None and self.rss_end is not None:
+            rss_delta = self.rss_end - self.rss_start
+        record = {
+            'id': self.id,
+            'parent': self.parent.id if self.parent is not None else None,
+            'name': self.name,
+            'thread': self.thread,
+            'start': round(self.start - trace_start, 4),
+            'seconds': round(self.seconds, 4),
+            'status': self.status,
+            'rss_end': self.rss_end,
+            'rss_delta': rss_delta,
+        }
+        record.update(self.attrs)
+        record.update(self.counters)
+        if self.error:
+            record['error'] = self.error
+        return record
+
+
+class Trace:
+    """Spans terminados de una corrida"""
+
+    def __init__(self, name, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started_at = datetime.now()
+        self.start = time.perf_counter()
+        self.spans = []
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def count(self, name, value):
+        """Contadores que llegan sin span abierto (hilos sin contexto)"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: (span.start, span.id))
+            counters = dict(self.counters)
+        return {
+            'trace': self.name,
+            'run_id': self.run_id,
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'seconds': round(time.perf_counter() - self.start, 4),
+            'peak_rss': memory_usage.peak_rss(),
+            'attrs': self.attrs,
+            'unattributed': counters,
+            'spans': [span.to_dict(self.start) for span in spans],
+        }
+
+
+def start_trace(name, **attrs):
+    """Empieza la traza de la corrida (reemplaza la anterior del proceso)"""
+    global _TRACE
+    with _TRACE_LOCK:
+        _TRACE = Trace(name, **attrs)
+        return _TRACE
+
+
+def current_trace():
+    return _TRACE
+
+
+def current_span():
+    return _CURRENT_SPAN.get()
+
+
+@contextmanager
+def span(name, **attrs):
+    """Context manager que mide un paso y lo agrega a la traza activa"""
+    trace = _TRACE
+    current = Span(name, _CURRENT_SPAN.get(), **attrs)
+    token = _CURRENT_SPAN.set(current)
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _CURRENT_SPAN.reset(token)
+        current.finish(error)
+        if trace is not None:
+            trace.add(current)
+
+
+def _rows(value):
+    """Filas de un DataFrame (o del primero de una tupla); None si no es uno"""
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    return len(value) if hasattr(value, 'shape') else None
+
+
+def traced(name=None):
+    """
+    Decorador: corre la funcion dentro de un span con rows_in (primer
+    argumento o df=) y rows_out (resultado) cuando son DataFrames.
+    """
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name) as current:
+                rows_in = _rows(args[0] if args else kwargs.get('df'))
+                if rows_in is not None:
+                    current.set(rows_in=rows_in)
+                result = func(*args, **kwargs)
+                rows_out = _rows(result)
+                if rows_out is not None:
+                    current.set(rows_out=rows_out)
+                return result
+        return wrapper
+    return decorator
+
+
+def count(name, value=1):
+    """Suma al contador del span actual (o de la traza si no hay span)"""
+    current = _CURRENT_SPAN.get()
+    if current is not None:
+        current.count(name, value)
+    elif _TRACE is not None:
+        _TRACE.count(name, value)
+
+
+def add_bytes(read=0, written=0):
+    """Bytes leidos/escritos en S3 por el paso actual"""
+    if read:
+        count('bytes_read', read)
+    if written:
+        count('bytes_written', written)
+
+
+def propagate(func):
+    """
+    func para otro hilo, con el span actual como padre de sus spans (y de
+    sus contadores). Se llama una vez por cada submit: un mismo contexto no
+    puede correr en dos hilos a la vez.
+    """
+    return functools.partial(contextvars.copy_context().run, func)
+
+
+def save_trace(s3_client, bucket, key):
+    """
+    Guarda la traza activa como JSON en S3 (y en ETL_TRACE_DIR si esta
+    definido). Un error al guardar no detiene el ETL.
+
+    Returns:
+        str: key guardada (None si no hay traza o no se pudo guardar)
+    """
+    trace = _TRACE
+    if trace is None:
+        return None
+    body = json.dumps(trace.to_dict(), ensure_ascii=False, indent=2, default=str)
+    try:
+        if TRACE_DIR:
+            os.makedirs(TRACE_DIR, exist_ok=True)
+            with open(os.path.join(TRACE_DIR, key.split('/')[-1]), 'w', encoding='utf-8') as f:
+                f.write(body)
+        s3_client.put_object(Bucket=bucket, Key=key, Body=body.encode('utf-8'), ContentType='application/json')
+        print(f"Traza guardada en: s3://{bucket}/{key}")
+        return key
+    except Exception as e:
+        print(f"⚠️  No se pudo guardar la traza: {str(e)}")
+        return None
+
+
+def print_summary(max_depth=1):
+    """Tabla de los spans de la traza activa hasta max_depth niveles"""
+    trace = _TRACE
+    if trace is None:
+        return
+    records = trace.to_dict()['spans']
+    depth = {}
+    print(f"\nTraza {trace.name} ({trace.run_id}):")
+    print(f"  {'Paso':<34} {'Segundos':>9} {'Filas ent.':>11} {'Filas sal.':>11} {'Leido':>11} {'Escrito':>11} {'RSS delta':>11}")
+    for record in records:
+        depth[record['id']] = depth.get(record['parent'], -1) + 1
+        if depth[record['id']] > max_depth:
+            continue
+        rows_in = f"{record['rows_in']:,}" if record.get('rows_in') is not None else '-'
+        rows_out = f"{record['rows_out']:,}" if record.get('rows_out') is not None else '-'
+        name = '  ' * depth[record['id']] + record['name'] + (' (error)' if record['status'] == 'error' else '')
+        print(
+            f"  {name:<34} {record['seconds']:>9.2f} {rows_in:>11} {rows_out:>11} "
+            f"{memory_usage.format_bytes(record.get('bytes_read', 0)):>11} "
+            f"{memory_usage.format_bytes(record.get('bytes_written', 0)):>11} "
+            f"{memory_usage.format_bytes(record.get('rss_delta')):>11}"
+        )
+
+
+def trace_key(logs_prefix, name, str_date):
+    """Key de la traza junto al reporte de validacion: <logs>/trace_<nombre>_<fecha>.json"""
+    return f"{logs_prefix.rstrip('/')}/trace_{name}_{str_date}.json"
@@ -0,0 +1,204 @@
+"""
+Indice de homologacion de UPCs (upc_extraccion -> upc_homologado).
+
+El archivo de homologacion se compila una vez por version (ETag) a un
+lookup ya resuelto:
+- las cadenas se resuelven transitivamente (A -> B, B -> C queda A -> C)
+- los ciclos (A -> B -> A) se detectan y esas llaves no se homologan
+- el lookup compilado se guarda en el cache local de agregados
+
+Aplicarlo es un solo get_indexer sobre los UPCs unicos, con conteo exacto
+de UPCs cambiados por canal.
+"""
+import numpy as np
+import pandas as pd
+
+import aggregate_cache
+import s3_csv
+import upc_utils
+
+
+SOURCE_COLUMN = 'upc_extraccion'
+TARGET_COLUMN = 'upc_homologado'
+
+# Version del lookup compilado; cambiarla si cambia la forma de compilar
+COMPILED_VERSION = 1
+
+
+def _clean(values):
+    """Mismo tratamiento que se le daba al archivo: str + strip"""
+    return values.astype(str).str.strip()
+
+
+def resolve_chains(mapping):
+    """
+    Resuelve las cadenas de un mapeo origen -> destino.
+
+    Args:
+        mapping: dict upc -> upc (sin llaves identidad)
+
+    Returns:
+        (resolved, cyclic): dict origen -> destino final y set de los
+        origenes que caen en un ciclo (o que llevan a uno)
+    """
+    resolved = {}
+    cyclic = set()
+
+    for start in mapping:
+        if start in resolved or start in cyclic:
+            continue
+
+        # Recorrer la cadena hasta un destino final, algo ya resuelto o un ciclo
+        path = []
+        on_path = set()
+        node = start
+        while node in mapping and node not in resolved and node not in cyclic:
+            if node in on_path:
+                break
+            path.append(node)
+            on_path.add(node)
+            node = mapping[node]
+
+        if node in on_path or node in cyclic:
+            cyclic.update(path)
+            continue
+
+        final = resolved.get(node, node)
+        for member in path:
+            resolved[member] = final
+
+    return resolved, cyclic
+
+
+class HomologationIndex:
+    """
+    Lookup compilado de homologacion.
+
+    Args:
+        sources: UPCs originales (upc_extraccion)
+        targets: UPCs homologados finales, alineados con sources
+        cyclic: UPCs que quedaron fuera por estar en un ciclo
+    """
+
+    def __init__(self, sources, targets, cyclic=()):
+        self.index = pd.Index(np.asarray(sources, dtype=object))
+        self.targets = np.asarray(targets, dtype=object)
+        self.cyclic = sorted(cyclic)
+
+    def __len__(self):
+        return len(self.index)
+
+    @classmethod
+    def from_pairs(cls, sources, targets):
+        """
+        Compila el indice a partir de los pares del archivo. Si un UPC
+        aparece varias veces como origen gana el ultimo (como el dict
+        que se usaba antes); los pares vacios o identidad se ignoran.
+        """
+        pairs = pd.DataFrame({
+            SOURCE_COLUMN: _clean(pd.Series(np.asarray(sources, dtype=object))),
+            TARGET_COLUMN: _clean(pd.Series(np.asarray(targets, dtype=object)))
+        })
+        missing = pairs.isin(upc_utils.MISSING_VALUES + ['']).any(axis=1)
+        pairs = pairs[~missing & (pairs[SOURCE_COLUMN] != pairs[TARGET_COLUMN])]
+
+        mapping = dict(zip(pairs[SOURCE_COLUMN], pairs[TARGET_COLUMN]))
+        resolved, cyclic = resolve_chains(mapping)
+        return cls(list(resolved.keys()), list(resolved.values()), cyclic)
+
+    @classmethod
+    def from_frame(cls, df):
+        """Compila desde el DataFrame del archivo de homologacion"""
+        df = df.rename(columns=str.lower)
+        return cls.from_pairs(df[SOURCE_COLUMN], df[TARGET_COLUMN])
+
+    def to_frame(self):
+        """Lookup compilado como DataFrame (para guardarlo en cache)"""
+        compiled = pd.DataFrame({
+            SOURCE_COLUMN: pd.Series(self.index, dtype=object),
+            TARGET_COLUMN: pd.Series(self.targets, dtype=object),
+            'ciclo': False
+        })
+        cyclic = pd.DataFrame({
+            SOURCE_COLUMN: pd.Series(self.cyclic, dtype=object),
+            TARGET_COLUMN: pd.Series([None] * len(self.cyclic), dtype=object),
+            'ciclo': True
+        })
+        return pd.concat([compiled, cyclic], ignore_index=True)
+
+    @classmethod
+    def from_compiled(cls, df):
+        """Reconstruye el indice a partir de to_frame()"""
+        cyclic = df['ciclo'].astype(bool)
+        return cls(df.loc[~cyclic, SOURCE_COLUMN], df.loc[~cyclic, TARGET_COLUMN], df.loc[cyclic, SOURCE_COLUMN])
+
+    def apply(self, upcs, channels=None):
+        """
+        Homologa una Series de UPCs.
+
+        Args:
+            upcs: Series de UPCs (strings)
+            channels: Series de canales alineada con upcs para el conteo
+                por canal (opcional)
+
+        Returns:
+            (homologated, changes): Series homologada con el mismo indice y
+            dict canal -> numero de UPCs cambiados ('total' si no hay canales)
+        """
+        codes, uniques = pd.factorize(upcs, use_na_sentinel=True)
+        positions = self.index.get_indexer(uniques)
+        found = positions >= 0
+
+        mapped = np.asarray(uniques, dtype=object).copy()
+        mapped[found] = self.targets[positions[found]]
+
+        changed_codes = found[codes] & (codes >= 0)
+        values = upcs.to_numpy(dtype=object, copy=True)
+        values[changed_codes] = mapped[codes[changed_codes]]
+        homologated = pd.Series(values, index=upcs.index, name=upcs.name)
+
+        if channels is None:
+            changes = {'total': int(changed_codes.sum())}
+        else:
+            changed_channels = pd.Series(channels).to_numpy(dtype=object)[changed_codes]
+            changes = {
+                channel: int(count)
+                for channel, count in pd.Series(changed_channels, dtype=object).value_counts(sort=False).items()
+            }
+        return homologated, changes
+
+
+def load_index(s3_client, bucket, key, etag=None, encoding='latin-1'):
+    """
+    Carga el indice de homologacion de S3, usando el lookup compilado del
+    cache local si ya se compilo esa version (ETag) del archivo.
+
+    Args:
+        s3_client: Cliente boto3 S3
+        bucket: Nombre del bucket
+        key: Key del CSV de homologacion
+        etag: ETag del objeto (del listado); sin ETag no se usa el cache
+        encoding: Encoding del CSV
+
+    Returns:
+        (HomologationIndex, from_cache)
+    """
+    cache_key = None
+    if etag:
+        cache_key = aggregate_cache.cache_key(
+            'upc_homologation', bucket, key, etag.strip('"'),
+            params={'version': COMPILED_VERSION}
+        )
+        compiled = aggregate_cache.load(cache_key)
+        if compiled is not None:
+            return HomologationIndex.from_compiled(compiled), True
+
+    df = s3_csv.read_csv_s3(s3_client, bucket, key, encoding=encoding)
+    index = HomologationIndex.from_frame(df)
+
+    if cache_key is not None:
+        try:
+            aggregate_cache.save(cache_key, index.to_frame())
+        except Exception as e:
+            print(f"⚠️  No se pudo guardar la homologacion compilada: {str(e)}")
+    return index, False
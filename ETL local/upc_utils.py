@@ -0,0 +1,159 @@
+"""
+Normalizacion vectorizada de UPC/EAN compartida por los ETL, los notebooks
+de relleno y los cruces de folletos.
+
+- clean_upc: texto limpio (sin espacios ni el ".0" que deja leer el CSV
+  como float, "nan"/"None" -> "")
+- strip_leading_zeros: llave de competidores en functions_db y yza_etl
+  (igual a la de los historicos ya escritos)
+- normalize_upc: clean_upc sin ceros a la izquierda (cruces dentro de una
+  misma corrida)
+- is_valid_gtin / gtin_check_digit: digito verificador GS1 (GTIN-8/12/13/14)
+- upc_wm_key: llave de 16 digitos estilo Walmart por canal
+- last_digits: ultimos n digitos (cruce de folletos por terminacion)
+"""
+import numpy as np
+import pandas as pd
+
+
+# Longitud de las llaves estilo Walmart (upc wm / upc llave)
+UPC_WM_LENGTH = 16
+
+# Los UPC de Walmart ya vienen sin digito verificador
+WALMART_CHANNEL_REGEX = r'Walmart|walmart'
+
+# Longitud minima para considerar que el ultimo digito es verificador
+MIN_LENGTH_WITH_CHECK_DIGIT = 8
+
+MISSING_VALUES = ['nan', 'None', 'NaN', '<NA>']
+
+
+def _as_series(values):
+    return values if isinstance(values, pd.Series) else pd.Series(values, dtype=object)
+
+
+def clean_upc(values):
+    """
+    Limpia UPCs como texto: quita espacios y el sufijo ".0" de los valores
+    que se leyeron como float (8429420260979.0 -> 8429420260979). Los
+    nulos y "nan"/"None" quedan como "".
+
+    Args:
+        values: Series (o lista) de UPCs
+
+    Returns:
+        Series de strings (dtype object) con el mismo indice
+    """
+    values = _as_series(values)
+    text = values.astype(object).where(values.notna(), '').astype(str).str.strip()
+    text = text.mask(text.isin(MISSING_VALUES), '')
+    return text.str.replace(r'^(\d+)\.0+$', r'\1', regex=True).astype(object)
+
+
+def strip_leading_zeros(values):
+    """Quita ceros a la izquierda (conserva nulos)"""
+    return _as_series(values).str.lstrip('0')
+
+
+def normalize_upc(values):
+    """
+    clean_upc sin ceros a la izquierda (00750123 -> 750123, 750123.0 ->
+    750123). No se usa para la llave de competidores: los historicos se
+    escribieron con "750123.0" y la llave tiene que coincidir con ellos.
+    """
+    return strip_leading_zeros(clean_upc(values))
+
+
+def _digit_matrix(values, width):
+    """Matriz (n, width) de digitos alineados a la derecha; solo para strings de digitos"""
+    padded = values.str.pad(width, side='left', fillchar='0')
+    raw = np.frombuffer(''.join(padded).encode('ascii'), dtype=np.uint8)
+    return (raw.reshape(len(padded), width) - ord('0')).astype(np.int64)
+
+
+def gtin_check_digit(bodies):
+    """
+    Digito verificador GS1 para cuerpos de GTIN (sin el digito verificador).
+    Los pesos 3,1,3,... se cuentan desde la derecha, asi que los ceros a la
+    izquierda no cambian el resultado.
+
+    Args:
+        bodies: Series de strings solo con digitos (hasta 13)
+
+    Returns:
+        Series de int (-1 donde el valor no es numerico o es muy largo)
+    """
+    bodies = _as_series(bodies).astype(str)
+    result = pd.Series(-1, index=bodies.index, dtype='int64')
+    valid = bodies.str.fullmatch(r'\d{1,13}')
+    if not valid.any():
+        return result
+
+    digits = _digit_matrix(bodies[valid], 13)
+    weights = np.tile([1, 3], 7)[1:]  # posicion 13 (la mas a la derecha) pesa 3
+    total = digits @ weights
+    result[valid] = (10 - total % 10) % 10
+    return result
+
+
+def is_valid_gtin(values):
+    """
+    Indica si cada valor es un GTIN-8/12/13/14 con digito verificador
+    correcto (despues de clean_upc; se aceptan ceros a la izquierda hasta 14
+    digitos).
+    """
+    upcs = clean_upc(values)
+    candidates = upcs.str.fullmatch(r'\d{8,14}')
+    result = pd.Series(False, index=upcs.index)
+    if not candidates.any():
+        return result
+
+    candidate_upcs = upcs[candidates]
+    check = gtin_check_digit(candidate_upcs.str[:-1])
+    result[candidates] = check.to_numpy() == candidate_upcs.str[-1].astype(int).to_numpy()
+    return result
+
+
+def upc_wm_key(upcs, channels, validate_check_digit=False):
+    """
+    Llave de 16 digitos estilo Walmart (upc wm / upc llave).
+
+    Para canales que no son Walmart se quita el ultimo caracter (digito
+    verificador) cuando el UPC tiene mas de 7 caracteres; los UPC de
+    Walmart ya vienen sin el. Despues se rellena con ceros a la izquierda
+    hasta 16.
+
+    Args:
+        upcs: Series de UPCs (se convierten con str(), igual que antes)
+        channels: Series de canales alineada con upcs, o un solo canal
+        validate_check_digit: Solo quitar el ultimo digito si es un digito
+            verificador GTIN valido
+
+    Returns:
+        Series de strings
+    """
+    upcs = _as_series(upcs)
+    text = upcs.astype(str).str.strip()
+
+    if isinstance(channels, str):
+        is_walmart = pd.Series('walmart' in channels or 'Walmart' in channels, index=text.index)
+    else:
+        is_walmart = _as_series(channels).astype(str).str.contains(WALMART_CHANNEL_REGEX, regex=True)
+        is_walmart.index = text.index
+
+    drop_last = ~is_walmart & (text.str.len() > MIN_LENGTH_WITH_CHECK_DIGIT - 1)
+    if validate_check_digit:
+        drop_last &= is_valid_gtin(text)
+
+    text = text.where(~drop_last, text.str[:-1])
+    return text.str.pad(UPC_WM_LENGTH, side='left', fillchar='0')
+
+
+def last_digits(values, n=4):
+    """
+    Ultimos n digitos de cada codigo (ignorando cualquier otro caracter),
+    rellenados con ceros si tiene menos. Se usa para cruzar codigos de
+    folleto contra el catalogo por terminacion.
+    """
+    digits = clean_upc(values).str.replace(r'\D', '', regex=True)
+    return digits.str[-n:].str.pad(n, side='left', fillchar='0')
@@ -1,39 +1,40 @@
+import aws_session
+
+# El .env antes que los modulos que leen variables de entorno al importarse
+aws_session.load_env()
+
 import functions_db
-import price_change_notifier
+import clients_config
+import snapshot_catalog
+import s3_csv
+import parquet_history
+import upc_utils
+import upc_homologation
+import key_encoding
+import stage_graph
+import aggregate_cache
+import price_scenarios
+import memory_usage
+import profiling
+import tracing
 import os
-from dotenv import load_dotenv
-import boto3
 from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
 import re
 from io import StringIO
-from statistics import mean, median, mode, StatisticsError
+from concurrent.futures import ThreadPoolExecutor
 import traceback
 
-load_dotenv() 
-
-# Iniciar cliente para athena
-SESSION_ATHENA = boto3.Session(
-    region_name=os.getenv('AWS_DEFAULT_REGION'),
-    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-)
-
-# Iniciar cliente para s3
-SESSION_S3 = boto3.client(
-    's3',
-    region_name=os.getenv('AWS_DEFAULT_REGION'),
-    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-)
-
 # Configuracion
-LST_CHANNELS = ['farmaciasBenavides', 'farmaciasSanPablo', 'farmaciasdelahorro', 'farmaciasGDL', 'walmart', 'soriana', 'farmaciasDesimilares']
+CONFIG = clients_config.CLIENTS['yza']
+
+LST_CHANNELS = CONFIG['channels']
 
-LST_STORE_IDS = ["9999_benavides_promos", '9999_benavides', '9999_farmaciassanpablo', '9999_farmaciasdelahorro', '44100_farmaciasgdl','9999_farmaciasdelahorro_promos', '2345_walmart_retail', '9999_farmaciassimilares']
+LST_STORE_IDS = CONFIG['store_ids']
 
-STR_BUCKET_NAME = 'data-bunker-prod-env'
-STR_PREFIX_COMPETITORS = 'derivables/yza/competitors_hist/'
+STR_BUCKET_NAME = CONFIG['bucket']
+STR_PREFIX_COMPETITORS = CONFIG['prefix']
 STR_PREFIX_PERMANENCIA = 'derivables/yza/permanencia/'
 STR_PREFIX_MATCH = 'derivables/yza/match/'
 STR_PREFIX_CLIENT = 'derivables/yza/client/'
@@ -41,20 +42,40 @@ STR_PREFIX_UPC_HOMOLOGATION = 'derivables/yza/upc_files/'
 
 COMPETITORS_FLOAT_COLUMNS = ['price', 'final price', 'sale price']
 
-LST_ORDER_COLUMN = [
-    "Key", "date", "canal", "sku", "upc", "item", "image",
-    "price", "sale price", "sales flag", "upc llave", "final price",
-    "upc marca prop", "código interno 1", "category", "subcategory", "url sku", "upc_anterior", "store id", "last_price"
-]
+# Llave de producto por canal; se codifica a ids enteros una vez por corrida
+PRODUCT_KEY_COLUMNS = ['canal', 'sku', 'upc']
+
+LST_ORDER_COLUMN = CONFIG['order_columns']
 
 # Fechas
 TARGET_DATE = datetime.today()
 strToday = TARGET_DATE.strftime('%Y-%m-%d')
 dtLastMonth = TARGET_DATE - timedelta(days=1)
 
-FILE_NAME = f"yza_competitors_local_{strToday}.csv"
+FILE_NAME = CONFIG['file_name'].format(date=strToday)
 FILE_NAME_PERMANENCIA = "permanencia_precios.csv"
 
+# Permanencia: canales fuera del calculo y descargas de historicos en paralelo
+PERMANENCIA_CANALES_EXCLUIR = ["Farmacias del Ahorro - Promos", "Benavides - Plan de Lealtad"]
+# Ventana de semanas para los escenarios (N-K ... N-1): la actual + K-1 historicas
+PERMANENCIA_VENTANA = int(os.getenv('PERMANENCIA_VENTANA', price_scenarios.DEFAULT_WINDOW))
+if PERMANENCIA_VENTANA < price_scenarios.MIN_WINDOW:
+    raise ValueError(
+        f"PERMANENCIA_VENTANA={PERMANENCIA_VENTANA}: los escenarios necesitan al menos "
+        f"{price_scenarios.MIN_WINDOW} semanas"
+    )
+PERMANENCIA_SEMANAS_HISTORICAS = PERMANENCIA_VENTANA - 1
+# Solo se usan martes si hay al menos el doble de las semanas historicas
+# (6 con la ventana de 4); si no, los ultimos archivos de cualquier dia
+PERMANENCIA_MIN_MARTES = 2 * PERMANENCIA_SEMANAS_HISTORICAS
+PERMANENCIA_WORKERS = int(os.getenv('PERMANENCIA_WORKERS', PERMANENCIA_SEMANAS_HISTORICAS))
+
+# Version del agregado semanal cacheado; cambiarla si cambia la forma de agregar
+PERMANENCIA_AGGREGATE_VERSION = 1
+
+# Version del maestro de productos (match + client) cacheado
+MAESTRO_VERSION = 1
+
 
 def log_message(message, level="INFO"):
     """Funcion para escribir mensajes de log formateados"""
@@ -69,25 +90,16 @@ def homogenize_date_format(strDate):
     return strDate
 
 
-def read_csv_safe(s3_client, bucket, key):
+def read_csv_safe(s3_client, bucket, key, columns=None):
     """Lee un CSV de manera segura manejando diferentes formatos y errores"""
     try:
-        obj = s3_client.get_object(Bucket=bucket, Key=key)
-        df = pd.read_csv(
-            StringIO(obj['Body'].read().decode('utf-8')),
-            dtype=str
-        )
+        df = parquet_history.read_snapshot(s3_client, bucket, key, columns=columns)
         log_message(f"Archivo leido correctamente: {key} - {len(df)} filas")
         return df
     except Exception as e:
         log_message(f"Error leyendo archivo {key}: {str(e)}", "ERROR")
         try:
-            obj = s3_client.get_object(Bucket=bucket, Key=key)
-            df = pd.read_csv(
-                StringIO(obj['Body'].read().decode('utf-8')),
-                dtype=str,
-                on_bad_lines='skip'
-            )
+            df = s3_csv.read_csv_s3(s3_client, bucket, key, columns=columns, on_bad_lines='skip')
             log_message(f"Archivo leido con parametros alternativos: {key} - {len(df)} filas")
             return df
         except:
@@ -95,17 +107,24 @@ def read_csv_safe(s3_client, bucket, key):
             return None
 
 
-def marca_propia(competitors_df, match_df):
-    """Realiza el merge para obtener la informacion de match.csv"""
+def marca_propia(competitors_df, maestro_df):
+    """
+    Realiza el merge contra el maestro de productos (match.csv ya resuelto
+    con client.csv, ver construir_maestro_productos)
+    """
     merged_df = competitors_df.merge(
-        match_df,
+        maestro_df,
         left_on=["upc wm", "canal"],
         right_on=["upcwm_competitor", "competitor"],
-        how="left"
+        how="left",
+        indicator=True
     )
 
-    merged_df["upc marca prop"] = merged_df["upc_client"].fillna("")
-    merged_df["código interno 1"] = merged_df["sku_client"].fillna("")
+    # En el maestro los vacios de match ya son "" y un nulo solo puede
+    # venir del sku del client, que se conserva igual que antes
+    encontrado = merged_df["_merge"] == "both"
+    merged_df["upc marca prop"] = merged_df["upc_client"].where(encontrado, "")
+    merged_df["código interno 1"] = merged_df["sku_client"].where(encontrado, "")
     merged_df["Key"] = merged_df["canal"] + "_" + merged_df["upc wm"]
 
     output_df = merged_df[
@@ -117,50 +136,293 @@ def marca_propia(competitors_df, match_df):
     return output_df
 
 
-def actualizar_upc_y_codigo(output_df, client_df):
+def build_ean_index(client_df):
+    """
+    Indice ean wm -> (sku, ean wm) del archivo client, con la primera
+    aparicion de cada ean wm (la misma que tomaba la busqueda fila por fila)
+    """
+    mask_valido = client_df['ean wm'].notna() & ~client_df['ean wm'].isin(['', 'nan', 'None'])
+    ean_index = client_df.loc[mask_valido, ['ean wm', 'sku']]
+    ean_index = ean_index.drop_duplicates(subset='ean wm', keep='first')
+    return ean_index.set_index('ean wm', drop=False)
+
+
+@profiling.profiled
+def actualizar_upc_y_codigo(output_df, client_df, ean_index=None):
     """Actualiza UPC y codigo interno basado en el archivo client"""
-    df_actualizado = output_df.copy()
+    df_actualizado = memory_usage.private_copy(output_df)
 
     df_actualizado.loc[df_actualizado['upc marca prop'].isin(['nan', 'None']), 'upc marca prop'] = ''
     df_actualizado.loc[df_actualizado['upc wm'].isin(['nan', 'None']), 'upc wm'] = ''
-    client_df.loc[client_df['ean wm'].isin(['nan', 'None']), 'ean wm'] = ''
+    if client_df is not None:
+        client_df.loc[client_df['ean wm'].isin(['nan', 'None']), 'ean wm'] = ''
+
+    if ean_index is None:
+        ean_index = build_ean_index(client_df)
 
     mask_vacios = (df_actualizado['upc marca prop'] == '') | (df_actualizado['upc marca prop'].isna())
+    if not mask_vacios.any():
+        return df_actualizado
 
-    for idx in df_actualizado[mask_vacios].index:
-        upc_wm = df_actualizado.loc[idx, 'upc wm']
+    # Un solo join por ean wm para todas las filas sin upc marca prop
+    upc_wm = df_actualizado.loc[mask_vacios, 'upc wm']
+    encontrado = upc_wm.isin(ean_index.index).to_numpy()
+    coincidencia = ean_index.reindex(upc_wm.to_numpy())
 
-        if upc_wm != '':
-            coincidencia = client_df[client_df['ean wm'] == upc_wm]
+    df_actualizado.loc[mask_vacios, 'código interno 1'] = np.where(encontrado, coincidencia['sku'].to_numpy(dtype=object), '')
+    df_actualizado.loc[mask_vacios, 'upc marca prop'] = np.where(encontrado, coincidencia['ean wm'].to_numpy(dtype=object), '')
 
-            if not coincidencia.empty:
-                df_actualizado.loc[idx, 'código interno 1'] = coincidencia.iloc[0]['sku']
-                df_actualizado.loc[idx, 'upc marca prop'] = coincidencia.iloc[0]['ean wm']
-            else:
-                df_actualizado.loc[idx, 'código interno 1'] = ''
-                df_actualizado.loc[idx, 'upc marca prop'] = ''
+    return df_actualizado
+
+
+def construir_maestro_productos(match_df, client_df):
+    """
+    Une match.csv y client.csv en un maestro de productos con la llave
+    (competitor, upcwm_competitor) -> (upc_client, sku_client) ya
+    resuelta: si el match no trae upc_client se toma el sku/ean wm del
+    client por ean wm (lo mismo que hace actualizar_upc_y_codigo).
+
+    Args:
+        match_df: DataFrame de match.csv
+        client_df: DataFrame de client.csv
+
+    Returns:
+        (maestro, ean_index): maestro con las filas de match en el mismo
+        orden (marca_propia lo usa como match_df) e indice ean wm -> sku
+        para las filas que no estan en match
+    """
+    match_df.columns = match_df.columns.str.lower()
+    client_df.columns = client_df.columns.str.lower()
+
+    match_df["upcwm_competitor"] = match_df["upcwm_competitor"].astype(str).str.strip()
+    match_df["competitor"] = match_df["competitor"].astype(str).str.strip()
+    client_df["ean wm"] = client_df["ean wm"].astype(str).str.strip()
+
+    resuelto = actualizar_upc_y_codigo(
+        pd.DataFrame({
+            "upc wm": match_df["upcwm_competitor"],
+            "upc marca prop": match_df["upc_client"].fillna(""),
+            "código interno 1": match_df["sku_client"].fillna("")
+        }),
+        client_df
+    )
+    ean_index = build_ean_index(client_df)
+
+    maestro = pd.DataFrame({
+        "competitor": match_df["competitor"],
+        "upcwm_competitor": match_df["upcwm_competitor"],
+        "upc_client": resuelto["upc marca prop"],
+        "sku_client": resuelto["código interno 1"]
+    }).reset_index(drop=True)
+    return maestro, ean_index
+
+
+def cargar_maestro_productos(s3_client, bucket_name, match_object, client_object):
+    """
+    Maestro de productos (construir_maestro_productos) desde el cache
+    local; solo se descargan match.csv y client.csv y se vuelve a
+    construir cuando cambia el ETag de alguno de los dos.
+
+    Args:
+        s3_client: Cliente boto3 S3
+        bucket_name: Nombre del bucket
+        match_object: Objeto de match.csv del listado (Key, ETag)
+        client_object: Objeto de client.csv del listado (Key, ETag)
+
+    Returns:
+        (maestro, ean_index, from_cache)
+    """
+    match_key, client_key = match_object['Key'], client_object['Key']
+    match_etag = match_object.get('ETag', '').strip('"')
+    client_etag = client_object.get('ETag', '').strip('"')
+
+    cache_keys = None
+    if match_etag and client_etag:
+        params = {'client_key': client_key, 'client_etag': client_etag, 'version': MAESTRO_VERSION}
+        cache_keys = [
+            aggregate_cache.cache_key(name, bucket_name, match_key, match_etag, params=params)
+            for name in ('maestro_productos', 'maestro_ean_wm')
+        ]
+        maestro = aggregate_cache.load(cache_keys[0])
+        ean_index = aggregate_cache.load(cache_keys[1])
+        if maestro is not None and ean_index is not None:
+            return maestro, ean_index.set_index('ean wm', drop=False), True
+
+    match_df = s3_csv.read_csv_s3(s3_client, bucket_name, match_key)
+    log_message(f"Archivo match cargado: {len(match_df)} filas")
+    client_df = s3_csv.read_csv_s3(s3_client, bucket_name, client_key)
+    log_message(f"Archivo client cargado: {len(client_df)} filas")
+
+    maestro, ean_index = construir_maestro_productos(match_df, client_df)
+
+    if cache_keys is not None:
+        try:
+            aggregate_cache.save(cache_keys[0], maestro)
+            aggregate_cache.save(cache_keys[1], ean_index.reset_index(drop=True))
+        except Exception as e:
+            log_message(f"No se pudo guardar el maestro de productos en cache: {str(e)}", "WARN")
+    return maestro, ean_index, False
+
+
+def agregar_precios_semana(df, column_upc="upc llave", column_codint="código interno 1", column_price="final price", column_canal="canal"):
+    """
+    Agrega un consolidado semanal a precio promedio por llave
+    (upc llave-código interno-canal, upc llave).
+
+    Args:
+        df: DataFrame ya filtrado con las columnas de upc, código interno,
+            precio y canal
+
+    Returns:
+        DataFrame con columnas UPC_llave_cod_interno, upc llave y final price
+    """
+    df = memory_usage.private_copy(df[[column_upc, column_codint, column_price, column_canal]])
+    df[column_codint] = df[column_codint].astype(str)
+    df[column_upc] = df[column_upc].astype(str)
+    df[column_canal] = df[column_canal].astype(str)
+    df[column_codint] = df[column_codint].str.replace(r"\.0$", "", regex=True)
+
+    df[column_price] = pd.to_numeric(df[column_price], errors='coerce')
+
+    df["UPC_llave_cod_interno"] = df[column_upc] + "-" + df[column_codint] + "-" + df[column_canal]
+
+    return df.groupby(["UPC_llave_cod_interno", column_upc], as_index=False).agg({column_price: 'mean'})
+
+
+def cargar_agregado_historico(s3_client, bucket_name, snapshot):
+    """
+    Agregado semanal (agregar_precios_semana) de un archivo historico de
+    competidores. Los historicos no cambian, asi que el resultado se guarda
+    en el cache local con llave key + ETag y solo se descarga y agrega la
+    primera vez que se usa cada semana.
+
+    Args:
+        s3_client: Cliente boto3 S3
+        bucket_name: Nombre del bucket
+        snapshot: Snapshot del catalogo (date, key, etag, size)
+
+    Returns:
+        DataFrame agregado o None si no se pudo leer
+    """
+    column_upc = "upc llave"
+    column_codint = "código interno 1"
+    column_price = "final price"
+    column_canal = "canal"
+    required_columns = [column_upc, column_price, column_codint, column_canal]
+    key = snapshot.key
+
+    cache_key = None
+    if snapshot.etag:
+        cache_key = aggregate_cache.cache_key(
+            'permanencia_semana',
+            bucket_name,
+            key,
+            snapshot.etag,
+            params={'version': PERMANENCIA_AGGREGATE_VERSION, 'excluir': PERMANENCIA_CANALES_EXCLUIR}
+        )
+        df = aggregate_cache.load(cache_key)
+        if df is not None:
+            log_message(f"Agregado historico desde cache: {key} - {len(df)} filas")
+            return df
+
+    try:
+        df = read_csv_safe(s3_client, bucket_name, key, columns=required_columns)
+
+        if df is None or len(df) == 0:
+            log_message(f"No se pudo leer o archivo vacio: {key}", "ERROR")
+            return None
+
+        df.columns = [col.lower() for col in df.columns]
+
+        missing_columns = [col for col in required_columns if col not in df.columns]
+        if missing_columns:
+            log_message(f"Columnas no encontradas en {key}: {missing_columns}", "ERROR")
+            return None
+
+        df = df[~df[column_canal].isin(PERMANENCIA_CANALES_EXCLUIR)]
+        df = agregar_precios_semana(df)
+
+    except Exception:
+        log_message(f"Error procesando archivo historico {key}:", "ERROR")
+        log_message(traceback.format_exc(), "ERROR")
+        return None
+
+    if cache_key is not None:
+        try:
+            aggregate_cache.save(cache_key, df)
+        except Exception as e:
+            log_message(f"No se pudo guardar el agregado en cache: {str(e)}", "WARN")
+    return df
+
+
+def cargar_historicos_permanencia(s3_client, bucket_name, competitors_prefix):
+    """
+    Elige los PERMANENCIA_SEMANAS_HISTORICAS archivos historicos de la
+    permanencia (ultimos martes si hay PERMANENCIA_MIN_MARTES, si no los
+    ultimos archivos) y carga en paralelo su agregado semanal.
+
+    Returns:
+        list: [(snapshot, agregado o None), ...] de la semana mas reciente a
+            la mas antigua, o None si no hay suficientes archivos
+    """
+    try:
+        log_message("Buscando archivos historicos...")
+        catalog = snapshot_catalog.get_catalog(s3_client, bucket_name, competitors_prefix)
+
+        if len(catalog) == 0 and not catalog.undated_keys:
+            log_message(f"No se encontraron archivos en {competitors_prefix}", "ERROR")
+            return None
+
+        log_message(f"Archivos encontrados: {len(catalog) + len(catalog.undated_keys)}")
+        for key in catalog.undated_keys:
+            log_message(f"Archivo ignorado (sin fecha reconocida): {key.split('/')[-1]}")
+
+        martes_count = catalog.count_weekday(1)
+        log_message(f"Total de archivos con fecha valida: {len(catalog)}")
+        log_message(f"Archivos de martes encontrados: {martes_count}")
+
+        semanas = PERMANENCIA_SEMANAS_HISTORICAS
+        if martes_count >= PERMANENCIA_MIN_MARTES:
+            log_message(f"Usando {semanas} archivos de martes")
+            historicos = catalog.last_n(semanas, weekday=1)
         else:
-            df_actualizado.loc[idx, 'código interno 1'] = ''
-            df_actualizado.loc[idx, 'upc marca prop'] = ''
+            log_message(f"Solo hay {martes_count} archivos de martes, usando los ultimos {semanas} archivos disponibles")
+            historicos = catalog.last_n(semanas)
 
-    return df_actualizado
+        if len(historicos) < semanas:
+            log_message(f"No hay suficientes archivos historicos: {len(historicos)} de {semanas}", "ERROR")
+            return None
 
+        log_message(f"Archivos historicos a usar ({len(historicos)}):")
+        for snapshot in historicos:
+            log_message(f" - {snapshot.date.date()} ({snapshot.date.strftime('%A')}) - {snapshot.key}")
 
-def create_upc_wm(strUPC, strChannel=''):
-    """Crea el UPC WM con formato de 16 digitos"""
-    strUPC = str(strUPC).strip()
-    if 'Walmart' in strChannel or 'walmart' in strChannel:
-        pass
-    else:
-        if len(strUPC) > 7:
-            strUPC = strUPC[:-1]
-    while len(strUPC) < 16:
-        strUPC = '0' + strUPC
-    return strUPC
+        # Descargar y agregar los historicos en paralelo (o tomarlos del cache)
+        with ThreadPoolExecutor(max_workers=max(1, min(PERMANENCIA_WORKERS, len(historicos)))) as pool:
+            # Las descargas cuentan en el span de la etapa (tracing)
+            futures = [
+                pool.submit(tracing.propagate(cargar_agregado_historico), s3_client, bucket_name, snapshot)
+                for snapshot in historicos
+            ]
+            agregados = [future.result() for future in futures]
+
+        return list(zip(historicos, agregados))
 
+    except Exception as e:
+        log_message(f"Error cargando historicos de permanencia: {str(e)}", "ERROR")
+        log_message(traceback.format_exc(), "ERROR")
+        return None
 
-def procesar_permanencia(s3_client, consolidado_actual, bucket_name, competitors_prefix, client_prefix):
-    """Procesa la permanencia de precios"""
+
+@profiling.profiled
+def procesar_permanencia(s3_client, consolidado_actual, bucket_name, competitors_prefix, client_prefix, historicos=None):
+    """
+    Procesa la permanencia de precios
+
+    Args:
+        historicos: Resultado de cargar_historicos_permanencia ya cargado
+            (si es None se carga aqui)
+    """
     try:
         log_message("INICIO DE PROCESAMIENTO DE PERMANENCIA")
         log_message(f"Consolidado actual: {len(consolidado_actual)} filas")
@@ -169,9 +431,10 @@ def procesar_permanencia(s3_client, consolidado_actual, bucket_name, competitors
         column_codint = "código interno 1"
         column_price = "final price"
         column_canal = "canal"
-        canales_excluir = ["Farmacias del Ahorro - Promos", "Benavides - Plan de Lealtad"]
+        canales_excluir = PERMANENCIA_CANALES_EXCLUIR
 
-        df_actual = consolidado_actual.copy()
+        # Solo se filtra/renombra (nunca en el lugar), no hace falta copiarlo
+        df_actual = consolidado_actual
 
         expected_columns = {
             column_upc: column_upc,
@@ -205,114 +468,26 @@ def procesar_permanencia(s3_client, consolidado_actual, bucket_name, competitors
         df_actual = df_actual[~df_actual[column_canal].isin(canales_excluir)]
         log_message(f"Consolidado despues de filtro: {len(df_actual)} filas")
 
-        df_actual[column_codint] = df_actual[column_codint].astype(str)
-        df_actual[column_upc] = df_actual[column_upc].astype(str)
-        df_actual[column_canal] = df_actual[column_canal].astype(str)
-        df_actual[column_codint] = df_actual[column_codint].str.replace(r"\.0$", "", regex=True)
-
-        df_actual[column_price] = pd.to_numeric(df_actual[column_price], errors='coerce')
-
-        df_actual["UPC_llave_cod_interno"] = df_actual[column_upc] + "-" + df_actual[column_codint] + "-" + df_actual[column_canal]
-
-        df_actual = df_actual.groupby(["UPC_llave_cod_interno", column_upc], as_index=False).agg({column_price: 'mean'})
+        df_actual = agregar_precios_semana(df_actual, column_upc, column_codint, column_price, column_canal)
         log_message(f"Consolidado despues de agrupar: {len(df_actual)} filas")
 
-        df_actual = df_actual.rename(columns={column_price: "S43"})
+        df_actual = df_actual.rename(columns={column_price: "N-1"})
 
         dfs = [df_actual]
 
-        log_message("Buscando archivos historicos...")
-        response = s3_client.list_objects_v2(Bucket=bucket_name, Prefix=competitors_prefix)
-
-        if 'Contents' not in response:
-            log_message(f"No se encontraron archivos en {competitors_prefix}", "ERROR")
-            return None
-
-        files = response.get("Contents", [])
-        log_message(f"Archivos encontrados: {len(files)}")
-
-        file_dates = []
-        martes_count = 0
-        for obj in files:
-            key = obj["Key"]
-            filename = key.split("/")[-1]
-
-            match = re.search(r"\d{4}-\d{2}-\d{2}", filename)
-            if match:
-                file_date = datetime.strptime(match.group(), "%Y-%m-%d")
-                if file_date.weekday() == 1:
-                    martes_count += 1
-                file_dates.append((file_date, key))
-            else:
-                log_message(f"Archivo ignorado (sin fecha reconocida): {filename}")
-
-        log_message(f"Total de archivos con fecha valida: {len(file_dates)}")
-        log_message(f"Archivos de martes encontrados: {martes_count}")
-
-        file_dates = sorted(file_dates, reverse=True)
-
-        files_to_use = []
-
-        martes_files = [(date, key) for date, key in file_dates if date.weekday() == 1]
-
-        if len(martes_files) >= 6:
-            log_message("Usando 6 archivos de martes")
-            files_to_use = martes_files[:6]
-        else:
-            log_message(f"Solo hay {len(martes_files)} archivos de martes, usando los ultimos 6 archivos disponibles")
-            files_to_use = file_dates[:6]
-
-        if len(files_to_use) < 4:
-            log_message(f"No hay suficientes archivos historicos: {len(files_to_use)}", "ERROR")
+        if historicos is None:
+            historicos = cargar_historicos_permanencia(s3_client, bucket_name, competitors_prefix)
+        if historicos is None:
             return None
 
-        files_to_use = files_to_use[:6]
-
-        log_message(f"Archivos historicos a usar ({len(files_to_use)}):")
-        for date, key in files_to_use:
-            log_message(f" - {date.date()} ({date.strftime('%A')}) - {key}")
-
-        for i, (file_date, key) in enumerate(files_to_use[:3]):
-            try:
-                log_message(f"Leyendo archivo historico [{i+1}/3]: {key}")
-
-                df = read_csv_safe(s3_client, bucket_name, key)
-
-                if df is None or len(df) == 0:
-                    log_message(f"No se pudo leer o archivo vacio: {key}", "ERROR")
-                    continue
-
-                df.columns = [col.lower() for col in df.columns]
-
-                required_columns = [column_upc, column_price, column_codint, column_canal]
-                missing_columns = [col for col in required_columns if col not in df.columns]
+        for i, (snapshot, df) in enumerate(historicos):
+            if df is None:
+                continue
 
-                if missing_columns:
-                    log_message(f"Columnas no encontradas en {key}: {missing_columns}", "ERROR")
-                    continue
+            df = df.rename(columns={column_price: f"N-{i + 2}"})
 
-                df = df[~df[column_canal].isin(canales_excluir)]
-
-                df[column_codint] = df[column_codint].astype(str)
-                df[column_upc] = df[column_upc].astype(str)
-                df[column_canal] = df[column_canal].astype(str)
-                df[column_codint] = df[column_codint].str.replace(r"\.0$", "", regex=True)
-
-                df[column_price] = pd.to_numeric(df[column_price], errors='coerce')
-
-                df["UPC_llave_cod_interno"] = df[column_upc] + "-" + df[column_codint] + "-" + df[column_canal]
-
-                df = df.groupby(["UPC_llave_cod_interno", column_upc], as_index=False).agg({column_price: 'mean'})
-
-                semana = 42 - i
-                df = df.rename(columns={column_price: f"S{semana}"})
-
-                dfs.append(df)
-                log_message(f"Archivo historico {i+1} procesado: {len(df)} filas")
-
-            except Exception as e:
-                log_message(f"Error procesando archivo historico {key}:", "ERROR")
-                log_message(traceback.format_exc(), "ERROR")
+            dfs.append(df)
+            log_message(f"Archivo historico {i+1} procesado: {len(df)} filas")
 
         if len(dfs) < 2:
             log_message(f"Insuficientes dataframes procesados: {len(dfs)}", "ERROR")
@@ -325,120 +500,17 @@ def procesar_permanencia(s3_client, consolidado_actual, bucket_name, competitors
             df_final = pd.merge(df_final, df, on=["UPC_llave_cod_interno", column_upc], how="outer")
             log_message(f"Tamano despues de unir: {len(df_final)} filas")
 
-        rename_dict = {"S43": "N-1"}
-        if "S42" in df_final.columns:
-            rename_dict["S42"] = "N-2"
-        if "S41" in df_final.columns:
-            rename_dict["S41"] = "N-3"
-        if "S40" in df_final.columns:
-            rename_dict["S40"] = "N-4"
-
-        df_final.rename(columns=rename_dict, inplace=True)
-
-        for col in ["N-1", "N-2", "N-3", "N-4"]:
+        for col in price_scenarios.window_columns(PERMANENCIA_VENTANA)[::-1]:
             if col not in df_final.columns:
                 df_final[col] = None
 
         log_message("Aplicando escenarios...")
-
-        def procesar_fila(row):
-            precios = [row.get("N-4", None), row.get("N-3", None), row.get("N-2", None), row.get("N-1", None)]
-
-            try:
-                promedio = round(mean([p for p in precios if not pd.isna(p)]), 2)
-            except:
-                promedio = None
-
-            try:
-                mediana = round(median([p for p in precios if not pd.isna(p)]), 2)
-            except:
-                mediana = None
-
-            try:
-                moda = round(mode([p for p in precios if not pd.isna(p)]), 2)
-            except StatisticsError:
-                moda = "Sin moda"
-            except:
-                moda = None
-
-            p40, p41, p42, p43 = precios
-            precios_validos = [p for p in precios if not pd.isna(p)]
-
-            escenario = "Sin datos suficientes"
-            sugerido = "Datos incompletos"
-
-            if len(precios_validos) < 2:
-                return pd.Series([promedio, mediana, moda, sugerido, escenario])
-
-            semanas_disponibles = []
-            if not pd.isna(p40):
-                semanas_disponibles.append(('S40', p40))
-            if not pd.isna(p41):
-                semanas_disponibles.append(('S41', p41))
-            if not pd.isna(p42):
-                semanas_disponibles.append(('S42', p42))
-            if not pd.isna(p43):
-                semanas_disponibles.append(('S43', p43))
-
-            num_semanas = len(semanas_disponibles)
-
-            if num_semanas == 2:
-                if semanas_disponibles[0][1] == semanas_disponibles[1][1]:
-                    escenario = "Escenario 1"
-                    sugerido = semanas_disponibles[1][1]
-                else:
-                    escenario = "Escenario 2"
-                    sugerido = semanas_disponibles[1][1]
-
-            elif num_semanas == 3:
-                precio_repetido = None
-
-                if semanas_disponibles[0][1] == semanas_disponibles[1][1]:
-                    precio_repetido = semanas_disponibles[0][1]
-                elif semanas_disponibles[1][1] == semanas_disponibles[2][1]:
-                    precio_repetido = semanas_disponibles[1][1]
-
-                if precio_repetido is not None:
-                    escenario = "Escenario 3"
-                    sugerido = precio_repetido
-                else:
-                    escenario = "Escenario 5"
-                    sugerido = "No hay recomendacion por cambio de precio cada semana"
-
-            elif num_semanas == 4:
-                from collections import Counter
-                contador_precios = Counter([precio for _, precio in semanas_disponibles])
-
-                precios_repetidos_2_veces = [precio for precio, count in contador_precios.items() if count == 2]
-
-                if len(precios_repetidos_2_veces) == 1:
-                    escenario = "Escenario 4"
-                    sugerido = precios_repetidos_2_veces[0]
-                elif len(set(precios_validos)) == 4:
-                    escenario = "Escenario 5"
-                    sugerido = "No hay recomendacion por cambio de precio cada semana"
-                else:
-                    precio_mas_frecuente = contador_precios.most_common(1)[0][0]
-                    if contador_precios[precio_mas_frecuente] >= 2:
-                        escenario = "Escenario 4"
-                        sugerido = precio_mas_frecuente
-                    else:
-                        escenario = "Escenario 5"
-                        sugerido = "No aplica"
-
-            else:
-                escenario = "Escenario 5"
-                sugerido = "Datos exceden escenarios definidos"
-
-            return pd.Series([promedio, mediana, moda, sugerido, escenario])
-
-        df_final[["Precio Promedio", "Precio Mediana", "Precio Moda", "Precio recomendado", "Escenario aplicado"]] = df_final.apply(procesar_fila, axis=1)
+        df_final = price_scenarios.apply_scenarios(df_final, PERMANENCIA_VENTANA)
         log_message("Escenarios aplicados correctamente")
 
         log_message("Cruzando con datos de cliente...")
 
-        response_client = s3_client.list_objects_v2(Bucket=bucket_name, Prefix=client_prefix)
-        client_files = response_client.get("Contents", [])
+        client_files = snapshot_catalog.list_all_objects(s3_client, bucket_name, client_prefix)
 
         if not client_files:
             log_message("No se encontraron archivos en el folder client.", "WARN")
@@ -520,343 +592,472 @@ def procesar_permanencia(s3_client, consolidado_actual, bucket_name, competitors
 
 
 # ============================================================================
-# INICIO DEL PROCESO ETL
+# ETAPAS DEL PROCESO ETL
 # ============================================================================
+# Cada etapa declara sus entradas en construir_grafo(); las descargas
+# independientes (Athena, homologacion, match/client, historicos de last
+# price y de permanencia) corren en paralelo.
+
+# Hilos del executor de etapas (1 = secuencial)
+YZA_STAGE_WORKERS = int(os.getenv('YZA_STAGE_WORKERS', 4))
 
-log_message("==== INICIANDO PROCESO ETL PARA YZA ====")
 
 # 1. Cargar datos desde Athena
-log_message("Cargando datos desde Athena...")
-df = functions_db.load_raw_data_from_athena(
-    LST_CHANNELS,
-    LST_STORE_IDS,
-    TARGET_DATE,
-    SESSION_ATHENA
-)
-log_message(f"Datos cargados desde Athena: {len(df)} filas")
-
-# 2. Limpiar datos con SKU y final price
-df = df.dropna(subset=['sku', 'final price'])
-df['upc'] = df['upc'].fillna("unknown")
-log_message(f"Despues de limpiar nulos en sku/final price: {len(df)} filas")
-
-# 3. Procesar fechas
-df['date'] = df['date'].str.replace('/', '-')
-df['date'] = df['date'].apply(homogenize_date_format)
-df = df.rename(columns={'date': 'date_original'})
-
-df['date_original'] = pd.to_datetime(df['date_original'])
-df = df[df['date_original'] <= pd.to_datetime(strToday)]
-log_message(f"Filtrado por fecha limite ({strToday}): {len(df)} filas")
-
-df = df[df.groupby('store id')['date_original'].transform('max') == df['date_original']]
-log_message(f"Filtrado por fecha maxima por store: {len(df)} filas")
-
-# 4. Limpiar UPC
-df['upc'] = df['upc'].mask(df['upc'].eq("unknown"), df['sku'])
-df['upc'] = df['upc'].fillna(df['sku'])
-df = df[df['upc'] != "0"].reset_index(drop=True)
-
-# 5. Limpiar precios
-for var_price in COMPETITORS_FLOAT_COLUMNS:
-    if var_price in df.columns:
-        df[var_price] = df[var_price].astype(str).str.replace(r'\$|,|\[|\]| ', '', regex=True)
-
-# 6. Filtrar filas con SKU vacio
-df = df[df['sku'].notna()].reset_index(drop=True)
-df = df[df['sku'] != ''].reset_index(drop=True)
-
-# 7. Homologacion de UPCs
-log_message("Iniciando homologacion de UPCs...")
-
-df['upc'] = df['upc'].str.lstrip('0')
-df['upc_anterior'] = df['upc']
-
-response_homologation = SESSION_S3.list_objects_v2(
-    Bucket=STR_BUCKET_NAME,
-    Prefix=STR_PREFIX_UPC_HOMOLOGATION
-)
-
-homologation_keys = [
-    obj['Key'] for obj in response_homologation.get('Contents', [])
-    if 'yza_upc_homologation.csv' in obj['Key']
-]
-
-if homologation_keys:
-    obj_homologation = SESSION_S3.get_object(
-        Bucket=STR_BUCKET_NAME,
-        Key=homologation_keys[0]
+def etapa_datos_athena():
+    log_message("Cargando datos desde Athena...")
+    df = functions_db.load_raw_data_from_athena(
+        LST_CHANNELS,
+        LST_STORE_IDS,
+        TARGET_DATE,
+        aws_session.get_session()
     )
-    df_upc_homologation = pd.read_csv(
-        StringIO(obj_homologation['Body'].read().decode('latin-1')),
-        dtype=str
+    log_message(f"Datos cargados desde Athena: {len(df)} filas")
+    return df
+
+
+def etapa_limpieza(df):
+    # 2. Limpiar datos con SKU y final price
+    df = df.dropna(subset=['sku', 'final price'])
+    df['upc'] = df['upc'].fillna("unknown")
+    log_message(f"Despues de limpiar nulos en sku/final price: {len(df)} filas")
+
+    # 3. Procesar fechas
+    df['date'] = df['date'].str.replace('/', '-')
+    df['date'] = df['date'].apply(homogenize_date_format)
+    df = df.rename(columns={'date': 'date_original'})
+
+    df['date_original'] = pd.to_datetime(df['date_original'])
+    df = df[df['date_original'] <= pd.to_datetime(strToday)]
+    log_message(f"Filtrado por fecha limite ({strToday}): {len(df)} filas")
+
+    df = df[df.groupby('store id')['date_original'].transform('max') == df['date_original']]
+    log_message(f"Filtrado por fecha maxima por store: {len(df)} filas")
+
+    # 4. Limpiar UPC
+    df['upc'] = df['upc'].mask(df['upc'].eq("unknown"), df['sku'])
+    df['upc'] = df['upc'].fillna(df['sku'])
+    df = df[df['upc'] != "0"].reset_index(drop=True)
+
+    # 5. Limpiar precios
+    for var_price in COMPETITORS_FLOAT_COLUMNS:
+        if var_price in df.columns:
+            df[var_price] = df[var_price].astype(str).str.replace(r'\$|,|\[|\]| ', '', regex=True)
+
+    # 6. Filtrar filas con SKU vacio
+    df = df[df['sku'].notna() & (df['sku'] != '')].reset_index(drop=True)
+    return df
+
+
+def etapa_homologacion():
+    """Carga el indice de homologacion de UPCs (None si no hay archivo)"""
+    homologation_objects = snapshot_catalog.list_all_objects(
+        aws_session.get_s3_client(),
+        STR_BUCKET_NAME,
+        STR_PREFIX_UPC_HOMOLOGATION
     )
 
-    log_message(f"Archivo de homologacion cargado: {len(df_upc_homologation)} registros")
-
-    df_upc_homologation.columns = df_upc_homologation.columns.str.lower()
-    df_upc_homologation['upc_extraccion'] = df_upc_homologation['upc_extraccion'].astype(str).str.strip()
-    df_upc_homologation['upc_homologado'] = df_upc_homologation['upc_homologado'].astype(str).str.strip()
-
-    upc_cambios = dict(zip(
-        df_upc_homologation['upc_extraccion'],
-        df_upc_homologation['upc_homologado']
-    ))
-
-    df['upc'] = df['upc'].replace(upc_cambios)
-
-    upcs_cambiados = df['upc'].isin(upc_cambios.values()).sum()
-    log_message(f"Homologacion completada: {upcs_cambiados} UPCs actualizados")
-else:
-    log_message("No se encontro archivo de homologacion de UPCs", "WARN")
-
-# 8. Normalizar nombres de canales
-canales = {
-    'Farmacias del Ahorro - Online': 'Farmacias del Ahorro',
-    'Farmacias GDL - Online': 'Farmacias GDL',
-    'Farmacias San Pablo - Online': 'Farmacias San Pablo',
-    'Walmart - Tepeyac': 'Walmart',
-    'Farmacias Similares': 'Similares CDMX',
-    'Benavides - Online': 'Benavides',
-    'Soriana - MIYANA': 'Soriana'
-}
-df['canal'] = df['canal'].replace(canales)
-
-# 9. Eliminar duplicados
-df.drop_duplicates(inplace=True, subset=['date_original', 'canal', 'sku', 'upc'])
-df.reset_index(drop=True, inplace=True)
-
-# 10. Separar por canal y eliminar duplicados
-df_farmacias = df[df["canal"] == "Farmacias GDL"]
-df_otros = df[df["canal"] != "Farmacias GDL"]
-
-df_otros = df_otros.drop_duplicates(subset=["sku", "date_original", "store id"], keep="first")
-
-df = pd.concat([df_farmacias, df_otros])
-log_message(f"Despues de procesar por canal: {len(df)} filas")
-
-# 11. Cargar archivos match y client desde S3
-log_message("Cargando archivos match.csv y client.csv...")
-
-response_match = SESSION_S3.list_objects_v2(Bucket=STR_BUCKET_NAME, Prefix=STR_PREFIX_MATCH)
-match_keys = [obj['Key'] for obj in response_match.get('Contents', []) if 'match.csv' in obj['Key']]
-
-if not match_keys:
-    log_message("Faltan archivos match.csv", "ERROR")
-    raise Exception("Archivo match.csv no encontrado")
-
-response_client = SESSION_S3.list_objects_v2(Bucket=STR_BUCKET_NAME, Prefix=STR_PREFIX_CLIENT)
-client_keys = [obj['Key'] for obj in response_client.get('Contents', []) if 'client.csv' in obj['Key']]
-
-if not client_keys:
-    log_message("Faltan archivos client.csv", "ERROR")
-    raise Exception("Archivo client.csv no encontrado")
-
-obj_match = SESSION_S3.get_object(Bucket=STR_BUCKET_NAME, Key=match_keys[0])
-match_df = pd.read_csv(StringIO(obj_match['Body'].read().decode('utf-8')), dtype=str)
-match_df.columns = match_df.columns.str.lower()
-log_message(f"Archivo match cargado: {len(match_df)} filas")
-
-obj_client = SESSION_S3.get_object(Bucket=STR_BUCKET_NAME, Key=client_keys[0])
-client_df = pd.read_csv(StringIO(obj_client['Body'].read().decode('utf-8')), dtype=str)
-client_df.columns = client_df.columns.str.lower()
-log_message(f"Archivo client cargado: {len(client_df)} filas")
-
-# 12. Procesamiento especial para Farmacias Ahorro Promos
-mask = df['canal'] == 'Farmacias del Ahorro - Promos'
-if mask.sum() > 0:
-    df.loc[mask, 'subcategory'] = df.loc[mask, 'item characteristics']
-    df.loc[mask, 'sales flag'] = df.loc[mask, 'store address']
-    df.loc[mask, 'upc wm'] = df.loc[mask, 'stock']
-    log_message("Procesamiento especial para Farmacias del Ahorro - Promos realizado")
-
-# 13. Procesamiento especial para Benavides Plan de Lealtad
-mask_benavides = df['canal'] == 'Benavides - Plan de Lealtad'
-if mask_benavides.sum() > 0:
-    df.loc[mask_benavides, 'subcategory'] = df.loc[mask_benavides, 'item characteristics']
-    df.loc[mask_benavides, 'sales flag'] = df.loc[mask_benavides, 'store address']
-    df.loc[mask_benavides, 'upc wm'] = df.loc[mask_benavides, 'stock']
-    log_message("Procesamiento especial para Benavides - Plan de Lealtad realizado")
-
-# 14. Limpiar columnas antes del merge
-df["upc wm"] = df["upc wm"].astype(str).str.strip()
-df["canal"] = df["canal"].astype(str).str.strip()
-match_df["upcwm_competitor"] = match_df["upcwm_competitor"].astype(str).str.strip()
-match_df["competitor"] = match_df["competitor"].astype(str).str.strip()
-client_df["ean wm"] = client_df["ean wm"].astype(str).str.strip()
-client_df["ean"] = client_df["ean"].astype(str).str.strip()
-
-# 15. Aplicar funciones marca_propia y actualizar_upc_y_codigo
-log_message("Aplicando funciones marca_propia y actualizar_upc_y_codigo...")
-output_df = marca_propia(df, match_df)
-output_df = actualizar_upc_y_codigo(output_df, client_df)
-log_message(f"DataFrame de salida: {len(output_df)} filas")
-
-# 16. Renombrar columnas
-output_df = output_df.rename(columns={'upc wm': 'upc llave', 'date_original': 'date'})
-output_df['date'] = strToday
-
-# 17. Aplicar recalculo de UPC llave
-output_df['upc llave'] = output_df.apply(
-    lambda row: row['upc llave'] if row['canal'] in ['Farmacias del Ahorro - Promos', 'Benavides - Plan de Lealtad']
-    else create_upc_wm(row['upc'], row['canal']),
-    axis=1
-)
-
-# 17.5 LOGICA MOUNJARO
-log_message("Aplicando logica Mounjaro...")
-upcs_mounjaro = [
-    "7501082243741",
-    "7501082243727",
-    "7501082243710",
-    "7501082243734",
-    "7501082243642",
-    "7501082243635"
-]
-
-mask_upc = output_df["upc"].astype(str).isin(upcs_mounjaro)
-
-output_df["price_numeric"] = pd.to_numeric(output_df["price"], errors='coerce')
-
-map_desc_benavides = {
-    "5.13% de desc": 94.90180,
-    "20.2% de desc": 79.87270,
-    "40.3% de desc": 59.74536,
-    "20.48% de desc": 79.60690,
-    "19.25% de desc": 80.78000,
-    "38.44% de desc": 61.55915,
-}
-
-mask_benavides = (
-    mask_upc &
-    (output_df["canal"] == "Benavides") &
-    output_df["sales flag"].isin(map_desc_benavides)
-)
-
-output_df.loc[mask_benavides, "descuento"] = output_df.loc[mask_benavides, "sales flag"].map(map_desc_benavides)
-
-map_desc_ahorro = {
-    "https://www.fahorro.com/media/cataloglabel/7501082243741.png": 94.90180,
-    "https://www.fahorro.com/media/cataloglabel/7501082243727.png": 79.87270,
-    "https://www.fahorro.com/media/cataloglabel/7501082243710.png": 59.74536,
-    "https://www.fahorro.com/media/cataloglabel/7501082243734.png": 79.60690,
-    "https://www.fahorro.com/media/cataloglabel/7501082243642.png": 80.78000,
-    "https://www.fahorro.com/media/cataloglabel/7501082243635.png": 61.55915,
-}
-
-mask_ahorro = (
-    mask_upc &
-    (output_df["canal"] == "Farmacias del Ahorro") &
-    output_df["sales flag"].isin(map_desc_ahorro)
-)
-
-output_df.loc[mask_ahorro, "descuento"] = output_df.loc[mask_ahorro, "sales flag"].map(map_desc_ahorro)
-
-output_df["descuento"] = pd.to_numeric(output_df["descuento"], errors='coerce').fillna(0)
-
-mask_apply = mask_benavides | mask_ahorro
-
-output_df.loc[mask_apply, "sale price"] = (
-    output_df.loc[mask_apply, "price_numeric"] * (output_df.loc[mask_apply, "descuento"] / 100)
-).round(2)
-
-output_df.loc[mask_apply, "final price"] = output_df.loc[mask_apply, "sale price"]
-
-output_df.loc[mask_apply, "sale price"] = output_df.loc[mask_apply, "sale price"].astype(str)
-output_df.loc[mask_apply, "final price"] = output_df.loc[mask_apply, "final price"].astype(str)
-
-output_df.drop(columns=["price_numeric", "descuento"], inplace=True)
-
-log_message(f"Logica Mounjaro aplicada: {mask_apply.sum()} registros afectados")
-# FIN LOGICA MOUNJARO
+    homologation_objects = [
+        obj for obj in homologation_objects
+        if 'yza_upc_homologation.csv' in obj['Key']
+    ]
+
+    if not homologation_objects:
+        return None
+
+    homologation_key = homologation_objects[0]['Key']
+    homologation_index, from_cache = upc_homologation.load_index(
+        aws_session.get_s3_client(),
+        STR_BUCKET_NAME,
+        homologation_key,
+        etag=homologation_objects[0].get('ETag'),
+        encoding='latin-1'
+    )
+
+    origen = "cache local" if from_cache else homologation_key
+    log_message(f"Homologacion cargada desde {origen}: {len(homologation_index)} UPCs")
+    if homologation_index.cyclic:
+        log_message(
+            f"UPCs en ciclos de homologacion (no se homologan): {len(homologation_index.cyclic)} "
+            f"- {homologation_index.cyclic[:10]}",
+            "WARN"
+        )
+    return homologation_index
+
+
+# 11. Cargar archivos match y client desde S3 (maestro de productos)
+def etapa_maestro():
+    log_message("Cargando archivos match.csv y client.csv...")
+
+    match_objects = snapshot_catalog.list_all_objects(aws_session.get_s3_client(), STR_BUCKET_NAME, STR_PREFIX_MATCH)
+    match_objects = [obj for obj in match_objects if 'match.csv' in obj['Key']]
+
+    if not match_objects:
+        log_message("Faltan archivos match.csv", "ERROR")
+        raise Exception("Archivo match.csv no encontrado")
+
+    client_objects = snapshot_catalog.list_all_objects(aws_session.get_s3_client(), STR_BUCKET_NAME, STR_PREFIX_CLIENT)
+    client_objects = [obj for obj in client_objects if 'client.csv' in obj['Key']]
+
+    if not client_objects:
+        log_message("Faltan archivos client.csv", "ERROR")
+        raise Exception("Archivo client.csv no encontrado")
+
+    maestro_df, ean_index, from_cache = cargar_maestro_productos(
+        aws_session.get_s3_client(),
+        STR_BUCKET_NAME,
+        match_objects[0],
+        client_objects[0]
+    )
+    origen = "cache local" if from_cache else "match.csv + client.csv"
+    log_message(f"Maestro de productos ({origen}): {len(maestro_df)} llaves, {len(ean_index)} ean wm")
+    return maestro_df, ean_index
+
+
+def etapa_llaves():
+    """Codificador de la llave (canal, sku, upc) compartido por la corrida"""
+    return key_encoding.KeyEncoder(PRODUCT_KEY_COLUMNS)
+
+
+def etapa_historial_last_price():
+    """Snapshot mas reciente de competidores para last_price"""
+    return functions_db.load_last_price_history(
+        aws_session.get_s3_client(),
+        STR_BUCKET_NAME,
+        STR_PREFIX_COMPETITORS,
+        merge_keys=PRODUCT_KEY_COLUMNS
+    )
+
+
+def etapa_historicos_permanencia():
+    return cargar_historicos_permanencia(aws_session.get_s3_client(), STR_BUCKET_NAME, STR_PREFIX_COMPETITORS)
+
+
+def etapa_consolidado(df, homologation_index, product_keys):
+    # 7. Homologacion de UPCs
+    log_message("Iniciando homologacion de UPCs...")
+
+    # Igual que la llave de los historicos (solo ceros a la izquierda)
+    df['upc'] = upc_utils.strip_leading_zeros(df['upc'])
+    df['upc_anterior'] = df['upc']
+
+    if homologation_index is not None:
+        df['upc'], cambios_por_canal = homologation_index.apply(df['upc'], df['canal'])
+
+        upcs_cambiados = sum(cambios_por_canal.values())
+        log_message(f"Homologacion completada: {upcs_cambiados} UPCs actualizados")
+        for canal, cambios in sorted(cambios_por_canal.items()):
+            log_message(f"  {canal}: {cambios}")
+    else:
+        log_message("No se encontro archivo de homologacion de UPCs", "WARN")
+
+    # 8. Normalizar nombres de canales
+    canales = {
+        'Farmacias del Ahorro - Online': 'Farmacias del Ahorro',
+        'Farmacias GDL - Online': 'Farmacias GDL',
+        'Farmacias San Pablo - Online': 'Farmacias San Pablo',
+        'Walmart - Tepeyac': 'Walmart',
+        'Farmacias Similares': 'Similares CDMX',
+        'Benavides - Online': 'Benavides',
+        'Soriana - MIYANA': 'Soriana'
+    }
+    df['canal'] = df['canal'].replace(canales)
+
+    # 9. Eliminar duplicados (sobre la llave entera de canal/sku/upc)
+    df = df[~key_encoding.duplicated(product_keys.encode(df), df['date_original'])]
+    df.reset_index(drop=True, inplace=True)
+
+    # 10. Separar por canal y eliminar duplicados
+    df_farmacias = df[df["canal"] == "Farmacias GDL"]
+    df_otros = df[df["canal"] != "Farmacias GDL"]
+
+    df_otros = df_otros.drop_duplicates(subset=["sku", "date_original", "store id"], keep="first")
+
+    df = pd.concat([df_farmacias, df_otros])
+    log_message(f"Despues de procesar por canal: {len(df)} filas")
+
+    # 12. Procesamiento especial para Farmacias Ahorro Promos
+    mask = df['canal'] == 'Farmacias del Ahorro - Promos'
+    if mask.sum() > 0:
+        df.loc[mask, 'subcategory'] = df.loc[mask, 'item characteristics']
+        df.loc[mask, 'sales flag'] = df.loc[mask, 'store address']
+        df.loc[mask, 'upc wm'] = df.loc[mask, 'stock']
+        log_message("Procesamiento especial para Farmacias del Ahorro - Promos realizado")
+
+    # 13. Procesamiento especial para Benavides Plan de Lealtad
+    mask_benavides = df['canal'] == 'Benavides - Plan de Lealtad'
+    if mask_benavides.sum() > 0:
+        df.loc[mask_benavides, 'subcategory'] = df.loc[mask_benavides, 'item characteristics']
+        df.loc[mask_benavides, 'sales flag'] = df.loc[mask_benavides, 'store address']
+        df.loc[mask_benavides, 'upc wm'] = df.loc[mask_benavides, 'stock']
+        log_message("Procesamiento especial para Benavides - Plan de Lealtad realizado")
+
+    # 14. Limpiar columnas antes del merge
+    df["upc wm"] = df["upc wm"].astype(str).str.strip()
+    df["canal"] = df["canal"].astype(str).str.strip()
+    return df
+
+
+def etapa_output(df, maestro):
+    maestro_df, ean_index = maestro
+
+    # 15. Aplicar funciones marca_propia y actualizar_upc_y_codigo
+    log_message("Aplicando funciones marca_propia y actualizar_upc_y_codigo...")
+    output_df = marca_propia(df, maestro_df)
+    output_df = actualizar_upc_y_codigo(output_df, None, ean_index)
+    log_message(f"DataFrame de salida: {len(output_df)} filas")
+
+    # 16. Renombrar columnas
+    output_df = output_df.rename(columns={'upc wm': 'upc llave', 'date_original': 'date'})
+    output_df['date'] = strToday
+
+    # 17. Aplicar recalculo de UPC llave
+    mask_recalculo = ~output_df['canal'].isin(['Farmacias del Ahorro - Promos', 'Benavides - Plan de Lealtad'])
+    output_df.loc[mask_recalculo, 'upc llave'] = upc_utils.upc_wm_key(
+        output_df.loc[mask_recalculo, 'upc'],
+        output_df.loc[mask_recalculo, 'canal']
+    )
+
+    # 17.5 LOGICA MOUNJARO
+    log_message("Aplicando logica Mounjaro...")
+    upcs_mounjaro = [
+        "7501082243741",
+        "7501082243727",
+        "7501082243710",
+        "7501082243734",
+        "7501082243642",
+        "7501082243635"
+    ]
+
+    mask_upc = output_df["upc"].astype(str).isin(upcs_mounjaro)
+
+    output_df["price_numeric"] = pd.to_numeric(output_df["price"], errors='coerce')
+
+    map_desc_benavides = {
+        "5.13% de desc": 94.90180,
+        "20.2% de desc": 79.87270,
+        "40.3% de desc": 59.74536,
+        "20.48% de desc": 79.60690,
+        "19.25% de desc": 80.78000,
+        "38.44% de desc": 61.55915,
+    }
+
+    mask_benavides = (
+        mask_upc &
+        (output_df["canal"] == "Benavides") &
+        output_df["sales flag"].isin(map_desc_benavides)
+    )
+
+    output_df.loc[mask_benavides, "descuento"] = output_df.loc[mask_benavides, "sales flag"].map(map_desc_benavides)
+
+    map_desc_ahorro = {
+        "https://www.fahorro.com/media/cataloglabel/7501082243741.png": 94.90180,
+        "https://www.fahorro.com/media/cataloglabel/7501082243727.png": 79.87270,
+        "https://www.fahorro.com/media/cataloglabel/7501082243710.png": 59.74536,
+        "https://www.fahorro.com/media/cataloglabel/7501082243734.png": 79.60690,
+        "https://www.fahorro.com/media/cataloglabel/7501082243642.png": 80.78000,
+        "https://www.fahorro.com/media/cataloglabel/7501082243635.png": 61.55915,
+    }
+
+    mask_ahorro = (
+        mask_upc &
+        (output_df["canal"] == "Farmacias del Ahorro") &
+        output_df["sales flag"].isin(map_desc_ahorro)
+    )
+
+    output_df.loc[mask_ahorro, "descuento"] = output_df.loc[mask_ahorro, "sales flag"].map(map_desc_ahorro)
+
+    output_df["descuento"] = pd.to_numeric(output_df["descuento"], errors='coerce').fillna(0)
+
+    mask_apply = mask_benavides | mask_ahorro
+
+    output_df.loc[mask_apply, "sale price"] = (
+        output_df.loc[mask_apply, "price_numeric"] * (output_df.loc[mask_apply, "descuento"] / 100)
+    ).round(2)
+
+    output_df.loc[mask_apply, "final price"] = output_df.loc[mask_apply, "sale price"]
+
+    output_df.loc[mask_apply, "sale price"] = output_df.loc[mask_apply, "sale price"].astype(str)
+    output_df.loc[mask_apply, "final price"] = output_df.loc[mask_apply, "final price"].astype(str)
+
+    output_df.drop(columns=["price_numeric", "descuento"], inplace=True)
+
+    log_message(f"Logica Mounjaro aplicada: {mask_apply.sum()} registros afectados")
+    # FIN LOGICA MOUNJARO
+    return output_df
+
 
 # 18. Last price - usando funcion de functions_db con merge_keys personalizadas
-log_message("Procesando last_price...")
-output_df = functions_db.get_last_price_from_s3(
-    output_df,
-    SESSION_S3,
-    STR_BUCKET_NAME,
-    STR_PREFIX_COMPETITORS,
-    merge_keys=['canal', 'sku', 'upc']  # YZA usa canal en lugar de store id
-)
-log_message("Last price procesado correctamente")
+def etapa_last_price(output_df, history, product_keys):
+    log_message("Procesando last_price...")
+    output_df = functions_db.get_last_price_from_s3(
+        output_df,
+        aws_session.get_s3_client(),
+        STR_BUCKET_NAME,
+        STR_PREFIX_COMPETITORS,
+        merge_keys=PRODUCT_KEY_COLUMNS,  # YZA usa canal en lugar de store id
+        history=history,
+        key_encoder=product_keys
+    )
+    log_message("Last price procesado correctamente")
+    return output_df
+
 
 # 19. Proceso de permanencia
-log_message("==== INICIANDO PROCESO DE PERMANENCIA DE PRECIOS ====")
+def etapa_permanencia(output_df, historicos):
+    log_message("==== INICIANDO PROCESO DE PERMANENCIA DE PRECIOS ====")
+
+    return procesar_permanencia(
+        s3_client=aws_session.get_s3_client(),
+        consolidado_actual=output_df,
+        bucket_name=STR_BUCKET_NAME,
+        competitors_prefix=STR_PREFIX_COMPETITORS,
+        client_prefix=STR_PREFIX_CLIENT,
+        historicos=historicos
+    )
+
+
+# 21. Store id por llave del consolidado (si la llave se repite se toma el
+# primer store id); asi el consolidado completo se libera despues de output
+def etapa_store_ids(df, product_keys):
+    return product_keys.encode(df), df['store id'].to_numpy(copy=True)
 
-consolidado_actual = output_df.copy()
 
-df_permanencia = procesar_permanencia(
-    s3_client=SESSION_S3,
-    consolidado_actual=consolidado_actual,
-    bucket_name=STR_BUCKET_NAME,
-    competitors_prefix=STR_PREFIX_COMPETITORS,
-    client_prefix=STR_PREFIX_CLIENT
-)
+def etapa_competidores(output_df, store_ids, product_keys):
+    # 20. Limpieza antes de guardar
+    canales_a_limpieza = ["Farmacias San Pablo", "Farmacias del Ahorro"]
+    output_df = output_df[~((output_df["canal"].isin(canales_a_limpieza)) & (output_df["final price"].isna()))]
 
-# 20. Limpieza antes de guardar
-canales_a_limpieza = ["Farmacias San Pablo", "Farmacias del Ahorro"]
-output_df = output_df[~((output_df["canal"].isin(canales_a_limpieza)) & (output_df["final price"].isna()))]
+    output_ids = product_keys.encode(output_df)
+    filas_unicas = ~key_encoding.duplicated(output_ids, output_df['price'])
+    output_df = output_df[filas_unicas]
+    output_ids = output_ids[filas_unicas]
 
-output_df.drop_duplicates(inplace=True, subset=['canal', 'sku', 'upc', 'price'])
+    # 21. Agregar columna store id al output
+    consolidado_ids, consolidado_store_ids = store_ids
+    output_df['store id'] = key_encoding.first_match(output_ids, consolidado_ids, consolidado_store_ids)
 
-# 21. Agregar columna store id al output
-output_df['store id'] = df.set_index(['canal', 'sku', 'upc'])['store id'].reindex(
-    output_df.set_index(['canal', 'sku', 'upc']).index
-).values
+    # 22. Asegurar que existan todas las columnas
+    for col in LST_ORDER_COLUMN:
+        if col not in output_df.columns:
+            output_df[col] = ""
+            log_message(f"Columna agregada: {col}", "WARN")
+    return output_df
 
-# 22. Asegurar que existan todas las columnas
-for col in LST_ORDER_COLUMN:
-    if col not in output_df.columns:
-        output_df[col] = ""
-        log_message(f"Columna agregada: {col}", "WARN")
 
 # 23. Guardar archivo de competidores en S3
-log_message("==== GUARDANDO ARCHIVO DE COMPETIDORES ====")
-
-functions_db.save_to_s3(
-    output_df,
-    STR_BUCKET_NAME,
-    STR_PREFIX_COMPETITORS.rstrip('/'),
-    FILE_NAME,
-    SESSION_S3,
-    LST_ORDER_COLUMN
-)
-log_message(f"Archivo de competidores guardado: {STR_PREFIX_COMPETITORS}{FILE_NAME}")
+def etapa_guardar_competidores(output_df):
+    log_message("==== GUARDANDO ARCHIVO DE COMPETIDORES ====")
+
+    functions_db.save_to_s3(
+        output_df,
+        STR_BUCKET_NAME,
+        STR_PREFIX_COMPETITORS.rstrip('/'),
+        FILE_NAME,
+        aws_session.get_s3_client(),
+        LST_ORDER_COLUMN
+    )
+    log_message(f"Archivo de competidores guardado: {STR_PREFIX_COMPETITORS}{FILE_NAME}")
+
 
 # 24. Guardar archivo de permanencia en S3
-if df_permanencia is not None and len(df_permanencia) > 0:
-    log_message("==== GUARDANDO ARCHIVO DE PERMANENCIA ====")
+def etapa_guardar_permanencia(df_permanencia):
+    if df_permanencia is not None and len(df_permanencia) > 0:
+        log_message("==== GUARDANDO ARCHIVO DE PERMANENCIA ====")
 
-    try:
-        permanencia_key = f"{STR_PREFIX_PERMANENCIA}{FILE_NAME_PERMANENCIA}"
+        try:
+            permanencia_key = f"{STR_PREFIX_PERMANENCIA}{FILE_NAME_PERMANENCIA}"
 
-        csv_buffer = StringIO()
-        df_permanencia.to_csv(csv_buffer, index=False)
-        csv_content = csv_buffer.getvalue()
+            s3_csv.write_csv_s3(df_permanencia, aws_session.get_s3_client(), STR_BUCKET_NAME, permanencia_key)
 
-        SESSION_S3.put_object(
-            Bucket=STR_BUCKET_NAME,
-            Key=permanencia_key,
-            Body=csv_content
+            log_message(f"Archivo de permanencia guardado: {permanencia_key}")
+        except Exception as e:
+            log_message(f"Error guardando permanencia: {str(e)}", "ERROR")
+    else:
+        log_message("No se pudo generar DataFrame de permanencia", "WARN")
+
+
+def construir_grafo():
+    """Grafo de etapas del ETL de Yza"""
+    grafo = stage_graph.StageGraph('yza_etl', log=log_message)
+
+    # Descargas independientes
+    grafo.add('datos_athena', etapa_datos_athena)
+    grafo.add('homologacion', etapa_homologacion)
+    grafo.add('maestro', etapa_maestro)
+    grafo.add('historial_last_price', etapa_historial_last_price)
+    grafo.add('historicos_permanencia', etapa_historicos_permanencia)
+    grafo.add('llaves', etapa_llaves)
+
+    # Transformaciones
+    grafo.add('limpieza', etapa_limpieza, inputs=['datos_athena'])
+    grafo.add(
+        'consolidado',
+        etapa_consolidado,
+        inputs=['limpieza', 'homologacion', 'llaves'],
+        mutates=['limpieza']
+    )
+    grafo.add('output', etapa_output, inputs=['consolidado', 'maestro'])
+    grafo.add('store_ids', etapa_store_ids, inputs=['consolidado', 'llaves'])
+    grafo.add(
+        'last_price',
+        etapa_last_price,
+        inputs=['output', 'historial_last_price', 'llaves'],
+        mutates=['output']
+    )
+    grafo.add('permanencia', etapa_permanencia, inputs=['last_price', 'historicos_permanencia'])
+    grafo.add('competidores', etapa_competidores, inputs=['last_price', 'store_ids', 'llaves'])
+
+    # Guardado: el archivo nuevo se sube hasta que ya se leyeron los
+    # historicos (si no, el catalogo podria tomarlo como semana anterior)
+    grafo.add(
+        'guardar_competidores',
+        etapa_guardar_competidores,
+        inputs=['competidores'],
+        after=['historial_last_price', 'historicos_permanencia']
+    )
+    grafo.add('guardar_permanencia', etapa_guardar_permanencia, inputs=['permanencia'])
+    return grafo
+
+
+def main():
+    log_message("==== INICIANDO PROCESO ETL PARA YZA ====")
+
+    # Copy-on-write: las etapas comparten columnas en lugar de copiarlas
+    memory_usage.enable_copy_on_write()
+
+    # Traza de la corrida (un span por etapa) junto a los logs de yza
+    tracing.start_trace('yza', date=strToday, pid=os.getpid())
+    try:
+        with tracing.span('yza'):
+            grafo = construir_grafo()
+            resultados = grafo.run(max_workers=YZA_STAGE_WORKERS, keep=['competidores', 'permanencia'])
+    finally:
+        tracing.save_trace(
+            aws_session.get_s3_client(), STR_BUCKET_NAME,
+            tracing.trace_key(clients_config.logs_prefix('yza'), 'yza', strToday)
         )
+    grafo.report()
+
+    output_df = resultados['competidores']
+    df_permanencia = resultados['permanencia']
+
+    log_message("==== PROCESO COMPLETADO ====")
+    print(f"\nResumen:")
+    print(f"  - Registros procesados: {len(output_df)}")
+    print(f"  - Archivo competidores: s3://{STR_BUCKET_NAME}/{STR_PREFIX_COMPETITORS}{FILE_NAME}")
+    if df_permanencia is not None:
+        print(f"  - Archivo permanencia: s3://{STR_BUCKET_NAME}/{STR_PREFIX_PERMANENCIA}{FILE_NAME_PERMANENCIA}")
+
+    # 25. Verificar cambios de precio en Mounjaro y enviar notificacion
+    log_message("==== VERIFICANDO CAMBIOS DE PRECIO MOUNJARO ====")
+    # Se importa hasta aqui: vive en Data Engineer/ y solo lo usa este paso
+    import price_change_notifier
+    price_change_notifier.run_price_check(df=output_df, send_always=True)
+
+    log_message("==== PROCESO FINALIZADO ====")
+    print("\nProceso terminado")
+    return output_df
 
-        log_message(f"Archivo de permanencia guardado: {permanencia_key}")
-    except Exception as e:
-        log_message(f"Error guardando permanencia: {str(e)}", "ERROR")
-else:
-    log_message("No se pudo generar DataFrame de permanencia", "WARN")
-
-log_message("==== PROCESO COMPLETADO ====")
-print(f"\nResumen:")
-print(f"  - Registros procesados: {len(output_df)}")
-print(f"  - Archivo competidores: s3://{STR_BUCKET_NAME}/{STR_PREFIX_COMPETITORS}{FILE_NAME}")
-if df_permanencia is not None:
-    print(f"  - Archivo permanencia: s3://{STR_BUCKET_NAME}/{STR_PREFIX_PERMANENCIA}{FILE_NAME_PERMANENCIA}")
-
-# 25. Verificar cambios de precio en Mounjaro y enviar notificacion
-log_message("==== VERIFICANDO CAMBIOS DE PRECIO MOUNJARO ====")
-price_change_notifier.run_price_check(df=output_df, send_always=True)
-
-log_message("==== PROCESO FINALIZADO ====")
-print("\nProceso terminado")
+
+if __name__ == "__main__":
+    main()